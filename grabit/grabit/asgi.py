@@ -9,15 +9,18 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-import listings.routing
-import chat.routing  # ✅ Import chat WebSocket routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'grabit.settings')
+# ✅ Set up the app registry before importing consumers (they may import models)
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+import listings.routing  # noqa: E402
+import chat.routing  # noqa: E402  ✅ Import chat WebSocket routing
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             listings.routing.websocket_urlpatterns +  # ✅ Include listings WebSocket routes
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -136,6 +137,26 @@ LOGOUT_REDIRECT_URL = '/accounts/login/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Shared by all processes on this host: the page cache versions
+# (listings/page_cache.py) must be the same everywhere. Use Redis or
+# Memcached when running on several hosts. Kept outside the source tree.
+CACHE_DIR = os.environ.get('GRABIT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'grabit-cache'))
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(CACHE_DIR, 'default'),
+        "OPTIONS": {"MAX_ENTRIES": 10000, "CULL_FREQUENCY": 4},
+    },
+    # Pages, fragments and their version keys, so they don't evict (or get
+    # culled along with) image variant URLs and predictions
+    "pages": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(CACHE_DIR, 'pages'),
+        "OPTIONS": {"MAX_ENTRIES": 50000, "CULL_FREQUENCY": 4},
+    },
+}
+PAGE_CACHE_ALIAS = "pages"
+
 ASGI_APPLICATION = "grabit.asgi.application"
 
 CHANNEL_LAYERS = {
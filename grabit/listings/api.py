@@ -0,0 +1,123 @@
+"""
+Read-only JSON API for listing search, detail and bulk export.
+
+Responses carry an ETag (and Last-Modified for a single listing) so clients
+can poll with If-None-Match / If-Modified-Since and get a 304 without the
+server serializing anything:
+
+- detail: the listing's updated_at, read with one primary-key lookup
+- search/export: the page cache version of all listings (and of bookings,
+  when filtering by free dates; see page_cache.py) plus the query string, no database access at all for a 304
+"""
+import hashlib
+import json
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import condition, require_safe
+
+from .models import Property, Vehicle
+from .pagination import keyset_page, page_size_from
+from .page_cache import versions
+from .filters import filtered_listings, listing_scopes
+
+MODELS = {'vehicle': Vehicle, 'property': Property}
+COMMON_FIELDS = [
+    'id', 'title', 'description', 'location', 'latitude', 'longitude', 'image',
+    'is_available', 'created_at', 'updated_at',
+]
+FIELDS = {
+    'vehicle': COMMON_FIELDS + ['brand', 'model', 'year', 'price_per_day'],
+    'property': COMMON_FIELDS + [
+        'address', 'price', 'property_type', 'bedrooms', 'bathrooms', 'size', 'predicted_rent', 'is_best_deal',
+    ],
+}
+EXPORT_CHUNK_SIZE = 2000
+COMPACT = {'separators': (',', ':')}
+
+
+def serialize(listing_type, row):
+    """A values() row as the API's JSON object."""
+    row['type'] = listing_type
+    if 'price_per_day' in row:
+        row['price'] = row.pop('price_per_day')
+    row['image'] = default_storage.url(row['image']) if row['image'] else None
+    return row
+
+
+def _listing_version(request, listing_type, listing_id):
+    # Memoized so the ETag and Last-Modified callbacks share one query
+    if not hasattr(request, '_listing_version'):
+        model = MODELS.get(listing_type)
+        request._listing_version = (
+            model.objects.filter(id=listing_id).values_list('updated_at', flat=True).first() if model else None
+        )
+    return request._listing_version
+
+
+def _detail_etag(request, listing_type, listing_id):
+    updated_at = _listing_version(request, listing_type, listing_id)
+    return f'{listing_type}-{listing_id}-{updated_at.timestamp():.6f}' if updated_at else None
+
+
+def _detail_last_modified(request, listing_type, listing_id):
+    return _listing_version(request, listing_type, listing_id)
+
+
+def _collection_etag(request, *args, **kwargs):
+    query = sorted((name, value) for name, values in request.GET.lists() for value in values)
+    digest = hashlib.sha1(repr((request.path, query)).encode()).hexdigest()[:16]
+    return f'{versions(*listing_scopes(request))}-{digest}'
+
+
+def _category_queryset(request):
+    vehicles, properties, vehicle_ordering, property_ordering, filters = filtered_listings(request)
+    category = filters['category']
+    if category == 'vehicle':
+        return category, vehicles, vehicle_ordering
+    if category == 'property':
+        return category, properties, property_ordering
+    return None, None, None
+
+
+@require_safe
+@condition(etag_func=_collection_etag)
+def api_listings(request):
+    """?category=vehicle|property plus the listings page filters; keyset-paginated with ?cursor=."""
+    category, queryset, ordering = _category_queryset(request)
+    if category is None:
+        return JsonResponse({'error': 'Invalid listing type'}, status=400)
+
+    rows, next_cursor = keyset_page(queryset, ordering, request.GET.get('cursor'), page_size_from(request))
+    fields = FIELDS[category]
+    results = [
+        serialize(category, {field: row.image.name if field == 'image' else getattr(row, field) for field in fields})
+        for row in rows
+    ]
+    return JsonResponse({'results': results, 'next_cursor': next_cursor}, json_dumps_params=COMPACT)
+
+
+@require_safe
+@condition(etag_func=_detail_etag, last_modified_func=_detail_last_modified)
+def api_listing_detail(request, listing_type, listing_id):
+    model = MODELS.get(listing_type)
+    row = model.objects.filter(id=listing_id).values(*FIELDS[listing_type]).first() if model else None
+    if row is None:
+        raise Http404("Listing not found")
+    return JsonResponse(serialize(listing_type, row), json_dumps_params=COMPACT)
+
+
+@require_safe
+@condition(etag_func=_collection_etag)
+def api_export(request):
+    """Every listing matching the filters as streamed NDJSON, one object per line."""
+    category, queryset, _ = _category_queryset(request)
+    if category is None:
+        return JsonResponse({'error': 'Invalid listing type'}, status=400)
+
+    rows = queryset.order_by('id').values(*FIELDS[category]).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    lines = (json.dumps(serialize(category, row), cls=DjangoJSONEncoder, **COMPACT) + '\n' for row in rows)
+    response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{category}-listings.ndjson"'
+    return response
@@ -1,6 +1,23 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core import checks
+from django.db.models.signals import post_migrate
 
 
 class ListingsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'listings'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (connects the ListingIndex receivers)
+        from .page_cache import check_shared_cache
+        from .search import restore_sqlite_search
+
+        checks.register(check_shared_cache, checks.Tags.caches)
+        post_migrate.connect(restore_sqlite_search, sender=self)
+
+        # Opt-in: load the rent model at startup, e.g. in the master before
+        # gunicorn --preload forks workers, so they share it and start warm
+        if getattr(settings, 'RENT_MODEL_PRELOAD', False):
+            from .ml_utils import warm_up
+            warm_up()
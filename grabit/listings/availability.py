@@ -0,0 +1,100 @@
+"""
+Booked date ranges of a listing, for the booking date picker, and the
+"free between these dates" filter for listing search.
+
+``booked_ranges`` answers a whole month window with one query on the
+booking_<type>_avail_idx indexes. Overlapping and back-to-back confirmed
+bookings are merged into ranges. The result is cached under the listing's
+page cache version, which the Booking signals bump. A new, changed or
+canceled booking therefore shows up on the next request.
+
+``available_between`` filters a whole listing queryset with one NOT EXISTS
+anti-join against the confirmed bookings. Each listing costs a single index
+probe, whatever the size of the bookings table. On PostgreSQL the probe
+uses the GiST indexes of the exclusion constraints from migration 0015.
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.core.cache import caches
+from django.db import connections
+from django.db.models import BooleanField, Exists, OuterRef
+from django.db.models.expressions import RawSQL
+
+from .models import Booking
+from .page_cache import PAGE_CACHE_ALIAS, PAGE_CACHE_TIMEOUT, listing_scope, versions
+
+LISTING_FIELDS = {'vehicle': 'vehicle_id', 'property': 'property_id'}
+MAX_MONTHS = 12
+
+
+def month_window(year, month, months=1):
+    """(first day, last day) of ``months`` calendar months starting at year-month."""
+    start = date(year, month, 1)
+    end_month_index = year * 12 + month - 1 + months - 1
+    end_year, end_month = divmod(end_month_index, 12)
+    end_month += 1
+    return start, date(end_year, end_month, calendar.monthrange(end_year, end_month)[1])
+
+
+def merge_ranges(ranges):
+    """Merge sorted inclusive (start, end) date ranges that overlap or touch."""
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def confirmed_bookings(listing_type, listing_id, start, end):
+    """Confirmed bookings of the listing overlapping [start, end]."""
+    return Booking.objects.filter(
+        **{LISTING_FIELDS[listing_type]: listing_id},
+        status='confirmed',
+        start_date__lte=end,
+        end_date__gte=start,
+    )
+
+
+def booked_ranges(listing_type, listing_id, start, end):
+    """Merged confirmed booking ranges overlapping [start, end], clipped to it."""
+    cache = caches[PAGE_CACHE_ALIAS]
+    key = (
+        f'availability:{listing_type}:{listing_id}:{start.isoformat()}:{end.isoformat()}:'
+        f'{versions(listing_scope(listing_type, listing_id))}'
+    )
+    ranges = cache.get(key)
+    if ranges is None:
+        rows = (
+            confirmed_bookings(listing_type, listing_id, start, end)
+            .order_by('start_date')
+            .values_list('start_date', 'end_date')
+        )
+        ranges = [(max(s, start), min(e, end)) for s, e in merge_ranges(rows)]
+        cache.set(key, ranges, PAGE_CACHE_TIMEOUT)
+    return ranges
+
+
+def is_range_free(listing_type, listing_id, start, end, exclude=None):
+    """No confirmed booking (other than the booking with pk ``exclude``) overlaps [start, end]."""
+    bookings = confirmed_bookings(listing_type, listing_id, start, end)
+    if exclude is not None:
+        bookings = bookings.exclude(pk=exclude)
+    return not bookings.exists()
+
+
+def available_between(queryset, listing_type, start, end):
+    """``queryset`` without the listings that have a confirmed booking overlapping [start, end]."""
+    booked = Booking.objects.filter(**{LISTING_FIELDS[listing_type]: OuterRef('pk')}, status='confirmed')
+    if connections[queryset.db].vendor == 'postgresql':
+        overlaps = RawSQL(
+            "daterange(start_date, end_date, '[]') && daterange(%s, %s, '[]')", (start, end),
+            output_field=BooleanField(),
+        )
+        booked = booked.filter(overlaps)
+    else:
+        booked = booked.filter(start_date__lte=end, end_date__gte=start)
+    return queryset.filter(~Exists(booked))
@@ -0,0 +1,246 @@
+"""
+Booking creation and confirmation that can't double-book a listing.
+
+Two confirmed bookings of one listing may never overlap. Both operations
+check this inside their transaction:
+
+- PostgreSQL enforces it with the ``booking_<type>_no_overlap`` exclusion
+  constraints (migration 0015). Confirming a conflicting booking fails with
+  an IntegrityError, so concurrent requests never wait on each other.
+- Other backends serialize the bookings of one listing by locking its row:
+  SELECT ... FOR UPDATE where supported, and otherwise a no-op UPDATE. On
+  SQLite that takes the database write lock before the overlap check.
+
+``bulk_set_status`` confirms or cancels many bookings of one owner with a
+single ownership query and a single update(). A bulk confirm also declines
+the pending requests that overlap the newly confirmed bookings.
+
+Every status change queues its notifications in the same transaction
+(outbox.py): a WebSocket push of the current status to a group per user,
+which covers the renter and the owner, and to a group per listing for pages
+showing its availability (see consumers.py); and emails to the other party. Each group
+gets one message per batch of changes, so the cost of a push depends on
+the people involved, not on how many sockets are connected.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models import F, Q
+
+from . import outbox
+from .availability import LISTING_FIELDS, is_range_free
+from .groups import listing_group, user_group
+from .models import Booking, BookingStats, Property, Vehicle
+from .page_cache import BOOKINGS_SCOPE, bump, listing_scope
+
+LISTING_MODELS = {'vehicle': Vehicle, 'property': Property}
+CONFLICT_MESSAGE = "The listing is already booked on some of these dates."
+BULK_ACTIONS = {'confirm': 'confirmed', 'cancel': 'canceled'}
+
+
+class BookingConflict(ValueError):
+    """The dates overlap a confirmed booking of the same listing."""
+
+
+def booking_listing(booking):
+    """(listing type, listing id) of a booking."""
+    if booking.vehicle_id:
+        return 'vehicle', booking.vehicle_id
+    return 'property', booking.property_id
+
+
+def _connection():
+    return connections[router.db_for_write(Booking)]
+
+
+def _uses_exclusion_constraint():
+    return _connection().vendor == 'postgresql'
+
+
+def _lock(listings):
+    if _connection().features.has_select_for_update:
+        list(listings.select_for_update().order_by('pk').values_list('pk'))
+    else:
+        listings.update(id=F('id'))
+
+
+def _lock_listings(listing_type, *listing_ids):
+    """Block other bookings of the listings until the current transaction ends."""
+    _lock(LISTING_MODELS[listing_type].objects.filter(pk__in=listing_ids))
+
+
+def _check_free(listing_type, listing_id, start_date, end_date, exclude=None):
+    if not is_range_free(listing_type, listing_id, start_date, end_date, exclude=exclude):
+        raise BookingConflict(CONFLICT_MESSAGE)
+
+
+def create_booking(user, listing_type, listing, start_date, end_date, total_price):
+    """
+    A pending booking of ``listing``. Raises BookingConflict if the dates
+    overlap a confirmed booking.
+    """
+    with transaction.atomic():
+        if not _uses_exclusion_constraint():
+            _lock_listings(listing_type, listing.pk)
+        # pending bookings aren't under the constraint; a confirmation racing
+        # this check is caught when this booking itself is confirmed
+        _check_free(listing_type, listing.pk, start_date, end_date)
+        booking = Booking.objects.create(
+            user=user,
+            **{listing_type: listing},
+            start_date=start_date,
+            end_date=end_date,
+            total_price=total_price,
+            status='pending',
+        )
+        notify([booking], actor=user)
+    return booking
+
+
+def confirm_booking(booking, actor=None):
+    """Mark ``booking`` confirmed. Raises BookingConflict if its dates are taken."""
+    listing_type, listing_id = booking_listing(booking)
+    previous_status = booking.status
+    try:
+        with transaction.atomic():
+            if not _uses_exclusion_constraint():
+                _lock_listings(listing_type, listing_id)
+                _check_free(listing_type, listing_id, booking.start_date, booking.end_date, exclude=booking.pk)
+            booking.status = 'confirmed'
+            booking.save(update_fields=['status'])
+            notify([booking], actor=actor)
+    except IntegrityError as e:
+        booking.status = previous_status
+        raise BookingConflict(CONFLICT_MESSAGE) from e
+    return booking
+
+
+def cancel_booking(booking, actor=None):
+    with transaction.atomic():
+        booking.status = 'canceled'
+        booking.save(update_fields=['status'])
+        notify([booking], actor=actor)
+    return booking
+
+
+def _overlapping(bookings):
+    """Q for the bookings overlapping any of ``bookings`` on the same listing."""
+    q = Q()
+    for booking in bookings:
+        listing_type, listing_id = booking_listing(booking)
+        q |= Q(**{LISTING_FIELDS[listing_type]: listing_id}, start_date__lte=booking.end_date, end_date__gte=booking.start_date)
+    return q
+
+
+def _split_conflicts(bookings):
+    """
+    (confirmable, conflicting) among ``bookings`` (sorted by start date):
+    a booking conflicts if it overlaps a confirmed booking, or one confirmed
+    earlier in the same batch.
+    """
+    taken = defaultdict(list)
+    for booking in Booking.objects.filter(_overlapping(bookings), status='confirmed'):
+        taken[booking_listing(booking)].append((booking.start_date, booking.end_date))
+
+    confirmable, conflicting = [], []
+    for booking in bookings:
+        ranges = taken[booking_listing(booking)]
+        if any(start <= booking.end_date and end >= booking.start_date for start, end in ranges):
+            conflicting.append(booking)
+        else:
+            ranges.append((booking.start_date, booking.end_date))
+            confirmable.append(booking)
+    return confirmable, conflicting
+
+
+def bulk_set_status(owner, booking_ids, action):
+    """
+    Confirm or cancel (``action``, see BULK_ACTIONS) the bookings among
+    ``booking_ids`` that belong to ``owner``'s listings. Returns lists of
+    bookings: ``changed``, ``declined`` (pending requests overlapping newly
+    confirmed bookings, now canceled) and ``conflicts`` (left as they were,
+    their dates are taken). Ids that aren't the owner's, or already have
+    the status, are ignored. Raises BookingConflict if a concurrent
+    confirmation wins the race on PostgreSQL; nothing is changed then.
+    """
+    status = BULK_ACTIONS[action]
+    try:
+        with transaction.atomic():
+            if status == 'confirmed' and not _uses_exclusion_constraint():
+                # all of the owner's listings, before anything is read (see _lock_listings)
+                for model in LISTING_MODELS.values():
+                    _lock(model.objects.filter(owner=owner))
+            changed = list(
+                Booking.objects.filter(id__in=set(booking_ids))
+                .filter(Q(vehicle__owner=owner) | Q(property__owner=owner))
+                .exclude(status=status)
+                .select_related('vehicle', 'property')
+                .order_by('start_date', 'id')
+            )
+            conflicts, declined = [], []
+            if status == 'confirmed' and changed:
+                changed, conflicts = _split_conflicts(changed)
+            Booking.objects.filter(id__in=[booking.id for booking in changed]).update(status=status)
+            if status == 'confirmed' and changed:
+                declined = list(
+                    Booking.objects.filter(_overlapping(changed), status='pending').select_related('vehicle', 'property')
+                )
+                Booking.objects.filter(id__in=[booking.id for booking in declined]).update(status='canceled')
+                declined_ids = {booking.id for booking in declined}
+                conflicts = [booking for booking in conflicts if booking.id not in declined_ids]
+
+            # update() sends no signals: move the owners' counters here
+            for booking in changed:
+                booking.status = status
+            for booking in declined:
+                booking.status = 'canceled'
+            updated = changed + declined
+            BookingStats.apply(
+                (booking.listing_owner_id(), booking._counted, booking.counted_state()) for booking in updated
+            )
+            for booking in updated:
+                booking._counted = booking.counted_state()
+            notify(updated, actor=owner)
+    except IntegrityError as e:
+        raise BookingConflict(CONFLICT_MESSAGE) from e
+
+    if updated:
+        # ... and expire the cached pages
+        bump(BOOKINGS_SCOPE, *{listing_scope(*booking_listing(booking)) for booking in updated})
+    return {'changed': changed, 'declined': declined, 'conflicts': conflicts}
+
+
+def status_messages(bookings):
+    """
+    Channel-layer ``[group, message]`` pairs pushing the current status of
+    ``bookings`` to their renters and owners, and an availability ping to
+    their listings' watchers.
+    """
+    updates = defaultdict(list)
+    listings = defaultdict(set)
+    for booking in bookings:
+        listing_type, listing_id = booking_listing(booking)
+        update = {'booking_id': booking.id, 'status': booking.status}
+        for user_id in {booking.user_id, booking.listing_owner_id()}:
+            updates[user_group(user_id)].append(update)
+        listings[listing_group(listing_type, listing_id)].add(f'{listing_type}:{listing_id}')
+
+    messages = [[group, {'type': 'booking.updates', 'updates': batch}] for group, batch in updates.items()]
+    messages += [[group, {'type': 'listing.updates', 'listings': sorted(keys)}] for group, keys in listings.items()]
+    return messages
+
+
+def notify(bookings, actor=None):
+    """
+    Queue the push for ``bookings``' new status, and emails to the renters
+    and owners other than ``actor``, in the current transaction.
+    """
+    if not bookings:
+        return
+    outbox.push({booking.id for booking in bookings})
+    messages = []
+    for booking in bookings:
+        for recipient_id in {booking.user_id, booking.listing_owner_id()} - {getattr(actor, 'pk', None)}:
+            payload = {'booking_id': booking.id, 'status': booking.status, 'recipient_id': recipient_id}
+            messages.append(('email', payload))
+    outbox.enqueue(messages)
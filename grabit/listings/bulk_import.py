@@ -0,0 +1,301 @@
+"""
+Bulk import of listings for fleet and property-management owners.
+
+Input is a CSV file, or a ZIP holding one CSV plus the images its ``image``
+column names. Columns are the VehicleForm / PropertyForm fields and every
+row is validated with those forms' rules. Valid rows are then imported in
+chunks:
+
+1. the chunk's images are decoded and hashed in parallel in the ingestion
+   process pool;
+2. near-duplicate photos are rejected with one indexed query per chunk
+   against existing listings, and an in-memory hash index for duplicates
+   within the file;
+3. rows are inserted with ``bulk_create``, together with their ListingIndex
+   rows. bulk_create sends no signals, so this module also refreshes the
+   cached pages. If a chunk fails, the images it stored are deleted again.
+
+Every rejected row ends up in the ImportReport with its row number. The web
+form takes files of up to BULK_IMPORT_WEB_MAX_ROWS rows, imported within the
+request; larger ones (up to BULK_IMPORT_MAX_ROWS) go through ``manage.py
+import_listings``.
+"""
+import csv
+import io
+import os
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.forms import modelform_factory
+
+from . import ml_utils
+from .forms import PropertyForm, VehicleForm
+from .image_index import DUPLICATE_DISTANCE, HashIndex, set_image_hash, similar_hashes_filter
+from .image_pipeline import FORMAT_EXTENSIONS, HASH_VERSION, INGEST_WORKERS, get_pool, try_process_image
+from .image_variants import schedule_variants
+from .models import ListingIndex, Property, Vehicle
+from .page_cache import LISTINGS_SCOPE, bump
+
+IMPORT_CHUNK_SIZE = getattr(settings, 'BULK_IMPORT_CHUNK_SIZE', 500)
+MAX_ROWS = getattr(settings, 'BULK_IMPORT_MAX_ROWS', 20000)
+WEB_MAX_ROWS = getattr(settings, 'BULK_IMPORT_WEB_MAX_ROWS', 1000)
+# per image in a ZIP; the size a member declares isn't trusted
+MAX_IMAGE_BYTES = getattr(settings, 'BULK_IMPORT_MAX_IMAGE_BYTES', 10 * 1024 * 1024)
+# hashes per duplicate-lookup query; keeps the IN lists under SQLite's variable limit
+DUPLICATE_QUERY_BATCH = 100
+
+MODELS = {'vehicle': Vehicle, 'property': Property}
+FORMS = {'vehicle': VehicleForm, 'property': PropertyForm}
+
+
+class BulkImportError(ValueError):
+    """Raised when the uploaded file can't be read at all."""
+
+
+class ImportReport:
+    def __init__(self, listing_type):
+        self.listing_type = listing_type
+        self.rows = 0
+        self.created = 0
+        self.errors = []  # (row number, field, message); row 1 is the header
+        self.seconds = 0.0
+
+    def add_error(self, row, message, field=''):
+        self.errors.append((row, field, message))
+
+    @property
+    def failed_rows(self):
+        return len({row for row, _, _ in self.errors})
+
+    @property
+    def rate_per_minute(self):
+        return 60 * self.created / self.seconds if self.seconds else 0.0
+
+    def as_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['row', 'field', 'error'])
+        writer.writerows(sorted(self.errors))
+        return out.getvalue()
+
+    def summary(self):
+        return (
+            f"{self.created} of {self.rows} {self.listing_type} rows imported, "
+            f"{self.failed_rows} rejected, in {self.seconds:.1f}s ({self.rate_per_minute:.0f}/min)"
+        )
+
+
+class _Row:
+    __slots__ = ('number', 'instance', 'image_name', 'image_data')
+
+    def __init__(self, number, instance, image_name):
+        self.number = number
+        self.instance = instance
+        self.image_name = image_name
+        self.image_data = None
+
+
+def _open_source(upload):
+    """(csv text stream, zip archive or None) for a CSV or ZIP upload."""
+    upload.seek(0)
+    if zipfile.is_zipfile(upload):
+        upload.seek(0)
+        archive = zipfile.ZipFile(upload)
+        names = [
+            name for name in archive.namelist()
+            if name.lower().endswith('.csv') and not name.startswith('__MACOSX/')
+        ]
+        if len(names) != 1:
+            raise BulkImportError("The ZIP file must contain exactly one .csv file.")
+        return io.TextIOWrapper(archive.open(names[0]), encoding='utf-8-sig', newline=''), archive
+    upload.seek(0)
+    return io.TextIOWrapper(upload, encoding='utf-8-sig', newline=''), None
+
+
+def _archive_lookup(archive):
+    """{path or basename: member name} for the images in the archive."""
+    lookup = {}
+    if archive is not None:
+        for name in archive.namelist():
+            if not name.endswith('/'):
+                lookup.setdefault(name, name)
+                lookup.setdefault(os.path.basename(name), name)
+    return lookup
+
+
+def _row_form(listing_type):
+    # The form's validation rules without its image field: images are checked
+    # (decoded and hashed) in the worker pool instead
+    form_class = FORMS[listing_type]
+    fields = [field for field in form_class._meta.fields if field != 'image']
+    return modelform_factory(MODELS[listing_type], form=form_class, fields=fields)
+
+
+def _validate(reader, listing_type, owner, archive, report, max_rows):
+    form_class = _row_form(listing_type)
+    images = _archive_lookup(archive)
+    valid = []
+    for number, raw in enumerate(reader, start=2):
+        if number - 1 > max_rows:
+            raise BulkImportError(f"The file has more than {max_rows} rows.")
+        report.rows += 1
+        data = {(key or '').strip(): (value or '').strip() for key, value in raw.items()}
+        if not data.get('is_available'):
+            data['is_available'] = 'true'  # a missing checkbox means False in the form
+
+        form = form_class(data)
+        if not form.is_valid():
+            for field, messages in form.errors.items():
+                report.add_error(number, '; '.join(messages), field)
+            continue
+
+        image_name = data.get('image', '')
+        if image_name and image_name not in images:
+            report.add_error(number, f"{image_name} is not in the ZIP file.", 'image')
+            continue
+        instance = form.save(commit=False)
+        instance.owner = owner
+        valid.append(_Row(number, instance, images.get(image_name)))
+    return valid
+
+
+def _read_member(archive, name):
+    """The member's bytes, or None if it is larger than MAX_IMAGE_BYTES."""
+    if archive.getinfo(name).file_size > MAX_IMAGE_BYTES:
+        return None
+    with archive.open(name) as member:
+        data = member.read(MAX_IMAGE_BYTES + 1)
+    return data if len(data) <= MAX_IMAGE_BYTES else None
+
+
+def _process_images(rows, archive, pool):
+    """(row, process_image result or None, error) for each row, hashed in parallel."""
+    with_images, too_large = [], {}
+    for row in rows:
+        if row.image_name:
+            row.image_data = _read_member(archive, row.image_name)
+            if row.image_data is None:
+                too_large[row.number] = (None, f"{row.image_name} is larger than {MAX_IMAGE_BYTES // 2**20} MB.")
+            else:
+                with_images.append(row)
+    datas = [row.image_data for row in with_images]
+    if pool is None:
+        results = map(try_process_image, datas)
+    else:
+        results = pool.map(try_process_image, datas, chunksize=8)
+    processed = dict(zip((row.number for row in with_images), results))
+    processed.update(too_large)
+    for row in rows:
+        yield (row, *processed.get(row.number, (None, None)))
+
+
+def _existing_duplicates(model, hashes):
+    """{new hash: id of an existing listing with a near-identical image}"""
+    max_distance = DUPLICATE_DISTANCE - 1
+    found = {}
+    hashes = list(hashes)
+    for start in range(0, len(hashes), DUPLICATE_QUERY_BATCH):
+        batch = hashes[start:start + DUPLICATE_QUERY_BATCH]
+        candidates = HashIndex(max_distance)
+        query = model.objects.filter(similar_hashes_filter(batch, max_distance)).values_list('id', 'image_hash')
+        for listing_id, existing_hash in query:
+            if existing_hash:
+                candidates.add(existing_hash, listing_id)
+        for image_hash in batch:
+            listing_id = candidates.find(image_hash)
+            if listing_id is not None:
+                found[image_hash] = listing_id
+    return found
+
+
+def _import_chunk(listing_type, rows, archive, pool, seen, report):
+    model = MODELS[listing_type]
+    processed = list(_process_images(rows, archive, pool))
+    existing = _existing_duplicates(model, {result['hash'] for _, result, _ in processed if result})
+
+    accepted, stored_images = [], []
+    try:
+        for row, result, error in processed:
+            if error:
+                report.add_error(row.number, error, 'image')
+                continue
+            if result:
+                image_hash = result['hash']
+                if image_hash in existing:
+                    report.add_error(row.number, f"Duplicate image of existing listing #{existing[image_hash]}.", 'image')
+                    continue
+                duplicate_row = seen.find(image_hash)
+                if duplicate_row is not None:
+                    report.add_error(row.number, f"Duplicate image of row {duplicate_row}.", 'image')
+                    continue
+                seen.add(image_hash, row.number)
+
+                instance = row.instance
+                set_image_hash(instance, image_hash, HASH_VERSION)
+                name = os.path.basename(row.image_name)
+                if result['content'] is not None:
+                    name = os.path.splitext(name)[0] + FORMAT_EXTENSIONS[result['format']]
+                instance.image.save(name, ContentFile(result['content'] or row.image_data), save=False)
+                stored_images.append(instance.image)
+            row.image_data = None
+            row.instance.geocode()
+            accepted.append(row.instance)
+
+        if not accepted:
+            return []
+        if listing_type == 'property':
+            ml_utils.annotate_predicted_rent(accepted)
+
+        with transaction.atomic():
+            model.objects.bulk_create(accepted, batch_size=IMPORT_CHUNK_SIZE)
+            ListingIndex.objects.bulk_create(
+                [
+                    ListingIndex(listing_type=listing_type, listing_id=instance.pk, **ListingIndex.values_for(instance))
+                    for instance in accepted
+                ],
+                batch_size=IMPORT_CHUNK_SIZE,
+            )
+    except Exception:
+        # nothing of the chunk was inserted: don't leave its files behind
+        for image in stored_images:
+            image.delete(save=False)
+        raise
+    report.created += len(accepted)
+    return accepted
+
+
+def import_listings(upload, listing_type, owner, pool=None, chunk_size=IMPORT_CHUNK_SIZE, max_rows=MAX_ROWS):
+    """
+    Import a CSV/ZIP file object of ``listing_type`` listings owned by
+    ``owner``. ``pool`` defaults to the shared ingestion pool. Returns an
+    ImportReport; raises BulkImportError, without importing anything, if the
+    file can't be read or has more than ``max_rows`` rows.
+    """
+    if listing_type not in MODELS:
+        raise BulkImportError(f"Unknown listing type: {listing_type}")
+    if pool is None and INGEST_WORKERS > 0:
+        pool = get_pool()
+
+    report = ImportReport(listing_type)
+    started = time.monotonic()
+    try:
+        text, archive = _open_source(upload)
+        rows = _validate(csv.DictReader(text), listing_type, owner, archive, report, max_rows)
+    except (UnicodeDecodeError, csv.Error, zipfile.BadZipFile) as e:
+        raise BulkImportError(f"Could not read the file: {e}")
+
+    seen = HashIndex()  # images accepted so far in this file
+    imported = []
+    for start in range(0, len(rows), chunk_size):
+        imported += _import_chunk(listing_type, rows[start:start + chunk_size], archive, pool, seen, report)
+
+    if imported:
+        bump(LISTINGS_SCOPE)
+        for instance in imported:
+            if instance.image:
+                schedule_variants(instance.image)
+    report.seconds = time.monotonic() - started
+    return report
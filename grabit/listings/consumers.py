@@ -1,21 +1,95 @@
+import asyncio
 import json
+import re
+
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .groups import listing_group, user_group
+
+# Updates arriving within this window go out as one message
+COALESCE_SECONDS = getattr(settings, 'BOOKING_UPDATES_COALESCE_SECONDS', 0.25)
+MAX_LISTING_SUBSCRIPTIONS = 20
+LISTING_KEY = re.compile(r'^(vehicle|property):(\d+)$')
+
+
+def _listing_keys(data, name):
+    """The strings in the list ``data[name]``; anything else sent there is ignored."""
+    keys = data.get(name)
+    if not isinstance(keys, list):
+        return []
+    return [key for key in keys if isinstance(key, str)]
+
 
 class BookingStatusConsumer(AsyncWebsocketConsumer):
+    """
+    Booking status changes for the logged-in user (as renter or owner), plus
+    availability pings for listings the client subscribes to with
+    {"subscribe": ["vehicle:12"]} / {"unsubscribe": [...]}.
+
+    Sends {"updates": [{"booking_id", "status"}, ...], "listings": [...]},
+    with only the latest status per booking within each burst.
+    """
+
     async def connect(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+
+        self.joined = {user_group(user.pk)}
+        self.pending_updates = {}
+        self.pending_listings = set()
+        self.flush_task = None
+        await self.channel_layer.group_add(user_group(user.pk), self.channel_name)
         await self.accept()
 
     async def disconnect(self, close_code):
-        pass
+        if getattr(self, 'flush_task', None):
+            self.flush_task.cancel()
+        for group in getattr(self, 'joined', ()):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '')
+        except (ValueError, RecursionError):  # malformed or absurdly nested
+            return
+        if not isinstance(data, dict):
+            return
+
+        for key in _listing_keys(data, "subscribe"):
+            match = LISTING_KEY.match(key)
+            if match and len(self.joined) <= MAX_LISTING_SUBSCRIPTIONS:
+                group = listing_group(*match.groups())
+                if group not in self.joined:
+                    self.joined.add(group)
+                    await self.channel_layer.group_add(group, self.channel_name)
+        for key in _listing_keys(data, "unsubscribe"):
+            match = LISTING_KEY.match(key)
+            group = listing_group(*match.groups()) if match else None
+            if group in self.joined:
+                self.joined.discard(group)
+                await self.channel_layer.group_discard(group, self.channel_name)
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        booking_id = data["booking_id"]
-        status = data["status"]
+    async def booking_updates(self, event):
+        for update in event["updates"]:
+            self.pending_updates[update["booking_id"]] = update["status"]
+        self._schedule_flush()
 
-        # Send update to frontend
+    async def listing_updates(self, event):
+        self.pending_listings.update(event["listings"])
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(COALESCE_SECONDS)
+        updates, listings = self.pending_updates, self.pending_listings
+        self.pending_updates, self.pending_listings, self.flush_task = {}, set(), None
         await self.send(text_data=json.dumps({
-            "booking_id": booking_id,
-            "status": status,
+            "updates": [{"booking_id": booking_id, "status": status} for booking_id, status in updates.items()],
+            "listings": sorted(listings),
         }))
-
@@ -0,0 +1,166 @@
+"""
+Faceted filtering for the listings page.
+
+Each facet is a query string parameter (repeatable, e.g. ``?brand=Honda&brand=Kia``;
+names are unique across both models) over a column or a set of range buckets. ``facet_counts`` returns the counts
+for every facet from ONE grouped query per model:
+
+    SELECT <bucket of price>, brand, year, COUNT(*) ... GROUP BY 1, 2, 3
+
+and rolls the groups up in Python. Each facet's counts apply every *other*
+selected facet but not its own, so the options of a facet stay visible
+(and counted) after one of them is picked.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, Count, F, Q, Value, When, CharField
+
+# IntegerField's range on every backend; bigger numbers can't be bound
+INTEGER_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+
+class Facet:
+    def __init__(self, name, field, label, buckets=None, numeric=False):
+        """``buckets``: list of (key, label, low, high) ranges, low inclusive, high exclusive or None."""
+        self.name = name
+        self.field = field
+        self.label = label
+        self.buckets = buckets
+        self.numeric = numeric
+        self.alias = f'facet_{name}'
+
+    def expression(self):
+        if not self.buckets:
+            return F(self.field)
+        whens = []
+        for key, _, low, high in self.buckets:
+            condition = Q(**{f'{self.field}__gte': low})
+            if high is not None:
+                condition &= Q(**{f'{self.field}__lt': high})
+            whens.append(When(condition, then=Value(key)))
+        return Case(*whens, default=Value(None), output_field=CharField())
+
+    def selected(self, request):
+        values = [value for value in request.GET.getlist(self.name) if value]
+        if self.buckets:
+            keys = {key for key, *_ in self.buckets}
+            return [value for value in values if value in keys]
+        if self.numeric:
+            return [str(number) for number in map(_integer, values) if number is not None]
+        return values
+
+    def q(self, selected):
+        if not self.buckets:
+            return Q(**{f'{self.field}__in': selected})
+        condition = Q()
+        for key, _, low, high in self.buckets:
+            if key in selected:
+                bucket = Q(**{f'{self.field}__gte': low})
+                if high is not None:
+                    bucket &= Q(**{f'{self.field}__lt': high})
+                condition |= bucket
+        return condition
+
+    def options(self, counts, selected):
+        if self.buckets:
+            keys = [(key, label) for key, label, *_ in self.buckets]
+        else:
+            # plain values: most common first
+            keys = [(key, key) for key in sorted(counts, key=lambda key: (-counts[key], key))]
+        return [
+            {'value': key, 'label': label, 'count': counts.get(key, 0), 'selected': key in selected}
+            for key, label in keys
+        ]
+
+
+VEHICLE_FACETS = [
+    Facet('price_per_day', 'price_per_day', 'Price per day', buckets=[
+        ('0-1000', 'Under ₹1,000', 0, 1000),
+        ('1000-2500', '₹1,000 – 2,500', 1000, 2500),
+        ('2500-5000', '₹2,500 – 5,000', 2500, 5000),
+        ('5000-', '₹5,000+', 5000, None),
+    ]),
+    Facet('brand', 'brand', 'Brand'),
+    Facet('year', 'year', 'Year', numeric=True),
+]
+
+PROPERTY_FACETS = [
+    Facet('price', 'price', 'Price', buckets=[
+        ('0-5000', 'Under ₹5,000', 0, 5000),
+        ('5000-10000', '₹5,000 – 10,000', 5000, 10000),
+        ('10000-20000', '₹10,000 – 20,000', 10000, 20000),
+        ('20000-', '₹20,000+', 20000, None),
+    ]),
+    Facet('bedrooms', 'bedrooms', 'Bedrooms', numeric=True),
+    Facet('bathrooms', 'bathrooms', 'Bathrooms', numeric=True),
+    Facet('size', 'size', 'Size (sq ft)', buckets=[
+        ('0-500', 'Under 500', 0, 500),
+        ('500-1000', '500 – 1,000', 500, 1000),
+        ('1000-2000', '1,000 – 2,000', 1000, 2000),
+        ('2000-', '2,000+', 2000, None),
+    ]),
+]
+
+
+def selected_facets(request, facets):
+    """{facet name: selected values} for the facets present in the query string."""
+    selection = {}
+    for facet in facets:
+        values = facet.selected(request)
+        if values:
+            selection[facet.name] = values
+    return selection
+
+
+def apply_facets(queryset, facets, selection):
+    for facet in facets:
+        if facet.name in selection:
+            queryset = queryset.filter(facet.q(selection[facet.name]))
+    return queryset
+
+
+def facet_counts(queryset, facets, selection):
+    """
+    Options with counts for each facet, from one GROUP BY query over
+    ``queryset`` (which must not have the facet filters applied yet).
+    """
+    groups = (
+        queryset.order_by()
+        .values(**{facet.alias: facet.expression() for facet in facets})
+        .annotate(facet_count=Count('id'))
+    )
+    counts = {facet.name: defaultdict(int) for facet in facets}
+    for group in groups:
+        values = {facet.name: _key(group[facet.alias]) for facet in facets}
+        failing = [
+            facet.name for facet in facets
+            if facet.name in selection and values[facet.name] not in selection[facet.name]
+        ]
+        # a group counts towards a facet if it passes all the other facets' filters
+        for facet in facets:
+            if values[facet.name] is None or failing not in ([], [facet.name]):
+                continue
+            counts[facet.name][values[facet.name]] += group['facet_count']
+
+    return [
+        {
+            'name': facet.name,
+            'label': facet.label,
+            'options': facet.options(counts[facet.name], selection.get(facet.name, [])),
+        }
+        for facet in facets
+    ]
+
+
+def _integer(value):
+    try:
+        number = int(value)
+    except (ValueError, OverflowError):
+        return None
+    low, high = INTEGER_RANGE
+    return number if low <= number <= high else None
+
+
+def _key(value):
+    # query string values are strings, so compare grouped values as strings too
+    return None if value is None or value == '' else str(value)
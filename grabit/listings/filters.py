@@ -0,0 +1,141 @@
+"""
+The listing filters of the query string, shared by the listings page, its
+infinite-scroll feed and the JSON API.
+"""
+import math
+from datetime import datetime
+from functools import partial
+
+from django.utils.functional import SimpleLazyObject
+
+from .availability import available_between
+from .facets import PROPERTY_FACETS, VEHICLE_FACETS, apply_facets, facet_counts, selected_facets
+from .geo import resolve, within_radius
+from .models import Property, Vehicle
+from .page_cache import BOOKINGS_SCOPE, LISTINGS_SCOPE
+from .search import search_listings
+
+DEFAULT_RADIUS_KM = 10
+VEHICLE_ORDERING = ('-id',)
+PROPERTY_ORDERING = ('-id',)
+SEARCH_ORDERING = ('-search_rank', '-id')
+# matches property_price_ratio_idx; properties without a prediction are left out
+DEAL_ORDERING = ('price_ratio', 'id')
+
+
+def _float_param(request, name, default):
+    try:
+        value = float(request.GET[name])
+    except (KeyError, ValueError):
+        return default
+    return value if math.isfinite(value) else default
+
+
+def _near_origin(request, near):
+    """(lat, lon) from ?near=<place> (offline gazetteer) or ?lat=&lon= (e.g. browser geolocation)."""
+    if near:
+        place = resolve(near)
+        return (place.latitude, place.longitude) if place else None
+    latitude, longitude = _float_param(request, 'lat', None), _float_param(request, 'lon', None)
+    if latitude is None or longitude is None:
+        return None
+    return latitude, longitude
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _free_dates(request):
+    """(start, end) from ?start_date=&end_date= (YYYY-MM-DD), or None if missing or invalid."""
+    try:
+        start, end = parse_date(request.GET['start_date']), parse_date(request.GET['end_date'])
+    except (KeyError, ValueError):
+        return None
+    return (start, end) if start <= end else None
+
+
+def listing_scopes(request, *args, **kwargs):
+    """Page cache scopes of the listings filtered by the query string."""
+    return [LISTINGS_SCOPE, BOOKINGS_SCOPE] if _free_dates(request) else [LISTINGS_SCOPE]
+
+
+def filtered_listings(request, with_facets=False):
+    """
+    Vehicle and Property querysets for the filters in the query string.
+    With ``with_facets`` the returned filters also carry the facet counts.
+    """
+    category = request.GET.get('category', '')
+    location = request.GET.get('location', '')
+    query = request.GET.get('q', '').strip()
+    deals_only = request.GET.get('deals') == '1'
+    sort = request.GET.get('sort', '')
+
+    vehicles = Vehicle.objects.filter(is_available=True)
+    properties = Property.objects.filter(is_available=True)
+
+    # Indexed search (tsvector/trigram on PostgreSQL, FTS5 on SQLite) instead of icontains scans
+    if location:
+        vehicles = search_listings(vehicles, location, places_only=True)
+        properties = search_listings(properties, location, places_only=True)
+    if query:
+        vehicles = search_listings(vehicles, query)
+        properties = search_listings(properties, query)
+    vehicle_ordering = SEARCH_ORDERING if query else VEHICLE_ORDERING
+
+    if category == "vehicle":
+        properties = properties.none()
+    elif category == "property":
+        vehicles = vehicles.none()
+
+    # "Within X km of place": filtered in the DB; distances are only computed for the page shown
+    near = request.GET.get('near', '').strip()
+    radius = _float_param(request, 'radius', DEFAULT_RADIUS_KM)
+    origin = _near_origin(request, near)
+    if origin is not None:
+        vehicles = within_radius(vehicles, *origin, radius)
+        properties = within_radius(properties, *origin, radius)
+    elif near:
+        vehicles, properties = vehicles.none(), properties.none()
+
+    # Free on the chosen dates: one NOT EXISTS probe per listing against confirmed bookings
+    free_dates = _free_dates(request)
+    if free_dates:
+        vehicles = available_between(vehicles, 'vehicle', *free_dates)
+        properties = available_between(properties, 'property', *free_dates)
+
+    # "Best deal" comes from the prediction stored on each property, no ML work here
+    if deals_only:
+        properties = properties.filter(is_best_deal=True)
+
+    # Facets: counts come from the querysets before their own facet filters
+    vehicle_selection = selected_facets(request, VEHICLE_FACETS)
+    property_selection = selected_facets(request, PROPERTY_FACETS)
+    vehicle_facets = property_facets = None
+    if with_facets:
+        # lazy, so a cached facet fragment skips the count queries
+        vehicle_facets = SimpleLazyObject(partial(facet_counts, vehicles, VEHICLE_FACETS, vehicle_selection))
+        property_facets = SimpleLazyObject(partial(facet_counts, properties, PROPERTY_FACETS, property_selection))
+    vehicles = apply_facets(vehicles, VEHICLE_FACETS, vehicle_selection)
+    properties = apply_facets(properties, PROPERTY_FACETS, property_selection)
+    property_ordering = SEARCH_ORDERING if query else PROPERTY_ORDERING
+    if sort == "deal":
+        properties = properties.filter(predicted_rent__isnull=False).annotate(price_ratio=Property.price_ratio())
+        property_ordering = DEAL_ORDERING
+
+    filters = {
+        "category": category,
+        "location": location,
+        "query": query,
+        "near": near,
+        "radius": radius,
+        "near_unresolved": bool(near) and origin is None,
+        "start_date": free_dates[0] if free_dates else None,
+        "end_date": free_dates[1] if free_dates else None,
+        "origin": origin,
+        "deals_only": deals_only,
+        "sort": sort,
+        "vehicle_facets": vehicle_facets,
+        "property_facets": property_facets,
+    }
+    return vehicles, properties, vehicle_ordering, property_ordering, filters
@@ -22,3 +22,14 @@ class PropertyForm(forms.ModelForm):
             'size': forms.NumberInput(attrs={'min': 0}),
         }
 
+
+
+# Bulk import upload (see bulk_import.py)
+class BulkImportForm(forms.Form):
+    listing_type = forms.ChoiceField(choices=[('vehicle', 'Vehicles'), ('property', 'Properties')])
+    file = forms.FileField(help_text="A .csv file, or a .zip with one .csv and the images it names")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for field in self.fields.values():
+            field.widget.attrs.update({'class': 'form-control'})
@@ -0,0 +1,215 @@
+"""
+Offline geocoding and radius search.
+
+Place names are resolved against the bundled gazetteer in
+data/gazetteer_in.csv (no network service). Listings store the point as
+latitude/longitude plus a geohash (``geo_cell``). A radius query runs in
+the database: prefix lookups on the indexed column for the 3x3 block of
+geohash cells around the centre, a latitude/longitude bounding box, and the
+exact great-circle distance for the rows left. Distances shown next to
+listings are computed for the rows of one page only.
+"""
+import csv
+import math
+import re
+import threading
+from pathlib import Path
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'gazetteer_in.csv'
+GEOHASH_PRECISION = 9  # ~5 m cells; queries use a prefix of this
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = 500
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_WORD = re.compile(r'[a-z]+')
+_MAX_NAME_WORDS = 3
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+class Place:
+    __slots__ = ('name', 'state', 'latitude', 'longitude')
+
+    def __init__(self, name, state, latitude, longitude):
+        self.name, self.state = name, state
+        self.latitude, self.longitude = latitude, longitude
+
+    def __repr__(self):
+        return f"<Place {self.name}, {self.state} ({self.latitude}, {self.longitude})>"
+
+
+def _normalize(text):
+    return ' '.join(_WORD.findall(text.lower()))
+
+
+def load_gazetteer(path=GAZETTEER_PATH):
+    """{normalized name or alias: Place}"""
+    names = {}
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            place = Place(row['name'], row['state'], float(row['latitude']), float(row['longitude']))
+            for name in [row['name'], *filter(None, row['aliases'].split('|'))]:
+                names.setdefault(_normalize(name), place)
+    return names
+
+
+def gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = load_gazetteer()
+    return _gazetteer
+
+
+def resolve(*texts):
+    """
+    The first gazetteer place named in ``texts`` (most specific first, e.g.
+    address then city), or None. Within a text the earliest, longest name
+    wins, so "Fort Kochi, Kochi" is Fort Kochi.
+    """
+    names = gazetteer()
+    for text in texts:
+        words = _normalize(text or '').split()
+        for start in range(len(words)):
+            for length in range(min(_MAX_NAME_WORDS, len(words) - start), 0, -1):
+                place = names.get(' '.join(words[start:start + length]))
+                if place is not None:
+                    return place
+    return None
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose cells cover the circle: the centre cell and its 8
+    neighbours, at the finest precision whose cells are at least
+    ``radius_km`` across. Returns [] when the radius is too large to prefilter.
+    """
+    km_per_lon_degree = 111.32 * max(math.cos(math.radians(latitude)), 0.01)
+    precision = 0
+    for candidate in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(candidate)
+        if height * 110.57 < radius_km or width * km_per_lon_degree < radius_km:
+            break
+        precision = candidate
+    if precision == 0:
+        return []
+
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlon in (-width, 0, width):
+            lat = max(-90.0, min(90.0, latitude + dlat))
+            lon = (longitude + dlon + 180.0) % 360.0 - 180.0
+            cells.add(geohash(lat, lon, precision))
+    return sorted(cells)
+
+
+def set_location_point(instance, *texts):
+    """Resolve ``texts`` and store latitude/longitude/geo_cell on a listing."""
+    place = resolve(*texts)
+    if place is None:
+        instance.latitude = instance.longitude = instance.geo_cell = None
+    else:
+        instance.latitude, instance.longitude = place.latitude, place.longitude
+        instance.geo_cell = geohash(place.latitude, place.longitude)
+    return place
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Distances in km from one point to arrays of points."""
+    import numpy as np
+
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    ``(min lat, max lat, min lon, max lon)`` around the circle; the longitudes
+    are None when the box reaches a pole or crosses the antimeridian.
+    """
+    dlat = radius_km / 110.57
+    min_lat, max_lat = latitude - dlat, latitude + dlat
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+    dlon = radius_km / (111.32 * math.cos(math.radians(max(abs(min_lat), abs(max_lat)))))
+    if longitude - dlon < -180.0 or longitude + dlon > 180.0:
+        return min_lat, max_lat, None, None
+    return min_lat, max_lat, longitude - dlon, longitude + dlon
+
+
+def distance_expression(latitude, longitude):
+    """Haversine distance in km from the point to a row's latitude/longitude, as a database expression."""
+    from django.db.models import F, FloatField, Value
+    from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    lat2, lon2 = Radians(F('latitude')), Radians(F('longitude'))
+    a = (
+        Power(Sin((lat2 - Value(lat1)) / 2), 2)
+        + Value(math.cos(lat1)) * Cos(lat2) * Power(Sin((lon2 - Value(lon1)) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(a, Value(1.0))), output_field=FloatField())
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """
+    The rows of ``queryset`` within ``radius_km``, filtered in the database:
+    cell prefixes and a bounding box the indexes can use, then the exact
+    distance for the rows inside the box.
+    """
+    from django.db.models import Q
+
+    radius_km = min(float(radius_km), MAX_RADIUS_KM)
+    candidates = queryset.filter(latitude__isnull=False)
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells:
+        prefix = Q()
+        for cell in cells:
+            prefix |= Q(geo_cell__startswith=cell)
+        candidates = candidates.filter(prefix)
+
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+    candidates = candidates.filter(latitude__range=(min_lat, max_lat))
+    if min_lon is not None:
+        candidates = candidates.filter(longitude__range=(min_lon, max_lon))
+    return candidates.alias(distance_km=distance_expression(latitude, longitude)).filter(distance_km__lte=radius_km)
+
+
+def set_distances(rows, latitude, longitude):
+    """Set ``distance_km`` (rounded) on the rows of one page, in one NumPy pass."""
+    rows = [row for row in rows if row.latitude is not None]
+    if rows:
+        distances = haversine_km(latitude, longitude, [row.latitude for row in rows], [row.longitude for row in rows])
+        for row, distance in zip(rows, distances):
+            row.distance_km = round(float(distance), 1)
@@ -0,0 +1,13 @@
+"""
+Channel-layer group names for booking status pushes. No Django imports, so
+consumers.py (loaded by the ASGI routing before the app registry) can use
+them.
+"""
+
+
+def user_group(user_id):
+    return f"booking_user_{user_id}"
+
+
+def listing_group(listing_type, listing_id):
+    return f"booking_listing_{listing_type}_{listing_id}"
@@ -0,0 +1,109 @@
+"""
+Near-duplicate lookup over the perceptual hashes stored in ``image_hash``.
+
+A 64-bit pHash is split into four 16-bit chunks, each kept in its own indexed
+column (multi-index hashing). If two hashes are within Hamming distance ``r``
+then at least one of their chunks differs by no more than ``r // 4`` bits, so
+a lookup only has to probe a few chunk values per column and check the exact
+distance on the handful of rows that come back. Nothing is decoded or scanned.
+"""
+from collections import defaultdict
+
+from django.db.models import Q
+
+CHUNK_BITS = 16
+CHUNK_COUNT = 4
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+CHUNK_FIELDS = [f'phash_chunk_{i}' for i in range(CHUNK_COUNT)]
+# Everything set_image_hash writes, e.g. for bulk_update()
+HASH_FIELDS = ['image_hash', 'image_hash_version'] + CHUNK_FIELDS
+
+# Hashes closer than this are treated as the same photo
+DUPLICATE_DISTANCE = 5
+
+
+def split_hash(image_hash):
+    """Split a hex pHash into its 16-bit chunks (most significant first)."""
+    if not image_hash:
+        return [None] * CHUNK_COUNT
+    value = int(str(image_hash), 16)
+    return [
+        (value >> (CHUNK_BITS * (CHUNK_COUNT - 1 - i))) & CHUNK_MASK
+        for i in range(CHUNK_COUNT)
+    ]
+
+
+def set_image_hash(instance, image_hash, version=None):
+    """Store the hash, the algorithm version and its index chunks on a Vehicle/Property instance."""
+    instance.image_hash = str(image_hash) if image_hash else None
+    instance.image_hash_version = version if image_hash else None
+    for field, chunk in zip(CHUNK_FIELDS, split_hash(instance.image_hash)):
+        setattr(instance, field, chunk)
+
+
+def hamming_distance(hash_a, hash_b):
+    return (int(str(hash_a), 16) ^ int(str(hash_b), 16)).bit_count()
+
+
+def _chunk_probes(chunk, radius):
+    """All 16-bit values within ``radius`` bit flips of ``chunk``."""
+    probes = {chunk}
+    for _ in range(radius):
+        probes |= {p ^ (1 << bit) for p in probes for bit in range(CHUNK_BITS)}
+    return probes
+
+
+def similar_hash_filter(image_hash, max_distance=DUPLICATE_DISTANCE - 1):
+    """Q object matching every row that *may* be within ``max_distance``."""
+    radius = max_distance // CHUNK_COUNT
+    query = Q()
+    for field, chunk in zip(CHUNK_FIELDS, split_hash(image_hash)):
+        query |= Q(**{f'{field}__in': sorted(_chunk_probes(chunk, radius))})
+    return query
+
+
+def similar_hashes_filter(image_hashes, max_distance=DUPLICATE_DISTANCE - 1):
+    """``similar_hash_filter`` for many hashes at once: one query for a whole batch."""
+    radius = max_distance // CHUNK_COUNT
+    probes = [set() for _ in CHUNK_FIELDS]
+    for image_hash in image_hashes:
+        for values, chunk in zip(probes, split_hash(image_hash)):
+            values |= _chunk_probes(chunk, radius)
+    query = Q()
+    for field, values in zip(CHUNK_FIELDS, probes):
+        if values:
+            query |= Q(**{f'{field}__in': sorted(values)})
+    return query
+
+
+class HashIndex:
+    """In-memory version of the chunk columns, e.g. to compare a batch of hashes with each other."""
+
+    def __init__(self, max_distance=DUPLICATE_DISTANCE - 1):
+        self.max_distance = max_distance
+        self.radius = max_distance // CHUNK_COUNT
+        self.buckets = [defaultdict(list) for _ in range(CHUNK_COUNT)]
+
+    def add(self, image_hash, ref):
+        for bucket, chunk in zip(self.buckets, split_hash(image_hash)):
+            bucket[chunk].append((image_hash, ref))
+
+    def find(self, image_hash):
+        """``ref`` of a stored hash within ``max_distance`` bits, or None."""
+        for bucket, chunk in zip(self.buckets, split_hash(image_hash)):
+            for probe in _chunk_probes(chunk, self.radius):
+                for other, ref in bucket.get(probe, ()):
+                    if hamming_distance(other, image_hash) <= self.max_distance:
+                        return ref
+        return None
+
+
+def find_similar(queryset, image_hash, max_distance=DUPLICATE_DISTANCE - 1):
+    """Return the first listing in ``queryset`` whose image is within ``max_distance`` bits."""
+    if not image_hash:
+        return None
+    candidates = queryset.filter(similar_hash_filter(image_hash, max_distance))
+    for candidate in candidates.only('id', 'image_hash'):
+        if candidate.image_hash and hamming_distance(candidate.image_hash, image_hash) <= max_distance:
+            return candidate
+    return None
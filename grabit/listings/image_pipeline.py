@@ -0,0 +1,206 @@
+"""
+Upload ingestion for listing images.
+
+Every uploaded image is decoded exactly once, in a worker process, at reduced
+resolution (PIL draft mode for JPEGs). The worker rejects decompression bombs
+before decoding, applies the EXIF orientation, caps the stored resolution and
+computes the perceptual hash. The request thread only waits for the result, and
+models reuse the hash instead of re-opening the file on every save.
+"""
+import io
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as PoolTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from .image_index import set_image_hash
+
+# Bump when the hashing below changes so stored hashes can be recomputed
+HASH_VERSION = 2
+
+MAX_IMAGE_PIXELS = getattr(settings, 'IMAGE_MAX_PIXELS', 40_000_000)
+MAX_IMAGE_DIMENSION = getattr(settings, 'IMAGE_MAX_DIMENSION', 1600)
+INGEST_WORKERS = getattr(settings, 'IMAGE_INGEST_WORKERS', min(4, os.cpu_count() or 1))
+INGEST_TIMEOUT = getattr(settings, 'IMAGE_INGEST_TIMEOUT', 30)
+
+KEEP_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp'}
+ORIENTATION_TAG = 0x0112
+
+
+class ImageRejected(ValueError):
+    """Raised for uploads that are not images or are too large to decode."""
+
+
+def open_image(data, target_size=MAX_IMAGE_DIMENSION, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Open image bytes at reduced resolution and upright, refusing decompression
+    bombs. Returns ``(image, source_format, source_size, was_rotated)``.
+    """
+    try:
+        img = Image.open(io.BytesIO(data))
+    except Exception as e:
+        raise ImageRejected(f"Unsupported image file: {e}")
+
+    # Only the header has been parsed at this point, no pixels are decoded
+    if img.width * img.height > max_pixels:
+        raise ImageRejected(f"Image is too large ({img.width}x{img.height}).")
+
+    source_format, source_size = img.format, img.size
+    rotated = img.getexif().get(ORIENTATION_TAG, 1) != 1
+    img.draft('RGB', (target_size, target_size))
+    try:
+        img = ImageOps.exif_transpose(img)
+    except Exception as e:
+        raise ImageRejected(f"Could not decode image: {e}")
+    return img, source_format, source_size, rotated
+
+
+def _fit_and_hash(img, max_dimension):
+    import imagehash  # pulls in scipy; only the pool workers need it
+
+    if max(img.size) > max_dimension:
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    return img, str(imagehash.phash(img))
+
+
+def hash_image_path(path, max_dimension=MAX_IMAGE_DIMENSION, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Hash a file on disk without normalizing it, for bulk jobs. Runs in a worker
+    process; returns ``(hash, None)`` or ``(None, error message)``.
+    """
+    try:
+        with open(path, 'rb') as f:
+            img = open_image(f.read(), max_dimension, max_pixels)[0]
+        return _fit_and_hash(img, max_dimension)[1], None
+    except Exception as e:
+        return None, str(e)
+
+
+def process_image(data, max_dimension=MAX_IMAGE_DIMENSION, max_pixels=MAX_IMAGE_PIXELS):
+    """
+    Decode, orient, hash and normalize one image. Runs inside the worker pool,
+    so it only takes and returns picklable values.
+    """
+    img, source_format, source_size, rotated = open_image(data, max_dimension, max_pixels)
+    img, image_hash = _fit_and_hash(img, max_dimension)
+
+    result = {
+        'hash': image_hash,
+        'width': img.width,
+        'height': img.height,
+        'content': None,
+        'format': source_format,
+    }
+
+    # Only re-encode when the stored file would otherwise be oversized, sideways
+    # or in a format browsers can't show
+    if rotated or max(source_size) > max_dimension or source_format not in KEEP_FORMATS:
+        out_format = source_format if source_format in KEEP_FORMATS else 'JPEG'
+        if out_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format=out_format, quality=85, optimize=True)
+        result['content'] = buffer.getvalue()
+        result['format'] = out_format
+    return result
+
+
+def try_process_image(data):
+    """``process_image`` for bulk jobs: returns ``(result, None)`` or ``(None, error message)``."""
+    try:
+        return process_image(data), None
+    except Exception as e:
+        return None, str(e)
+
+
+_pool = None
+
+
+def get_pool():
+    """The shared ingestion process pool, started on first use."""
+    global _pool
+    if _pool is None:
+        # spawn: forking a threaded ASGI/WSGI worker is not safe
+        _pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def run_in_pool(func, *args):
+    """
+    Run ``func(*args)`` in the ingestion pool, or inline if the pool is disabled.
+    Any failure (an error in ``func``, a timeout, a crashed worker) is raised
+    as ImageRejected.
+    """
+    global _pool
+    try:
+        if INGEST_WORKERS <= 0:
+            return func(*args)
+        future = submit_to_pool(func, *args)
+        return future.result(timeout=INGEST_TIMEOUT)
+    except ImageRejected:
+        raise
+    except PoolTimeout:
+        future.cancel()
+        raise ImageRejected("The image took too long to process.")
+    except BrokenProcessPool:
+        # a worker died on this image (e.g. out of memory); the next one gets a new pool
+        _pool = None
+        raise ImageRejected("The image could not be processed.")
+    except Exception as e:
+        raise ImageRejected(f"The image could not be processed: {e}")
+
+
+def submit_to_pool(func, *args):
+    """Queue ``func(*args)`` on the ingestion pool and return its future."""
+    global _pool
+    try:
+        return get_pool().submit(func, *args)
+    except BrokenProcessPool:  # broken by an earlier job: start a new pool
+        _pool = None
+        return get_pool().submit(func, *args)
+
+
+def read_image(field_file):
+    field_file.open('rb')
+    data = field_file.read()
+    field_file.seek(0)
+    return data
+
+
+def hash_image_file(field_file):
+    """pHash of a stored or uploaded image, computed in the ingestion pool."""
+    return run_in_pool(process_image, read_image(field_file))['hash']
+
+
+def ingest_upload(instance):
+    """
+    Process ``instance.image`` once: reject bombs, normalize the file and store
+    its hash so ``save()`` doesn't have to decode it again.
+    """
+    result = run_in_pool(process_image, read_image(instance.image))
+    if result['content'] is not None:
+        name = os.path.splitext(os.path.basename(instance.image.name))[0]
+        instance.image = ContentFile(result['content'], name=name + FORMAT_EXTENSIONS[result['format']])
+    set_image_hash(instance, result['hash'], HASH_VERSION)
+    remember_image(instance)
+    return result
+
+
+def remember_image(instance):
+    """Record which image file ``image_hash`` belongs to."""
+    if 'image' not in instance.get_deferred_fields():
+        instance._hashed_image_name = instance.image.name if instance.image else None
+
+
+def image_needs_hash(instance):
+    """True when the attached image is not the one ``image_hash`` was computed for."""
+    if not instance.image:
+        return False
+    if not instance.image_hash:
+        return True
+    return instance.image.name != getattr(instance, '_hashed_image_name', instance.image.name)
@@ -0,0 +1,166 @@
+"""
+Resized copies of listing images for cards and detail pages.
+
+Variants are written next to the original (``vehicles/car.jpg`` ->
+``vehicles/car.card.jpg`` and ``vehicles/car.card.webp``), rendered in the
+ingestion pool and looked up through the cache, so templates never serve the
+full upload and never hit the disk twice for the same variant. Rendering a
+page never waits for a variant: until it exists, the original is served and
+the variant is queued.
+"""
+import io
+import logging
+import os
+
+from PIL import Image
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from .image_pipeline import open_image, run_in_pool, submit_to_pool, read_image, INGEST_WORKERS
+
+# name -> bounding box; images are scaled to fit, never cropped or enlarged
+VARIANTS = {
+    'card': (480, 360),
+    'detail': (1200, 900),
+}
+FORMATS = ('original', 'webp')
+
+EXTENSION_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+CACHE_TIMEOUT = 60 * 60 * 24
+# an image's variants are queued at most once per this many seconds
+QUEUED_TIMEOUT = 10 * 60
+
+logger = logging.getLogger(__name__)
+
+
+def variant_name(image_name, variant, fmt='original'):
+    """Storage path of a variant, derived from the original's name only."""
+    root, ext = os.path.splitext(image_name)
+    if fmt == 'webp':
+        ext = '.webp'
+    elif ext.lower() not in EXTENSION_FORMATS:
+        ext = '.jpg'
+    return f'{root}.{variant}{ext}'
+
+
+def render_variants(data, image_name):
+    """Render every variant of one image. Runs in the ingestion pool."""
+    original_format = EXTENSION_FORMATS.get(os.path.splitext(image_name)[1].lower(), 'JPEG')
+    largest = max(max(box) for box in VARIANTS.values())
+    img = open_image(data, target_size=largest)[0]
+    img.load()
+
+    rendered = {}
+    for variant, box in VARIANTS.items():
+        resized = img.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        for fmt in FORMATS:
+            rendered[(variant, fmt)] = _encode(resized, 'WEBP' if fmt == 'webp' else original_format)
+    return rendered
+
+
+def _encode(img, out_format):
+    if out_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format=out_format, quality=82, optimize=True)
+    return buffer.getvalue()
+
+
+def _missing_variants(image_name, force=False):
+    return [
+        (variant, fmt) for variant in VARIANTS for fmt in FORMATS
+        if force or not default_storage.exists(variant_name(image_name, variant, fmt))
+    ]
+
+
+def _store_variants(image_name, rendered):
+    for (variant, fmt), content in rendered.items():
+        path = variant_name(image_name, variant, fmt)
+        if default_storage.exists(path):
+            default_storage.delete(path)
+        saved = default_storage.save(path, ContentFile(content))
+        if saved != path:
+            # another process stored the same variant in between: keep theirs
+            default_storage.delete(saved)
+        cache.set(_cache_key(image_name, variant, fmt), default_storage.url(path), CACHE_TIMEOUT)
+
+
+def generate_variants(field_file, force=False):
+    """
+    Write any missing variants of ``field_file``. Safe to call repeatedly:
+    existing variants are left alone unless ``force`` is set.
+    Returns the number of files written.
+    """
+    if not field_file:
+        return 0
+    missing = _missing_variants(field_file.name, force)
+    if not missing:
+        return 0
+    rendered = run_in_pool(render_variants, read_image(field_file), field_file.name)
+    rendered = {key: rendered[key] for key in missing}
+    _store_variants(field_file.name, rendered)
+    return len(rendered)
+
+
+def schedule_variants(field_file):
+    """
+    Render variants in the background after an upload, without waiting for
+    them. Never raises: failed variants are queued again on a later page view.
+    """
+    if not field_file:
+        return
+    image_name = field_file.name
+    if not cache.add(_queued_key(image_name), True, QUEUED_TIMEOUT):
+        return  # already queued
+    try:
+        if INGEST_WORKERS <= 0:
+            generate_variants(field_file)
+            return
+        if not _missing_variants(image_name):
+            return
+
+        def store(future):
+            try:
+                _store_variants(image_name, future.result())
+            except Exception:
+                logger.exception("Image variants of %s failed", image_name)
+
+        submit_to_pool(render_variants, read_image(field_file), image_name).add_done_callback(store)
+    except Exception:
+        logger.exception("Could not queue the image variants of %s", image_name)
+
+
+def _cache_key(image_name, variant, fmt):
+    return f'listings:variant:{fmt}:{variant}:{image_name}'
+
+
+def _queued_key(image_name):
+    return f'listings:variant-queued:{image_name}'
+
+
+def variant_url(field_file, variant, fmt='original'):
+    """
+    URL of a variant. Until it exists, the original image's, and the
+    variants are queued for rendering.
+    """
+    if not field_file:
+        return ''
+    if variant not in VARIANTS:
+        return field_file.url
+    key = _cache_key(field_file.name, variant, fmt)
+    url = cache.get(key)
+    if url is None:
+        path = variant_name(field_file.name, variant, fmt)
+        try:
+            exists = default_storage.exists(path)
+        except Exception:
+            logger.exception("Could not look up image variant %s", path)
+            return field_file.url
+        if not exists:
+            schedule_variants(field_file)
+            return field_file.url
+        url = default_storage.url(path)
+        cache.set(key, url, CACHE_TIMEOUT)
+    return url
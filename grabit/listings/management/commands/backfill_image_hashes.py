@@ -0,0 +1,120 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from listings.models import Vehicle, Property
+from listings.image_index import HASH_FIELDS, set_image_hash
+from listings.image_pipeline import HASH_VERSION, INGEST_WORKERS, hash_image_path, hash_image_file
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute image_hash for listings that have none or were hashed by an older "
+        "algorithm. Runs in id-ordered batches across a process pool and can be resumed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=max(INGEST_WORKERS, 1))
+        parser.add_argument('--all', action='store_true', help="Re-hash every listing, not only missing/outdated hashes")
+        parser.add_argument('--restart', action='store_true', help="Ignore any saved checkpoint")
+        parser.add_argument(
+            '--checkpoint',
+            default=os.path.join(settings.BASE_DIR, '.backfill_image_hashes.json'),
+            help="File used to remember the last processed id of each model",
+        )
+
+    def handle(self, *args, **options):
+        self.checkpoint_path = options['checkpoint']
+        checkpoint = {} if options['restart'] else self.load_checkpoint(options['all'])
+
+        pool = ProcessPoolExecutor(max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn'))
+        try:
+            for model in (Vehicle, Property):
+                self.backfill(model, pool, checkpoint, options)
+        finally:
+            pool.shutdown()
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.stdout.write(self.style.SUCCESS("Image hash backfill complete."))
+
+    def backfill(self, model, pool, checkpoint, options):
+        name = model.__name__
+        last_id = checkpoint.get(name, 0)
+        queryset = model.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            queryset = queryset.filter(
+                Q(image_hash__isnull=True) | Q(image_hash='')
+                | Q(image_hash_version__isnull=True) | Q(image_hash_version__lt=HASH_VERSION)
+            )
+        queryset = queryset.only('id', 'image', *HASH_FIELDS).order_by('id')
+
+        done = failed = 0
+        started = time.monotonic()
+        if last_id:
+            self.stdout.write(f"{name}: resuming after id {last_id}")
+
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+
+            for listing, (image_hash, error) in zip(batch, self.hash_batch(batch, pool)):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{name} {listing.id}: {error}")
+                else:
+                    set_image_hash(listing, image_hash, HASH_VERSION)
+
+            model.objects.bulk_update(batch, HASH_FIELDS)
+            done += len(batch)
+            last_id = batch[-1].id
+            checkpoint[name] = last_id
+            self.save_checkpoint(checkpoint, options['all'])
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{name}: {done} hashed, {failed} failed, up to id {last_id} ({done / elapsed:.1f} images/s)")
+
+    def hash_batch(self, batch, pool):
+        paths = []
+        for listing in batch:
+            try:
+                paths.append(listing.image.path)
+            except NotImplementedError:
+                paths.append(None)
+
+        local = [path for path in paths if path]
+        results = iter(pool.map(hash_image_path, local, chunksize=8))
+        for listing, path in zip(batch, paths):
+            if path:
+                yield next(results)
+            else:
+                # Remote storage: fall back to reading through the storage API
+                try:
+                    yield hash_image_file(listing.image), None
+                except Exception as e:
+                    yield None, str(e)
+
+    def load_checkpoint(self, rehash_all):
+        try:
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        # A checkpoint from another hash version or mode belongs to a different run
+        if data.get('hash_version') != HASH_VERSION or data.get('all') != rehash_all:
+            return {}
+        return data.get('last_ids', {})
+
+    def save_checkpoint(self, last_ids, rehash_all):
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'hash_version': HASH_VERSION, 'all': rehash_all, 'last_ids': last_ids}, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,40 @@
+import os
+import socket
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from listings.outbox import BATCH_SIZE, drain
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver queued booking notifications (WebSocket pushes and emails) from the outbox. Runs until "
+        "stopped; any number of workers can run side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to wait when nothing is due")
+        parser.add_argument('--once', action='store_true', help="Drain what is due now, then exit")
+
+    def handle(self, *args, **options):
+        worker = f"{socket.gethostname()[:16]}-{os.getpid()}-{uuid.uuid4().hex[:6]}"[:32]
+        total_sent = total_failed = 0
+        try:
+            while True:
+                close_old_connections()
+                sent, failed = drain(worker, options['batch_size'])
+                total_sent += sent
+                total_failed += failed
+                if failed:
+                    self.stderr.write(f"{failed} notifications failed, will retry.")
+                if sent + failed == 0:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Delivered {total_sent} notifications ({total_failed} failures)."))
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from listings import ml_utils
+from listings.rent_model import CompiledRentModel, compile_pipeline, save_compiled
+
+
+class Command(BaseCommand):
+    help = (
+        "Export ml_models/kerala_rent_predictor.pkl to a NumPy-only .npz that ml_utils "
+        "uses for predictions without pandas or sklearn. Re-run whenever the .pkl changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=ml_utils.COMPILED_MODEL_PATH)
+
+    def handle(self, *args, **options):
+        import joblib
+        import pandas as pd
+
+        pipeline = joblib.load(ml_utils.MODEL_PATH)
+        try:
+            arrays = compile_pipeline(pipeline, ml_utils.file_version(ml_utils.MODEL_PATH))
+        except ValueError as e:
+            raise CommandError(str(e))
+        save_compiled(arrays, options['output'])
+
+        # Check the export against the original model before anyone relies on it
+        compiled = CompiledRentModel.load(options['output'])
+        locations = list(compiled.category_index) + ['Unknown town']
+        rows = [(loc, bedrooms, size) for loc in locations for bedrooms in range(1, 6) for size in (300, 850, 1500, 4000)]
+        locations, bedrooms, sizes = zip(*rows)
+        expected = pipeline.predict(pd.DataFrame({'location': locations, 'bedrooms': bedrooms, 'size': sizes}))
+        actual = compiled.predict(locations, bedrooms, sizes)
+        max_error = float(abs(expected - actual).max())
+        if max_error > 1e-6:
+            raise CommandError(f"Exported model disagrees with the original (max error {max_error}).")
+
+        started = time.perf_counter()
+        for row in rows[:200]:
+            compiled.predict([row[0]], [row[1]], [row[2]])
+        per_call = (time.perf_counter() - started) / min(len(rows), 200) * 1e6
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']} ({compiled.kind}, version {compiled.source_version}); "
+            f"matches original on {len(rows)} inputs, {per_call:.0f} µs per single prediction."
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from listings.models import Vehicle, Property
+from listings.image_variants import generate_variants
+
+
+class Command(BaseCommand):
+    help = "Create card/detail/WebP variants for existing listing images. Existing variants are kept unless --force is given."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Re-render variants that already exist")
+
+    def handle(self, *args, **options):
+        written = failed = 0
+        for model in (Vehicle, Property):
+            for listing in model.objects.exclude(image='').exclude(image__isnull=True).only('id', 'image').iterator():
+                try:
+                    written += generate_variants(listing.image, force=options['force'])
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} {listing.id}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} variant files ({failed} images failed)."))
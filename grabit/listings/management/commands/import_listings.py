@@ -0,0 +1,53 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from listings.bulk_import import IMPORT_CHUNK_SIZE, MAX_ROWS, BulkImportError, import_listings
+from listings.image_pipeline import INGEST_WORKERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-import vehicles or properties from a CSV file, or a ZIP with one CSV plus the "
+        "images it names. Rows are validated with the add-listing form rules; rejected rows "
+        "are listed in an error report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or ZIP file")
+        parser.add_argument('--type', choices=['vehicle', 'property'], required=True)
+        parser.add_argument('--owner', required=True, help="Username the listings belong to")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=max(INGEST_WORKERS, 1))
+        parser.add_argument('--max-rows', type=int, default=MAX_ROWS)
+        parser.add_argument('--report', help="Write the per-row error report to this CSV file")
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['owner']}")
+
+        pool = ProcessPoolExecutor(max_workers=options['workers'], mp_context=multiprocessing.get_context('spawn'))
+        try:
+            with open(options['path'], 'rb') as upload:
+                report = import_listings(
+                    upload, options['type'], owner, pool=pool, chunk_size=options['chunk_size'],
+                    max_rows=options['max_rows'],
+                )
+        except (OSError, BulkImportError) as e:
+            raise CommandError(str(e))
+        finally:
+            pool.shutdown()
+
+        for row, field, message in sorted(report.errors)[:20]:
+            self.stderr.write(f"row {row}{f' [{field}]' if field else ''}: {message}")
+        if len(report.errors) > 20:
+            self.stderr.write(f"... and {len(report.errors) - 20} more errors")
+        if options['report']:
+            with open(options['report'], 'w', newline='') as f:
+                f.write(report.as_csv())
+            self.stdout.write(f"Error report written to {options['report']}")
+        self.stdout.write(self.style.SUCCESS(report.summary()))
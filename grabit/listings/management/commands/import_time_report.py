@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Measure how long importing the listings app takes in a fresh interpreter (python -X importtime)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', default=['listings.models', 'listings.views', 'listings.urls'])
+        parser.add_argument('--top', type=int, default=15, help="How many of the slowest imports to list")
+        parser.add_argument('--warm-up', action='store_true', help="Also load the rent model, as RENT_MODEL_PRELOAD would")
+
+    def handle(self, *args, **options):
+        code = "import django; django.setup()\n" + "".join(f"import {m}\n" for m in options['modules'])
+        if options['warm_up']:
+            code += "from listings.ml_utils import warm_up; warm_up()\n"
+
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'grabit.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            self.stderr.write(result.stderr)
+            return
+
+        timings = []  # (cumulative us, self us, module)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            own, cumulative, module = line[len('import time:'):].split('|')
+            timings.append((int(cumulative), int(own), module.rstrip()))
+
+        total = sum(own for _, own, _ in timings)
+        self.stdout.write(f"{len(timings)} modules imported in {total / 1000:.1f} ms")
+        by_name = {module.strip(): cumulative for cumulative, _, module in timings}
+        for name in options['modules']:
+            if name in by_name:
+                self.stdout.write(f"  {name}: {by_name[name] / 1000:.1f} ms cumulative")
+            else:
+                self.stdout.write(f"  {name}: imported by django.setup()")
+
+        self.stdout.write(f"Slowest {options['top']} imports (cumulative):")
+        for cumulative, own, module in sorted(timings, reverse=True)[:options['top']]:
+            self.stdout.write(f"  {cumulative / 1000:8.1f} ms {own / 1000:8.1f} ms  {module}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from listings.models import BookingStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount every owner's BookingStats from the bookings. Booking saves and bulk status changes keep "
+        "them in sync; run this after writes that skip both (queryset.update() elsewhere, raw SQL)."
+    )
+
+    def handle(self, *args, **options):
+        totals = BookingStats.totals()
+        rows = [
+            BookingStats(user_id=owner_id, pending=pending, confirmed=confirmed, revenue=revenue)
+            for owner_id, (pending, confirmed, revenue) in totals.items()
+        ]
+        with transaction.atomic():
+            BookingStats.objects.bulk_create(
+                rows,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['pending', 'confirmed', 'revenue'],
+            )
+            stale = BookingStats.objects.exclude(user_id__in=list(totals)).update(pending=0, confirmed=0, revenue=0)
+        self.stdout.write(self.style.SUCCESS(f"Recounted booking stats of {len(rows)} owners ({stale} reset to zero)."))
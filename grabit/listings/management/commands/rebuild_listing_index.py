@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from listings.models import ListingIndex, Property, Vehicle
+
+
+class Command(BaseCommand):
+    help = (
+        "Resync the ListingIndex table from every Vehicle and Property. Saves and deletes keep "
+        "it in sync; run this after writes that skip signals (queryset.update(), bulk_create, raw SQL)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        for model in (Vehicle, Property):
+            listing_type = model().get_listing_type()
+            queryset = model.objects.order_by('id')
+
+            indexed, last_id = 0, 0
+            while True:
+                batch = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+                if not batch:
+                    break
+                rows = [
+                    ListingIndex(listing_type=listing_type, listing_id=listing.pk, **ListingIndex.values_for(listing))
+                    for listing in batch
+                ]
+                ListingIndex.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=['listing_type', 'listing_id'],
+                    update_fields=ListingIndex.SYNCED_FIELDS,
+                )
+                indexed += len(batch)
+                last_id = batch[-1].id
+
+            removed, _ = (
+                ListingIndex.objects.filter(listing_type=listing_type)
+                .exclude(listing_id__in=model.objects.values('id'))
+                .delete()
+            )
+            self.stdout.write(f"{listing_type}: {indexed} indexed, {removed} stale rows removed")
+
+        self.stdout.write(self.style.SUCCESS(f"Listing index rebuilt in {time.monotonic() - started:.1f}s."))
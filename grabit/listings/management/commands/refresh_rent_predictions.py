@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from listings import ml_utils
+from listings.models import Property
+from listings.page_cache import LISTINGS_SCOPE, bump
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the stored predicted_rent / is_best_deal of properties. Run after deploying "
+        "a new ml_models/kerala_rent_predictor.pkl; only properties predicted by another model "
+        "version are updated unless --all is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--all', action='store_true', help="Recompute every property")
+
+    def handle(self, *args, **options):
+        version = ml_utils.get_model_version()
+        queryset = Property.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(
+                Q(rent_model_version__isnull=True) | ~Q(rent_model_version=version)
+            )
+        queryset = queryset.only('id', *Property.RENT_INPUT_FIELDS).order_by('id')
+
+        updated, last_id = 0, 0
+        started = time.monotonic()
+        while True:
+            batch = list(queryset.filter(id__gt=last_id)[:options['batch_size']])
+            if not batch:
+                break
+            ml_utils.annotate_predicted_rent(batch)
+            now = timezone.now()  # bulk_update skips auto_now
+            for prop in batch:
+                prop.updated_at = now
+            Property.objects.bulk_update(batch, ['predicted_rent', 'is_best_deal', 'rent_model_version', 'updated_at'])
+            updated += len(batch)
+            last_id = batch[-1].id
+
+        if updated:
+            bump(LISTINGS_SCOPE)  # bulk_update sends no signals; expire cached pages and API ETags
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {updated} properties to model version {version} "
+            f"in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+from listings.image_index import CHUNK_FIELDS, split_hash
+
+
+def fill_hash_chunks(apps, schema_editor):
+    for model_name in ('Vehicle', 'Property'):
+        model = apps.get_model('listings', model_name)
+        rows = list(model.objects.exclude(image_hash__isnull=True).exclude(image_hash=''))
+        for row in rows:
+            for field, chunk in zip(CHUNK_FIELDS, split_hash(row.image_hash)):
+                setattr(row, field, chunk)
+        model.objects.bulk_update(rows, CHUNK_FIELDS, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0003_property_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='phash_chunk_0',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='phash_chunk_1',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='phash_chunk_2',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='phash_chunk_3',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='phash_chunk_0',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='phash_chunk_1',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='phash_chunk_2',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='phash_chunk_3',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_hash_chunks, migrations.RunPython.noop),
+    ]
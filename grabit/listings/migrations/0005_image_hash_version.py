@@ -0,0 +1,32 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+def mark_existing_hashes(apps, schema_editor):
+    # Hashes written before versioning came from full-resolution decodes without
+    # EXIF orientation; record them as version 1 so they can be recomputed
+    for model_name in ('Vehicle', 'Property'):
+        model = apps.get_model('listings', model_name)
+        model.objects.exclude(image_hash__isnull=True).exclude(image_hash='').update(image_hash_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_phash_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='image_hash_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='image_hash_version',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_existing_hashes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:47
+
+import django.db.models.expressions
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_image_hash_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='is_best_deal',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='predicted_rent',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='rent_model_version',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['is_available', 'is_best_deal'], name='property_best_deal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(django.db.models.expressions.CombinedExpression(models.F('price'), '/', models.F('predicted_rent')), name='property_price_ratio_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:53
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_property_predicted_rent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='property',
+            name='property_price_ratio_idx',
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['is_available', 'id'], name='property_available_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Cast('price', models.FloatField()), '/', django.db.models.functions.comparison.Cast('predicted_rent', models.FloatField())), name='property_price_ratio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['is_available', 'id'], name='vehicle_available_id_idx'),
+        ),
+    ]
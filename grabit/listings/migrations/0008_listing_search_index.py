@@ -0,0 +1,99 @@
+"""
+Search indexes used by listings/search.py.
+
+PostgreSQL: a generated ``search_vector`` tsvector column (weighted title >
+place > description) with a GIN index, and pg_trgm GIN indexes on the place
+columns. SQLite: external-content FTS5 tables kept in sync by triggers.
+Other backends get nothing and search falls back to icontains.
+"""
+from django.db import migrations
+
+# table: (weight A, weight B, weight C columns), trigram-indexed place columns
+TABLES = {
+    'listings_vehicle': ((['title'], ['location', 'brand', 'model'], ['description']), ['location']),
+    'listings_property': ((['title'], ['location', 'address'], ['description']), ['location', 'address']),
+}
+
+
+def _postgres_forward(table, weighted, places):
+    parts = []
+    for weight, columns in zip('ABC', weighted):
+        text = " || ' ' || ".join(f"coalesce({column}, '')" for column in columns)
+        parts.append(f"setweight(to_tsvector('english', {text}), '{weight}')")
+    statements = [
+        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS ({' || '.join(parts)}) STORED",
+        f"CREATE INDEX {table}_search_idx ON {table} USING GIN (search_vector)",
+    ]
+    statements += [
+        f"CREATE INDEX {table}_{column}_trgm_idx ON {table} USING GIN ({column} gin_trgm_ops)"
+        for column in places
+    ]
+    return statements
+
+
+def _postgres_reverse(table, weighted, places):
+    statements = [f"DROP INDEX IF EXISTS {table}_{column}_trgm_idx" for column in places]
+    statements.append(f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector")
+    return statements
+
+
+def _sqlite_forward(table, weighted, places):
+    fts = f'{table}_fts'
+    columns = [column for group in weighted for column in group]
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({names}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES('rebuild')",
+    ]
+
+
+def _sqlite_reverse(table, weighted, places):
+    fts = f'{table}_fts'
+    return [f"DROP TRIGGER IF EXISTS {fts}_{suffix}" for suffix in ('ai', 'ad', 'au')] + [
+        f"DROP TABLE IF EXISTS {fts}",
+    ]
+
+
+BUILDERS = {
+    'postgresql': (_postgres_forward, _postgres_reverse),
+    'sqlite': (_sqlite_forward, _sqlite_reverse),
+}
+
+
+def _run(schema_editor, direction):
+    builders = BUILDERS.get(schema_editor.connection.vendor)
+    if builders is None:
+        return
+    if schema_editor.connection.vendor == 'postgresql' and direction == 0:
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table, (weighted, places) in TABLES.items():
+        for statement in builders[direction](table, weighted, places):
+            schema_editor.execute(statement)
+
+
+def create_search_indexes(apps, schema_editor):
+    _run(schema_editor, 0)
+
+
+def drop_search_indexes(apps, schema_editor):
+    _run(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_listing_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
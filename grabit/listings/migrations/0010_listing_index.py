@@ -0,0 +1,70 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_listing_index(apps, schema_editor):
+    ListingIndex = apps.get_model('listings', 'ListingIndex')
+    for listing_type, model_name, price_field in (('vehicle', 'Vehicle', 'price_per_day'), ('property', 'Property', 'price')):
+        model = apps.get_model('listings', model_name)
+        rows = [
+            ListingIndex(
+                listing_type=listing_type,
+                listing_id=listing.pk,
+                owner_id=listing.owner_id,
+                title=listing.title,
+                summary=(listing.description or '')[:200],
+                price=getattr(listing, price_field),
+                location=listing.location,
+                thumbnail=listing.image.name if listing.image else None,
+                created_at=listing.created_at,
+                is_available=listing.is_available,
+            )
+            for listing in model.objects.order_by('id').iterator(chunk_size=1000)
+        ]
+        ListingIndex.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_facet_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ListingIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_type', models.CharField(choices=[('vehicle', 'Vehicle'), ('property', 'Property')], max_length=10)),
+                ('listing_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('summary', models.CharField(blank=True, max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('location', models.CharField(max_length=255)),
+                ('thumbnail', models.ImageField(blank=True, max_length=255, null=True, upload_to='')),
+                ('created_at', models.DateTimeField()),
+                ('is_available', models.BooleanField(default=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_available', '-created_at', '-id'], name='listing_index_recent_idx'), models.Index(fields=['is_available', 'listing_type', '-created_at', '-id'], name='listing_index_type_idx'), models.Index(fields=['is_available', 'price', 'id'], name='listing_index_price_idx')],
+                'constraints': [models.UniqueConstraint(fields=('listing_type', 'listing_id'), name='listing_index_unique_listing')],
+            },
+        ),
+        migrations.RunPython(fill_listing_index, migrations.RunPython.noop),
+    ]
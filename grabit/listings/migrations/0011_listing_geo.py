@@ -0,0 +1,56 @@
+# Generated by Django 5.1.6 on 2026-10-18 17:59
+
+from django.db import migrations, models
+
+
+def geocode_listings(apps, schema_editor):
+    from listings.geo import set_location_point
+
+    for model_name, text_fields in (('Vehicle', ['location']), ('Property', ['address', 'location'])):
+        model = apps.get_model('listings', model_name)
+        batch = []
+        for listing in model.objects.only('id', *text_fields).order_by('id').iterator(chunk_size=1000):
+            if set_location_point(listing, *(getattr(listing, field) for field in text_fields)):
+                batch.append(listing)
+        model.objects.bulk_update(batch, ['latitude', 'longitude', 'geo_cell'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0010_listing_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='property',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='geo_cell',
+            field=models.CharField(blank=True, db_index=True, max_length=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(geocode_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+"""
+GiST indexes for the "free between these dates" search filter on PostgreSQL.
+
+Each index covers (listing id, daterange(start_date, end_date, '[]')) over
+confirmed bookings, which lets the NOT EXISTS probe in
+availability.available_between use the && overlap operator. btree_gist
+provides the GiST operator class for the integer column. Other backends use
+the booking_<type>_avail_idx b-tree indexes from 0013.
+"""
+from django.db import migrations
+
+COLUMNS = ('vehicle_id', 'property_id')
+
+
+def _index(column):
+    return f"listings_booking_{column}_period_gist"
+
+
+def create_period_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    for column in COLUMNS:
+        schema_editor.execute(
+            f"CREATE INDEX {_index(column)} ON listings_booking "
+            f"USING GIST ({column}, daterange(start_date, end_date, '[]')) "
+            f"WHERE status = 'confirmed' AND {column} IS NOT NULL"
+        )
+
+
+def drop_period_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in COLUMNS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {_index(column)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_booking_availability_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_period_indexes, drop_period_indexes),
+    ]
@@ -0,0 +1,75 @@
+"""
+Confirmed bookings of one listing may not overlap (see bookings.py).
+
+Existing overlapping confirmed bookings are first sent back to pending, so
+their owners can decide again; the earliest-starting booking keeps its dates.
+PostgreSQL then gets one exclusion constraint per listing column:
+
+    EXCLUDE USING GIST (vehicle_id WITH =, daterange(start_date, end_date, '[]') WITH &&)
+    WHERE (status = 'confirmed')
+
+The constraints' GiST indexes replace the ones from 0014 for the
+available_between filter.
+"""
+from django.db import migrations
+
+COLUMNS = ('vehicle_id', 'property_id')
+
+
+def _constraint(column):
+    return f"booking_{column.removesuffix('_id')}_no_overlap"
+
+
+def demote_overlapping(apps, schema_editor):
+    Booking = apps.get_model('listings', 'Booking')
+    for column in COLUMNS:
+        confirmed = (
+            Booking.objects.filter(status='confirmed', **{f'{column}__isnull': False})
+            .order_by(column, 'start_date', 'id')
+            .values_list('id', column, 'start_date', 'end_date')
+        )
+        demoted, listing, booked_until = [], None, None
+        for booking_id, listing_id, start_date, end_date in confirmed.iterator():
+            if listing_id == listing and start_date <= booked_until:
+                demoted.append(booking_id)
+            elif listing_id == listing:
+                booked_until = max(booked_until, end_date)
+            else:
+                listing, booked_until = listing_id, end_date
+        Booking.objects.filter(id__in=demoted).update(status='pending')
+
+
+def create_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in COLUMNS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS listings_booking_{column}_period_gist")
+        schema_editor.execute(
+            f"ALTER TABLE listings_booking ADD CONSTRAINT {_constraint(column)} "
+            f"EXCLUDE USING GIST ({column} WITH =, daterange(start_date, end_date, '[]') WITH &&) "
+            f"WHERE (status = 'confirmed')"
+        )
+
+
+def drop_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in COLUMNS:
+        schema_editor.execute(f"ALTER TABLE listings_booking DROP CONSTRAINT IF EXISTS {_constraint(column)}")
+        schema_editor.execute(
+            f"CREATE INDEX listings_booking_{column}_period_gist ON listings_booking "
+            f"USING GIST ({column}, daterange(start_date, end_date, '[]')) "
+            f"WHERE status = 'confirmed' AND {column} IS NOT NULL"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_booking_period_gist'),
+    ]
+
+    operations = [
+        migrations.RunPython(demote_overlapping, migrations.RunPython.noop),
+        migrations.RunPython(create_constraints, drop_constraints),
+    ]
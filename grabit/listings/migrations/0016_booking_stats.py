@@ -0,0 +1,50 @@
+# Generated by Django 5.1.6 on 2026-10-18 18:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_booking_stats(apps, schema_editor):
+    Booking = apps.get_model('listings', 'Booking')
+    BookingStats = apps.get_model('listings', 'BookingStats')
+    stats = {}
+    for owner_field in ('vehicle__owner', 'property__owner'):
+        rows = (
+            Booking.objects.filter(**{f'{owner_field}__isnull': False})
+            .values(owner_field)
+            .annotate(
+                pending=Count('id', filter=Q(status='pending')),
+                confirmed=Count('id', filter=Q(status='confirmed')),
+                revenue=Sum('total_price', filter=Q(status='confirmed')),
+            )
+            .order_by()
+        )
+        for row in rows:
+            owner_stats = stats.setdefault(row[owner_field], BookingStats(user_id=row[owner_field]))
+            owner_stats.pending += row['pending']
+            owner_stats.confirmed += row['confirmed']
+            owner_stats.revenue += row['revenue'] or 0
+    BookingStats.objects.bulk_create(stats.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('listings', '0015_booking_no_overlap'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='booking_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending', models.IntegerField(default=0)),
+                ('confirmed', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.RunPython(fill_booking_stats, migrations.RunPython.noop),
+    ]
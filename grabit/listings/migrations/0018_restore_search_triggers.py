@@ -0,0 +1,37 @@
+"""
+Put back the SQLite FTS5 sync triggers from 0008.
+
+SQLite can't alter most columns in place, so AddField/AlterField on the
+listing tables (0010-0012) rebuilt them, and dropping the old table dropped
+its triggers with it: listings saved since then were missing from search.
+The FTS tables and triggers are recreated and the index rebuilt from the
+listing tables. Later rebuilds are repaired after each migrate by
+search.restore_sqlite_search. PostgreSQL's generated column is carried
+along by ALTER TABLE and needs nothing.
+"""
+from importlib import import_module
+
+from django.db import migrations
+
+search_index = import_module('listings.migrations.0008_listing_search_index')
+
+
+def restore_sqlite_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, (weighted, places) in search_index.TABLES.items():
+        for statement in search_index._sqlite_reverse(table, weighted, places):
+            schema_editor.execute(statement)
+        for statement in search_index._sqlite_forward(table, weighted, places):
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0017_outbox_message'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_sqlite_search, migrations.RunPython.noop),
+    ]
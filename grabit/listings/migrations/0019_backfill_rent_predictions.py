@@ -0,0 +1,40 @@
+"""
+Predict the rent of properties created before 0006 added the prediction
+columns, which left them without one (and out of the "best deal" filter).
+The same as ``manage.py refresh_rent_predictions``, limited to those rows;
+without the model file the backup predictor fills them in, and the command
+replaces those predictions once the model is deployed.
+"""
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def backfill_predictions(apps, schema_editor):
+    from listings import ml_utils
+
+    Property = apps.get_model('listings', 'Property')
+    queryset = (
+        Property.objects.filter(rent_model_version__isnull=True)
+        .only('id', 'address', 'bedrooms', 'size', 'price')
+        .order_by('id')
+    )
+    last_id = 0
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        ml_utils.annotate_predicted_rent(batch)
+        Property.objects.bulk_update(batch, ['predicted_rent', 'is_best_deal', 'rent_model_version'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0018_restore_search_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_predictions, migrations.RunPython.noop, elidable=True),
+    ]
@@ -1,43 +1,277 @@
 import os
-import joblib
-import pandas as pd
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
 from django.conf import settings
 import numpy as np
+from .rent_model import CompiledRentModel
+
+logger = logging.getLogger(__name__)
 
 MODEL_DIR = os.path.join(settings.BASE_DIR, 'ml_models')
 MODEL_PATH = os.path.join(MODEL_DIR, 'kerala_rent_predictor.pkl')
+# NumPy-only export of MODEL_PATH, written by `manage.py export_rent_model`
+COMPILED_MODEL_PATH = os.path.join(MODEL_DIR, 'kerala_rent_predictor.npz')
+USE_COMPILED_MODEL = getattr(settings, 'RENT_MODEL_COMPILED', True)
+# Version recorded for predictions made by backup_predict
+BACKUP_VERSION = 'backup'
+# joblib memory-maps the arrays it stored unpickled, so forked workers share those pages
+MODEL_MMAP_MODE = getattr(settings, 'RENT_MODEL_MMAP_MODE', 'r')
+
+LOCATION_FACTORS = {
+    'Kochi': 1.2, 'Trivandrum': 1.0, 'Munnar': 1.5,
+    'Alappuzha': 1.1, 'Thrissur': 0.9
+}
 
 # Backup prediction formula
 def backup_predict(location, bedrooms, size):
-    location_factors = {
-        'Kochi': 1.2, 'Trivandrum': 1.0, 'Munnar': 1.5,
-        'Alappuzha': 1.1, 'Thrissur': 0.9
-    }
     base_price = 1200 * bedrooms
-    location_factor = location_factors.get(location, 1.0)
+    location_factor = LOCATION_FACTORS.get(location, 1.0)
     size_factor = np.log1p(size/500)
     return base_price * location_factor * size_factor
 
-# Load model with verification
-try:
-    model = joblib.load(MODEL_PATH)
-    # Verify it's a proper sklearn model
-    if not hasattr(model, 'predict'):
-        raise ValueError("Invalid model object")
-except Exception as e:
-    print(f"⚠️ Model loading failed: {e}. Using backup predictor.")
-    model = None
+def backup_predict_batch(locations, bedrooms, sizes):
+    """Vectorized backup_predict over equal-length sequences."""
+    location_factor = np.array([LOCATION_FACTORS.get(loc, 1.0) for loc in locations], dtype=float)
+    base_price = 1200 * np.asarray(bedrooms, dtype=float)
+    size_factor = np.log1p(np.asarray(sizes, dtype=float) / 500)
+    return base_price * location_factor * size_factor
 
-def predict_rent(location, bedrooms, size):
+def city_from_address(address):
+    """Last comma-separated part of an address, e.g. '12 MG Road, Kochi' -> 'Kochi'."""
+    return (address or '').split(',')[-1].strip()
+
+def file_version(path):
+    """Short content hash of the model file, stored with every saved prediction."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+_model = None
+_model_version = None
+_model_lock = threading.Lock()
+
+def load_compiled_model():
+    """The exported NumPy model, if present and built from the current MODEL_PATH."""
+    if not (USE_COMPILED_MODEL and os.path.exists(COMPILED_MODEL_PATH)):
+        return None
     try:
-        if model:
-            input_data = pd.DataFrame({
-                'location': [location],
-                'bedrooms': [bedrooms],
-                'size': [size]
-            })
-            return float(model.predict(input_data)[0])
-        return backup_predict(location, bedrooms, size)
+        compiled = CompiledRentModel.load(COMPILED_MODEL_PATH)
     except Exception as e:
-        print(f"Prediction error for {location}: {str(e)}")
-        return backup_predict(location, bedrooms, size)
\ No newline at end of file
+        logger.warning("Compiled model loading failed: %s", e)
+        return None
+    if os.path.exists(MODEL_PATH) and compiled.source_version != file_version(MODEL_PATH):
+        logger.warning("Compiled model is out of date; run `manage.py export_rent_model`.")
+        return None
+    return compiled
+
+def load_model():
+    """Load the model with verification. Returns ``(model, version)``; model is None on failure."""
+    compiled = load_compiled_model()
+    if compiled is not None:
+        return compiled, compiled.source_version
+    try:
+        import joblib
+        model = joblib.load(MODEL_PATH, mmap_mode=MODEL_MMAP_MODE)
+        # Verify it's a proper sklearn model
+        if not hasattr(model, 'predict'):
+            raise ValueError("Invalid model object")
+        return model, file_version(MODEL_PATH)
+    except Exception as e:
+        logger.warning("Model loading failed: %s. Using backup predictor.", e)
+        return None, BACKUP_VERSION
+
+def get_model():
+    """The rent model, loaded on first use (sklearn and pandas are only imported then)."""
+    global _model, _model_version
+    if _model_version is None:
+        with _model_lock:
+            if _model_version is None:
+                _model, _model_version = load_model()
+    return _model
+
+def get_model_version():
+    get_model()
+    return _model_version
+
+def loaded_model_version():
+    """Version of the model if this process has loaded it already, else None. Never loads it."""
+    return _model_version
+
+def warm_up():
+    """
+    Load the model and run one prediction so the first request doesn't pay for it.
+    Call before forking workers (e.g. gunicorn --preload) to share the loaded model.
+    """
+    get_model()
+    predict_rent_batch([('Kochi', 2, 1000)])
+    return get_model_version()
+
+def model_predict(model, locations, bedrooms, sizes):
+    """Raw model output for equal-length input sequences."""
+    if isinstance(model, CompiledRentModel):
+        return model.predict(locations, bedrooms, sizes)
+    import pandas as pd
+    input_data = pd.DataFrame({
+        'location': locations,
+        'bedrooms': bedrooms,
+        'size': sizes
+    })
+    return model.predict(input_data)
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions with a TTL, keyed on normalized inputs plus
+    the model version. When ``shared_alias`` names a Django cache, misses fall
+    through to it so workers share results.
+    """
+
+    def __init__(self, maxsize=4096, ttl=3600, shared_alias=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared_alias = shared_alias
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.shared_hits = 0
+
+    @staticmethod
+    def key(version, location, bedrooms, size):
+        # hashed: locations are free text, and spaces or non-ASCII aren't valid memcached keys
+        inputs = f"{location}\x00{float(bedrooms):g}\x00{float(size):g}"
+        return f"rent:{version}:{hashlib.sha1(inputs.encode()).hexdigest()}"
+
+    def _shared(self):
+        if not self.shared_alias:
+            return None
+        from django.core.cache import caches
+        return caches[self.shared_alias]
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires = entry
+                if expires < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+
+        missing = [key for key in keys if key not in found]
+        shared = self._shared()
+        if missing and shared is not None:
+            try:
+                from_shared = shared.get_many(missing)
+            except Exception as e:  # the shared cache is down: predict instead
+                logger.warning("Shared prediction cache unavailable: %s", e)
+                from_shared = {}
+            self.shared_hits += len(from_shared)
+            self._store_local(from_shared)
+            found.update(from_shared)
+
+        self.hits += sum(1 for key in keys if key in found)
+        self.misses += sum(1 for key in keys if key not in found)
+        return found
+
+    def set_many(self, values):
+        self._store_local(values)
+        shared = self._shared()
+        if shared is not None:
+            try:
+                shared.set_many(values, timeout=self.ttl)
+            except Exception as e:
+                logger.warning("Shared prediction cache unavailable: %s", e)
+
+    def _store_local(self, values):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.shared_hits = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared_hits': self.shared_hits,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+prediction_cache = PredictionCache(
+    maxsize=getattr(settings, 'RENT_PREDICTION_CACHE_SIZE', 4096),
+    ttl=getattr(settings, 'RENT_PREDICTION_CACHE_TTL', 3600),
+    shared_alias=getattr(settings, 'RENT_PREDICTION_CACHE_ALIAS', None),
+)
+
+def normalize_inputs(location, bedrooms, size):
+    return str(location or '').strip(), bedrooms, size
+
+def predict_rent(location, bedrooms, size):
+    return predict_rent_batch([(location, bedrooms, size)])[0]
+
+def predict_rent_batch(rows):
+    """
+    Predict rent for many (location, bedrooms, size) tuples with a single
+    model call for whatever isn't cached. Returns a list of floats in order.
+    """
+    rows = [normalize_inputs(*row) for row in rows]
+    if not rows:
+        return []
+    model = get_model()
+    version = get_model_version()
+    keys = [PredictionCache.key(version, *row) for row in rows]
+    cached = prediction_cache.get_many(keys)
+
+    # dict: repeated inputs within the batch are predicted once
+    todo = list({key: row for key, row in zip(keys, rows) if key not in cached}.items())
+    if todo:
+        locations, bedrooms, sizes = zip(*(row for _, row in todo))
+        try:
+            if model:
+                predictions = [float(p) for p in model_predict(model, locations, bedrooms, sizes)]
+            else:
+                predictions = backup_predict_batch(locations, bedrooms, sizes).tolist()
+            prediction_cache.set_many({key: p for (key, _), p in zip(todo, predictions)})
+        except Exception as e:
+            logger.exception("Prediction error for %d rows", len(todo))
+            # not cached, so the model is retried next time
+            predictions = backup_predict_batch(locations, bedrooms, sizes).tolist()
+        cached = {**cached, **{key: p for (key, _), p in zip(todo, predictions)}}
+    return [cached[key] for key in keys]
+
+def annotate_predicted_rent(properties):
+    """
+    Set predicted_rent, is_best_deal and rent_model_version on Property
+    instances (not saved) using one batch prediction.
+    """
+    properties = list(properties)
+    version = get_model_version()
+    predictions = predict_rent_batch(
+        (city_from_address(prop.address), prop.bedrooms, prop.size) for prop in properties
+    )
+    for prop, predicted in zip(properties, predictions):
+        prop.predicted_rent = round(Decimal(predicted), 2) if predicted else None
+        prop.is_best_deal = bool(predicted) and prop.price <= prop.predicted_rent
+        prop.rent_model_version = version
+    return properties
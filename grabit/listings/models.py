@@ -1,8 +1,16 @@
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Q
-import imagehash
-from PIL import Image
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+from . import ml_utils
+from .geo import set_location_point
+from .image_index import set_image_hash
+from .image_pipeline import HASH_VERSION, hash_image_file, image_needs_hash, remember_image
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -25,15 +33,49 @@ class Vehicle(models.Model):
     location = models.CharField(max_length=255)
     image = models.ImageField(upload_to='vehicles/', blank=True, null=True)
     is_available = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)  # listing version for API ETag/Last-Modified
+    # Resolved from the location text against the offline gazetteer (see geo.py)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    geo_cell = models.CharField(max_length=12, blank=True, null=True, db_index=True)
 
     image_hash = models.CharField(max_length=100, blank=True, null=True)  # ✅ NEW field added
+    # 16-bit slices of image_hash, indexed for near-duplicate lookups (see image_index)
+    phash_chunk_0 = models.IntegerField(blank=True, null=True, db_index=True)
+    phash_chunk_1 = models.IntegerField(blank=True, null=True, db_index=True)
+    phash_chunk_2 = models.IntegerField(blank=True, null=True, db_index=True)
+    phash_chunk_3 = models.IntegerField(blank=True, null=True, db_index=True)
+    image_hash_version = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the listings feed
+            models.Index(fields=['is_available', 'id'], name='vehicle_available_id_idx'),
+            # facet filters (see facets.py): brand + price is the most common combination
+            models.Index(fields=['is_available', 'brand', 'price_per_day'], name='vehicle_brand_price_idx'),
+            models.Index(fields=['is_available', 'price_per_day'], name='vehicle_price_idx'),
+            models.Index(fields=['is_available', 'year'], name='vehicle_year_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        remember_image(instance)
+        return instance
 
     def save(self, *args, **kwargs):
-        # generate image hash when saving
-        if self.image:
-            img = Image.open(self.image)
-            self.image_hash = str(imagehash.phash(img))
+        # hash only when the image file changed (uploads are hashed by ingest_upload)
+        if not self.image:
+            set_image_hash(self, None)
+        elif image_needs_hash(self):
+            set_image_hash(self, hash_image_file(self.image), HASH_VERSION)
+        self.geocode()
         super().save(*args, **kwargs)
+        remember_image(self)
+
+    def geocode(self):
+        return set_location_point(self, self.location)
 
 
     def get_listing_type(self):
@@ -57,15 +99,84 @@ class Property(models.Model):
     size = models.IntegerField(help_text="Size in square feet")
     image = models.ImageField(upload_to='properties/', blank=True, null=True)
     is_available = models.BooleanField(default=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)  # listing version for API ETag/Last-Modified
+    # Resolved from the location text against the offline gazetteer (see geo.py)
+    latitude = models.FloatField(blank=True, null=True)
+    longitude = models.FloatField(blank=True, null=True)
+    geo_cell = models.CharField(max_length=12, blank=True, null=True, db_index=True)
 
     image_hash = models.CharField(max_length=100, blank=True, null=True)  # ✅ NEW field added
+    # 16-bit slices of image_hash, indexed for near-duplicate lookups (see image_index)
+    phash_chunk_0 = models.IntegerField(blank=True, null=True, db_index=True)
+    phash_chunk_1 = models.IntegerField(blank=True, null=True, db_index=True)
+    phash_chunk_2 = models.IntegerField(blank=True, null=True, db_index=True)
+    phash_chunk_3 = models.IntegerField(blank=True, null=True, db_index=True)
+    image_hash_version = models.PositiveSmallIntegerField(blank=True, null=True)
+
+    # Stored rent prediction, refreshed on save and by `manage.py refresh_rent_predictions`
+    predicted_rent = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    is_best_deal = models.BooleanField(default=False)
+    rent_model_version = models.CharField(max_length=32, blank=True, null=True)
+
+    RENT_INPUT_FIELDS = ('address', 'bedrooms', 'size', 'price')
+
+    class Meta:
+        indexes = [
+            # keyset pagination of the listings feed
+            models.Index(fields=['is_available', 'id'], name='property_available_id_idx'),
+            models.Index(fields=['is_available', 'is_best_deal'], name='property_best_deal_idx'),
+            models.Index(Cast('price', models.FloatField()) / Cast('predicted_rent', models.FloatField()), name='property_price_ratio_idx'),
+            # facet filters (see facets.py): bedrooms + price is the most common combination
+            models.Index(fields=['is_available', 'bedrooms', 'price'], name='property_beds_price_idx'),
+            models.Index(fields=['is_available', 'price'], name='property_price_idx'),
+            models.Index(fields=['is_available', 'bathrooms', 'size'], name='property_baths_size_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        remember_image(instance)
+        instance._rent_inputs = instance.rent_inputs()
+        return instance
+
+    def rent_inputs(self):
+        if self.get_deferred_fields().intersection(self.RENT_INPUT_FIELDS):
+            return None
+        return tuple(getattr(self, field) for field in self.RENT_INPUT_FIELDS)
 
     def save(self, *args, **kwargs):
-        # generate image hash when saving
-        if self.image:
-            img = Image.open(self.image)
-            self.image_hash = str(imagehash.phash(img))
+        # hash only when the image file changed (uploads are hashed by ingest_upload)
+        if not self.image:
+            set_image_hash(self, None)
+        elif image_needs_hash(self):
+            set_image_hash(self, hash_image_file(self.image), HASH_VERSION)
+        self.geocode()
+
+        # predict only when the inputs or the model changed; saves that don't
+        # need a prediction never load the model (new models are rolled out
+        # to all rows by `manage.py refresh_rent_predictions`)
+        inputs = self.rent_inputs()
+        loaded_version = ml_utils.loaded_model_version()
+        if inputs is not None and (
+            inputs != getattr(self, '_rent_inputs', None)
+            or self.rent_model_version is None
+            or (loaded_version is not None and self.rent_model_version != loaded_version)
+        ):
+            ml_utils.annotate_predicted_rent([self])
         super().save(*args, **kwargs)
+        remember_image(self)
+        self._rent_inputs = self.rent_inputs()
+
+    def geocode(self):
+        # the address usually names the town more precisely than location
+        return set_location_point(self, self.address, self.location)
+
+    @classmethod
+    def price_ratio(cls):
+        """Expression matching property_price_ratio_idx, for ordering by how far below prediction a rent is."""
+        # float division: SQLite would otherwise divide whole-number prices as integers
+        return Cast('price', models.FloatField()) / Cast('predicted_rent', models.FloatField())
 
     def get_listing_type(self):
         return "property"
@@ -73,6 +184,70 @@ class Property(models.Model):
     def __str__(self):
         return f"{self.title} - For Rent"
 
+class ListingIndex(models.Model):
+    """
+    One row per Vehicle/Property with what cards, mixed feeds and sorting
+    need, so they are a single indexed query. Kept in sync by the signals in
+    signals.py; `manage.py rebuild_listing_index` resyncs after bulk writes.
+    """
+    TYPE_CHOICES = [
+        ('vehicle', 'Vehicle'),
+        ('property', 'Property'),
+    ]
+    SUMMARY_LENGTH = 200
+
+    listing_type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    listing_id = models.BigIntegerField()
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    title = models.CharField(max_length=255)
+    summary = models.CharField(max_length=SUMMARY_LENGTH, blank=True)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    location = models.CharField(max_length=255)
+    thumbnail = models.ImageField(max_length=255, blank=True, null=True)
+    created_at = models.DateTimeField()
+    is_available = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['listing_type', 'listing_id'], name='listing_index_unique_listing'),
+        ]
+        indexes = [
+            # newest-first mixed feed, keyset-paginated on (created_at, id)
+            models.Index(fields=['is_available', '-created_at', '-id'], name='listing_index_recent_idx'),
+            models.Index(fields=['is_available', 'listing_type', '-created_at', '-id'], name='listing_index_type_idx'),
+            models.Index(fields=['is_available', 'price', 'id'], name='listing_index_price_idx'),
+        ]
+
+    SYNCED_FIELDS = ['owner', 'title', 'summary', 'price', 'location', 'thumbnail', 'created_at', 'is_available']
+
+    @classmethod
+    def values_for(cls, listing):
+        price = listing.price_per_day if isinstance(listing, Vehicle) else listing.price
+        return {
+            'owner_id': listing.owner_id,
+            'title': listing.title,
+            'summary': (listing.description or '')[:cls.SUMMARY_LENGTH],
+            'price': price,
+            'location': listing.location,
+            'thumbnail': listing.image.name if listing.image else None,
+            'created_at': listing.created_at,
+            'is_available': listing.is_available,
+        }
+
+    @classmethod
+    def sync(cls, listing):
+        cls.objects.update_or_create(
+            listing_type=listing.get_listing_type(), listing_id=listing.pk, defaults=cls.values_for(listing),
+        )
+
+    @classmethod
+    def remove(cls, listing):
+        cls.objects.filter(listing_type=listing.get_listing_type(), listing_id=listing.pk).delete()
+
+    def __str__(self):
+        return f"{self.listing_type} #{self.listing_id}: {self.title}"
+
+
 # 4️⃣ Booking Model (For Vehicle & Property Rentals)
 class Booking(models.Model):
     STATUS_CHOICES = [
@@ -89,6 +264,32 @@ class Booking(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
 
+    class Meta:
+        indexes = [
+            # availability calendar / overlap checks: one range scan per listing
+            models.Index(fields=['vehicle', 'status', 'start_date', 'end_date'], name='booking_vehicle_avail_idx'),
+            models.Index(fields=['property', 'status', 'start_date', 'end_date'], name='booking_property_avail_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._counted = instance.counted_state()  # what BookingStats has counted so far
+        return instance
+
+    def counted_state(self):
+        """(status, total_price) for BookingStats, or None if not loaded."""
+        if 'status' in self.__dict__ and 'total_price' in self.__dict__:
+            return self.status, self.total_price
+        return None
+
+    def listing_owner_id(self):
+        """Owner of the booked listing, without loading the listing if it isn't already."""
+        field, model = ('vehicle', Vehicle) if self.vehicle_id else ('property', Property)
+        if field in self._state.fields_cache:
+            return getattr(self, field).owner_id
+        return model.objects.filter(pk=getattr(self, f'{field}_id')).values_list('owner_id', flat=True).first()
+
     def is_available(self):
         """Check if the listing is available for booking."""
         overlapping_bookings = Booking.objects.filter(
@@ -99,3 +300,107 @@ class Booking(models.Model):
         )
         return not overlapping_bookings.exists()
     
+
+
+class BookingStats(models.Model):
+    """
+    Dashboard counters of the bookings received on a user's listings. Kept in
+    sync by the Booking signals in signals.py and by bookings.bulk_set_status;
+    `manage.py rebuild_booking_stats` recounts after other bulk writes.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='booking_stats')
+    pending = models.IntegerField(default=0)
+    confirmed = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)  # total of confirmed bookings
+
+    @staticmethod
+    def counts(status, total_price):
+        """(pending, confirmed, revenue) one booking adds."""
+        return int(status == 'pending'), int(status == 'confirmed'), total_price if status == 'confirmed' else 0
+
+    @classmethod
+    def apply(cls, changes):
+        """
+        Apply ``(owner id, old state, new state)`` changes, with states from
+        Booking.counted_state() and None for no booking (created/deleted).
+        """
+        deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+        for owner_id, old, new in changes:
+            if owner_id is None or old == new:
+                continue
+            delta = deltas[owner_id]
+            for sign, state in ((-1, old), (1, new)):
+                if state is not None:
+                    for i, value in enumerate(cls.counts(*state)):
+                        delta[i] += sign * value
+
+        deltas = {owner_id: delta for owner_id, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        cls.objects.bulk_create([cls(user_id=owner_id) for owner_id in deltas], ignore_conflicts=True)
+        for owner_id, (pending, confirmed, revenue) in deltas.items():
+            cls.objects.filter(user_id=owner_id).update(
+                pending=F('pending') + pending, confirmed=F('confirmed') + confirmed, revenue=F('revenue') + revenue,
+            )
+
+    @classmethod
+    def totals(cls):
+        """{owner id: (pending, confirmed, revenue)} counted from the bookings."""
+        totals = defaultdict(lambda: [0, 0, Decimal(0)])
+        for owner_field in ('vehicle__owner', 'property__owner'):
+            rows = (
+                Booking.objects.filter(**{f'{owner_field}__isnull': False})
+                .values(owner_field)
+                .annotate(
+                    pending=Count('id', filter=Q(status='pending')),
+                    confirmed=Count('id', filter=Q(status='confirmed')),
+                    revenue=Sum('total_price', filter=Q(status='confirmed')),
+                )
+                .order_by()
+            )
+            for row in rows:
+                total = totals[row[owner_field]]
+                total[0] += row['pending']
+                total[1] += row['confirmed']
+                total[2] += row['revenue'] or 0
+        return totals
+
+    def __str__(self):
+        return f"{self.user}: {self.pending} pending, {self.confirmed} confirmed, {self.revenue} revenue"
+
+
+def _idempotency_key():
+    return uuid.uuid4().hex
+
+
+class OutboxMessage(models.Model):
+    """
+    A notification written in the same transaction as the change it reports,
+    delivered later by `manage.py drain_outbox` (see outbox.py).
+    """
+    KIND_CHOICES = [
+        ('websocket', 'WebSocket push'),
+        ('email', 'Email'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    payload = models.JSONField()
+    # sent along with the notification (e.g. as the email Message-ID) so
+    # receivers can drop the duplicates that at-least-once delivery allows
+    idempotency_key = models.CharField(max_length=32, unique=True, default=_idempotency_key, editable=False)
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)  # not before: pushed back after failures
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_by = models.CharField(max_length=32, blank=True)
+    locked_until = models.DateTimeField(blank=True, null=True)  # a worker's lease on the row
+    sent_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # what the worker polls: unsent rows, oldest first
+            models.Index(fields=['available_at', 'id'], condition=Q(sent_at__isnull=True), name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({'sent' if self.sent_at else f'{self.attempts} attempts'})"
@@ -0,0 +1,196 @@
+"""
+Transactional outbox for booking notifications.
+
+Booking changes don't push WebSocket messages or send email themselves.
+They ``enqueue`` OutboxMessage rows in the same transaction as the status
+change, so a notification exists exactly when the change was committed and
+requests spend no time on channel-layer or SMTP I/O. ``manage.py
+drain_outbox`` delivers the rows:
+
+- claim: a batch of due rows is leased to the worker (``locked_until``).
+  Several workers can run, and rows leased by a worker that died become due
+  again when the lease runs out;
+- deliver: push rows only name bookings. Their messages are built from the
+  bookings' statuses at delivery time, one per group for the batch, and go
+  out concurrently in one event loop. Emails share one SMTP connection and
+  carry the row's idempotency key as their Message-ID;
+- record: delivered rows get ``sent_at``. Failed rows are retried with
+  exponential backoff, up to OUTBOX_MAX_ATTEMPTS.
+
+Delivery is at least once: a worker stopped between sending and recording
+sends that batch again. A repeated or retried push sends the status as it is
+then, never a superseded one; for email the Message-ID lets mail systems
+drop the duplicate. With several workers, pushes for one booking read
+moments apart can still arrive out of order.
+
+Only a channel layer shared between processes (Redis) lets the worker reach
+the consumers of the ASGI server. With the in-memory layer (the default
+settings) ``push`` sends from the web process once the transaction commits
+instead, and nothing is queued.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Booking, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'OUTBOX_BATCH_SIZE', 100)
+MAX_ATTEMPTS = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 8)
+LEASE_SECONDS = getattr(settings, 'OUTBOX_LEASE_SECONDS', 120)
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+MAIL_DOMAIN = getattr(settings, 'OUTBOX_MAIL_DOMAIN', 'grabit.local')
+
+EMAIL_SUBJECTS = {
+    'pending': "New booking request for {title}",
+    'confirmed': "Your booking of {title} is confirmed",
+    'canceled': "Booking of {title} canceled",
+}
+
+
+def enqueue(messages):
+    """Write ``(kind, payload)`` messages. Call inside the transaction making the change."""
+    OutboxMessage.objects.bulk_create([OutboxMessage(kind=kind, payload=payload) for kind, payload in messages])
+
+
+def push(booking_ids):
+    """Push the bookings' statuses once the current transaction commits."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    if isinstance(channel_layer, InMemoryChannelLayer):
+        # only this process's consumers are reachable, not from drain_outbox
+        transaction.on_commit(partial(_push_now, sorted(booking_ids)))
+    else:
+        enqueue([('websocket', {'booking_ids': sorted(booking_ids)})])
+
+
+def _push_now(booking_ids):
+    try:
+        error = _send_pushes(booking_ids)
+    except Exception as e:  # the change is committed either way
+        error = e
+    if error is not None:
+        logger.warning("Booking status push failed: %r", error)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def _due(now):
+    return (
+        OutboxMessage.objects.filter(sent_at__isnull=True, available_at__lte=now, attempts__lt=MAX_ATTEMPTS)
+        .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+    )
+
+
+def claim(worker, batch_size=BATCH_SIZE):
+    """Lease up to ``batch_size`` due messages to ``worker``, oldest first."""
+    now = timezone.now()
+    ids = list(_due(now).order_by('available_at', 'id').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+    # the due conditions again: a row another worker leased meanwhile isn't updated
+    _due(now).filter(id__in=ids).update(claimed_by=worker, locked_until=now + timedelta(seconds=LEASE_SECONDS))
+    return list(OutboxMessage.objects.filter(id__in=ids, claimed_by=worker, sent_at__isnull=True).order_by('id'))
+
+
+async def _send_all(channel_layer, messages):
+    results = await asyncio.gather(
+        *(channel_layer.group_send(group, message) for group, message in messages),
+        return_exceptions=True,
+    )
+    return next((result for result in results if isinstance(result, BaseException)), None)
+
+
+def _send_pushes(booking_ids):
+    """Push the current status of the bookings. Returns the first error, or None."""
+    from .bookings import status_messages  # bookings imports this module
+
+    bookings = Booking.objects.select_related('vehicle', 'property').filter(id__in=booking_ids)
+    return async_to_sync(_send_all)(get_channel_layer(), status_messages(bookings))
+
+
+def _deliver_pushes(rows):
+    """{row id: error or None}; the rows' bookings go out together, one message per group."""
+    error = _send_pushes({booking_id for row in rows for booking_id in row.payload['booking_ids']})
+    return {row.id: error for row in rows}
+
+
+def _email(row, booking, recipient):
+    listing = booking.vehicle or booking.property
+    context = {'booking': booking, 'listing': listing, 'recipient': recipient, 'status': row.payload['status']}
+    return EmailMessage(
+        subject=EMAIL_SUBJECTS[row.payload['status']].format(title=listing.title),
+        body=render_to_string('listings/emails/booking_status.txt', context),
+        to=[recipient.email],
+        headers={'Message-ID': f'<{row.idempotency_key}@{MAIL_DOMAIN}>'},
+    )
+
+
+def _deliver_emails(rows):
+    """{row id: error or None}; rows whose booking or recipient is gone count as delivered."""
+    bookings = Booking.objects.select_related('vehicle', 'property').in_bulk(
+        {row.payload['booking_id'] for row in rows}
+    )
+    recipients = User.objects.in_bulk({row.payload['recipient_id'] for row in rows})
+    results = {}
+    with get_connection() as connection:
+        for row in rows:
+            booking = bookings.get(row.payload['booking_id'])
+            recipient = recipients.get(row.payload['recipient_id'])
+            if booking is None or recipient is None or not recipient.email:
+                results[row.id] = None
+                continue
+            try:
+                connection.send_messages([_email(row, booking, recipient)])
+                results[row.id] = None
+            except Exception as e:  # retried, see drain()
+                results[row.id] = e
+    return results
+
+
+DELIVERERS = {'websocket': _deliver_pushes, 'email': _deliver_emails}
+
+
+def drain(worker=None, batch_size=BATCH_SIZE):
+    """Claim and deliver one batch. Returns (sent, failed) counts."""
+    worker = worker or uuid.uuid4().hex
+    rows = claim(worker, batch_size)
+    results = {}
+    for kind, deliver in DELIVERERS.items():
+        batch = [row for row in rows if row.kind == kind]
+        if batch:
+            try:
+                results.update(deliver(batch))
+            except Exception as e:  # e.g. the SMTP server or channel layer is down
+                results.update((row.id, e) for row in batch)
+
+    now = timezone.now()
+    sent = [row_id for row_id, error in results.items() if error is None]
+    OutboxMessage.objects.filter(id__in=sent, claimed_by=worker).update(sent_at=now, locked_until=None, last_error='')
+    failed = [row for row in rows if results.get(row.id) is not None]
+    for row in failed:
+        attempts = row.attempts + 1
+        OutboxMessage.objects.filter(id=row.id, claimed_by=worker).update(
+            attempts=attempts,
+            available_at=now + retry_delay(attempts),
+            locked_until=None,
+            last_error=repr(results[row.id])[:2000],
+        )
+    return len(sent), len(failed)
@@ -0,0 +1,130 @@
+"""
+Versioned caching of listing pages and template fragments.
+
+Every cached entry's key embeds the current version of the data it was
+built from ("scopes": ``listings`` for anything shown in feeds, ``vehicle:<id>``
+/ ``property:<id>`` for one listing's detail page, ``bookings`` for
+results filtered by free dates). The signals in
+signals.py bump a scope's version on save/delete, which makes every entry
+built from the old data unreachable at once, without tracking or deleting
+keys. A bump waits for the transaction to commit: a page rendered before
+then, from the old data, is cached under the old version.
+
+Every process has to see the same versions, so PAGE_CACHE_ALIAS must be a
+cache shared between them (file, database, Redis, Memcached); a system
+check warns about the per-process local-memory cache.
+"""
+import hashlib
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+
+PAGE_CACHE_ALIAS = getattr(settings, 'PAGE_CACHE_ALIAS', 'default')
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+LISTINGS_SCOPE = 'listings'
+BOOKINGS_SCOPE = 'bookings'
+
+
+def _cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def _version_key(scope):
+    return f'page-version:{scope}'
+
+
+def listing_scope(listing_type, listing_id):
+    return f'{listing_type}:{listing_id}'
+
+
+def versions(*scopes):
+    """Current version token for ``scopes``, e.g. '1718.1720'."""
+    cache = _cache()
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    tokens = []
+    for key in keys:
+        if key not in found:
+            # Start from the clock, not 1: if the counter was evicted, entries
+            # cached under the old numbers must not become reachable again
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+        tokens.append(str(found[key]))
+    return '.'.join(tokens)
+
+
+def fragment_context(*scopes):
+    """Template context for ``{% cache cache_timeout <name> cache_version ... using=cache_alias %}``."""
+    return {
+        'cache_version': versions(*scopes),
+        'cache_timeout': PAGE_CACHE_TIMEOUT,
+        'cache_alias': PAGE_CACHE_ALIAS,
+    }
+
+
+def bump(*scopes):
+    """New versions for ``scopes`` once the current transaction commits (at once outside one)."""
+    transaction.on_commit(partial(_set_versions, scopes))
+
+
+def _set_versions(scopes):
+    # a fresh value rather than incr(): two processes bumping at once still
+    # both move the version, on backends where incr() isn't atomic
+    version = time.time_ns()
+    _cache().set_many({_version_key(scope): version for scope in scopes}, None)
+
+
+def check_shared_cache(app_configs=None, **kwargs):
+    if isinstance(_cache(), LocMemCache):
+        return [checks.Warning(
+            f"The page cache ('{PAGE_CACHE_ALIAS}') is local to each process, so their page versions "
+            "drift apart and stale pages are served.",
+            hint="Point PAGE_CACHE_ALIAS at a cache shared by all processes (file, database, Redis, Memcached).",
+            id='listings.W001',
+        )]
+    return []
+
+
+def _query_digest(request):
+    query = sorted((name, value) for name, values in request.GET.lists() for value in values)
+    return hashlib.sha1(repr((request.path, query)).encode()).hexdigest()
+
+
+def cache_page_versioned(scopes, timeout=PAGE_CACHE_TIMEOUT):
+    """
+    Cache a view's full response for anonymous GET requests, keyed on the
+    path, the query parameters and the versions of ``scopes(request, *args,
+    **kwargs)``. Responses that set cookies or use a CSRF token aren't cached.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated or len(get_messages(request)):
+                return view(request, *args, **kwargs)
+
+            cache = _cache()
+            key = f'page:{view.__name__}:{versions(*scopes(request, *args, **kwargs))}:{_query_digest(request)}'
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view(request, *args, **kwargs)
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+            ):
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapped
+    return decorator
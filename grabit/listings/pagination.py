@@ -0,0 +1,94 @@
+"""
+Keyset ("cursor") pagination.
+
+Instead of OFFSET, each page filters on the sort key of the last row already
+shown, so page 100 costs the same index range scan as page 1 and rows
+inserted meanwhile don't shift items between pages. The cursor is an opaque
+URL-safe token holding those sort key values.
+"""
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, FieldError, ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = getattr(settings, 'LISTINGS_PAGE_SIZE', 24)
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Cursor values, or None for a missing or malformed cursor (= first page)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        return None
+    return values if isinstance(values, list) else None
+
+
+def page_size_from(request, default=PAGE_SIZE):
+    try:
+        return max(1, min(int(request.GET.get('limit', default)), MAX_PAGE_SIZE))
+    except ValueError:
+        return default
+
+
+def _sort_values(queryset, ordering, values):
+    """
+    Cursor ``values`` converted to the types of the ``ordering`` fields, or
+    None if they don't fit (e.g. a hand-edited or outdated cursor).
+    """
+    if values is None or len(values) != len(ordering):
+        return None
+    converted = []
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        try:
+            annotation = queryset.query.annotations.get(name)
+            model_field = annotation.output_field if annotation is not None else queryset.model._meta.get_field(name)
+            value = model_field.to_python(value)
+        except (FieldDoesNotExist, FieldError, ValidationError, TypeError, ValueError):
+            return None
+        if value is None:
+            return None
+        converted.append(value)
+    return converted
+
+
+def _after(ordering, values):
+    """Rows strictly after ``values`` in ``ordering``: (a > x) OR (a = x AND b > y) ..."""
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for previous, value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=PAGE_SIZE):
+    """
+    One page of ``queryset`` ordered by ``ordering`` (field or annotation
+    names, '-' for descending; the last one must be unique, e.g. 'id').
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    values = _sort_values(queryset, ordering, decode_cursor(cursor))
+    if values is not None:  # an invalid cursor shows the first page
+        queryset = queryset.filter(_after(ordering, values))
+
+    rows = list(queryset.order_by(*ordering)[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([getattr(rows[-1], field.lstrip('-')) for field in ordering])
+    return rows, next_cursor
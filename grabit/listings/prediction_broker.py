@@ -0,0 +1,101 @@
+"""
+Micro-batching of rent predictions for async callers.
+
+Concurrent ``await apredict_rent(...)`` calls are collected for at most
+``max_delay`` seconds (or until ``max_batch_size`` are waiting), predicted with
+one ``ml_utils.predict_rent_batch`` call in a thread executor, and each caller's
+future is resolved with its own result. The event loop is never blocked by the
+model, and under load the model sees batches instead of single rows.
+"""
+import asyncio
+import time
+import weakref
+
+from django.conf import settings
+
+from .ml_utils import predict_rent_batch
+
+
+class _PendingBatch:
+    def __init__(self):
+        self.rows = []
+        self.futures = []
+        self.timer = None
+
+
+class PredictionBroker:
+    def __init__(self, max_batch_size=64, max_delay=0.005, executor=None):
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.executor = executor  # None: the loop's default ThreadPoolExecutor
+        # One pending batch per event loop, since futures can't cross loops
+        self._pending = weakref.WeakKeyDictionary()
+        self._running = set()  # keeps batch tasks referenced until they finish
+        self.requests = self.batches = self.largest_batch = self.errors = 0
+        self.total_wait = self.total_predict = 0.0
+
+    async def predict(self, location, bedrooms, size):
+        loop = asyncio.get_running_loop()
+        batch = self._pending.get(loop)
+        if batch is None:
+            batch = self._pending[loop] = _PendingBatch()
+            batch.timer = loop.call_later(self.max_delay, self._flush, loop)
+
+        future = loop.create_future()
+        batch.rows.append((location, bedrooms, size))
+        batch.futures.append((future, time.monotonic()))
+        self.requests += 1
+        if len(batch.rows) >= self.max_batch_size:
+            self._flush(loop)
+        return await future
+
+    def _flush(self, loop):
+        batch = self._pending.pop(loop, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        task = loop.create_task(self._run(loop, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, loop, batch):
+        started = time.monotonic()
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch.rows))
+        self.total_wait += sum(started - queued for _, queued in batch.futures)
+        try:
+            results = await loop.run_in_executor(self.executor, predict_rent_batch, batch.rows)
+        except Exception as e:
+            self.errors += 1
+            for future, _ in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.total_predict += time.monotonic() - started
+
+        for (future, _), result in zip(batch.futures, results):
+            if not future.done():  # the caller may have been cancelled
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'errors': self.errors,
+            'largest_batch': self.largest_batch,
+            'avg_batch_size': self.requests / self.batches if self.batches else 0.0,
+            'avg_wait_ms': 1000 * self.total_wait / self.requests if self.requests else 0.0,
+            'avg_predict_ms': 1000 * self.total_predict / self.batches if self.batches else 0.0,
+        }
+
+
+broker = PredictionBroker(
+    max_batch_size=getattr(settings, 'RENT_BROKER_MAX_BATCH_SIZE', 64),
+    max_delay=getattr(settings, 'RENT_BROKER_MAX_DELAY_MS', 5) / 1000,
+)
+
+
+async def apredict_rent(location, bedrooms, size):
+    """Async counterpart of ``ml_utils.predict_rent`` that batches with concurrent callers."""
+    return await broker.predict(location, bedrooms, size)
@@ -0,0 +1,132 @@
+"""
+NumPy-only form of the trained rent model.
+
+``compile_pipeline`` flattens the sklearn pipeline in kerala_rent_predictor.pkl
+(StandardScaler on bedrooms/size, OneHotEncoder on location, then a random
+forest or linear regressor) into plain arrays saved as an ``.npz`` file.
+``CompiledRentModel`` evaluates those arrays directly, so predictions need
+neither pandas nor sklearn at request time.
+"""
+import numpy as np
+
+NUMERIC_COLUMNS = ['bedrooms', 'size']
+CATEGORY_COLUMN = 'location'
+
+
+def _find_step(transformer):
+    """Last step of a (possibly nested) Pipeline."""
+    return transformer.steps[-1][1] if hasattr(transformer, 'steps') else transformer
+
+
+def compile_pipeline(pipeline, source_version):
+    """Extract the arrays needed for inference from a fitted sklearn pipeline."""
+    preprocessor, regressor = pipeline.steps[0][1], pipeline.steps[-1][1]
+
+    scaler = encoder = None
+    for name, transformer, columns in preprocessor.transformers_:
+        if list(columns) == NUMERIC_COLUMNS:
+            scaler = _find_step(transformer)
+        elif list(columns) == [CATEGORY_COLUMN]:
+            encoder = _find_step(transformer)
+    if scaler is None or encoder is None:
+        raise ValueError("Unsupported preprocessor: expected a scaler on bedrooms/size and an encoder on location")
+    if getattr(encoder, 'drop_idx_', None) is not None:
+        raise ValueError("Unsupported encoder: dropped categories")
+
+    n_numeric = len(NUMERIC_COLUMNS)
+    arrays = {
+        'source_version': np.array(source_version),
+        'mean': np.asarray(scaler.mean_ if scaler.mean_ is not None else np.zeros(n_numeric), dtype=np.float64),
+        'scale': np.asarray(scaler.scale_ if scaler.scale_ is not None else np.ones(n_numeric), dtype=np.float64),
+        'categories': np.asarray(encoder.categories_[0], dtype=str),
+    }
+
+    if hasattr(regressor, 'estimators_'):
+        trees = [estimator.tree_ for estimator in regressor.estimators_]
+    elif hasattr(regressor, 'tree_'):
+        trees = [regressor.tree_]
+    else:
+        trees = None
+
+    if trees is not None:
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees[:-1]])
+        left = [np.where(t.children_left >= 0, t.children_left + off, -1) for t, off in zip(trees, offsets)]
+        right = [np.where(t.children_right >= 0, t.children_right + off, -1) for t, off in zip(trees, offsets)]
+        arrays.update({
+            'kind': np.array('forest'),
+            'roots': offsets.astype(np.int64),
+            'left': np.concatenate(left).astype(np.int64),
+            'right': np.concatenate(right).astype(np.int64),
+            'feature': np.concatenate([t.feature for t in trees]).astype(np.int64),
+            'threshold': np.concatenate([t.threshold for t in trees]).astype(np.float64),
+            'value': np.concatenate([t.value[:, 0, 0] for t in trees]).astype(np.float64),
+        })
+    elif hasattr(regressor, 'coef_'):
+        arrays.update({
+            'kind': np.array('linear'),
+            'coef': np.ravel(regressor.coef_).astype(np.float64),
+            'intercept': np.array(np.ravel(regressor.intercept_)[0], dtype=np.float64),
+        })
+    else:
+        raise ValueError(f"Unsupported regressor: {type(regressor).__name__}")
+    return arrays
+
+
+def save_compiled(arrays, path):
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+class CompiledRentModel:
+    """Evaluates the arrays produced by ``compile_pipeline``."""
+
+    def __init__(self, arrays):
+        self.kind = str(arrays['kind'])
+        self.source_version = str(arrays['source_version'])
+        self.mean = arrays['mean']
+        self.scale = arrays['scale']
+        self.category_index = {name: i for i, name in enumerate(arrays['categories'].tolist())}
+        self.n_features = len(NUMERIC_COLUMNS) + len(self.category_index)
+        if self.kind == 'forest':
+            self.roots = arrays['roots']
+            self.left, self.right = arrays['left'], arrays['right']
+            self.feature, self.threshold = arrays['feature'], arrays['threshold']
+            self.value = arrays['value']
+        else:
+            self.coef, self.intercept = arrays['coef'], float(arrays['intercept'])
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def transform(self, locations, bedrooms, sizes):
+        n = len(locations)
+        X = np.zeros((n, self.n_features), dtype=np.float64)
+        X[:, 0] = bedrooms
+        X[:, 1] = sizes
+        X[:, :2] = (X[:, :2] - self.mean) / self.scale
+        # Unknown locations stay all-zero, like OneHotEncoder(handle_unknown='ignore')
+        for row, location in enumerate(locations):
+            column = self.category_index.get(location)
+            if column is not None:
+                X[row, len(NUMERIC_COLUMNS) + column] = 1.0
+        return X
+
+    def predict(self, locations, bedrooms, sizes):
+        X = self.transform(locations, bedrooms, sizes)
+        if self.kind == 'linear':
+            return X @ self.coef + self.intercept
+
+        # sklearn trees compare float32 features against float64 thresholds
+        X = X.astype(np.float32)
+        rows = np.arange(len(X))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots))).copy()
+        while True:
+            internal = self.left[nodes] >= 0
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            step = np.where(go_left, self.left[nodes], self.right[nodes])
+            nodes = np.where(internal, step, nodes)
+        return self.value[nodes].mean(axis=1)
@@ -0,0 +1,139 @@
+"""
+Ranked text search over listings.
+
+PostgreSQL: a stored ``search_vector`` tsvector column with a GIN index,
+plus pg_trgm trigram indexes on the place columns so misspelt town names
+still match. SQLite (dev/test): FTS5 tables kept in sync by triggers.
+Both are created by migration 0008. SQLite drops a table's triggers when a
+migration rebuilds it (most AddField/AlterField), so ``restore_sqlite_search``
+puts them back, and reindexes, after every ``migrate``. Other databases fall
+back to icontains.
+
+``search_listings`` filters a Vehicle/Property queryset and annotates a
+``search_rank`` (higher is better); ``places_only`` restricts the match to the
+location/address columns, for the location filter.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q, Value, BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+# Searched text per table, most important first (tsvector weights A, B, C)
+SEARCH_COLUMNS = {
+    'listings_vehicle': (['title'], ['location', 'brand', 'model'], ['description']),
+    'listings_property': (['title'], ['location', 'address'], ['description']),
+}
+# Place columns matched by trigram similarity on PostgreSQL
+PLACE_COLUMNS = {
+    'listings_vehicle': ['location'],
+    'listings_property': ['location', 'address'],
+}
+TEXT_CONFIG = 'english'
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def fts5_query(text, columns=None):
+    """User text -> FTS5 query: every word must match, as a prefix."""
+    words = _WORD.findall(text)
+    if not words:
+        return ''
+    query = ' '.join(f'"{word}"*' for word in words)
+    return f"{{{' '.join(columns)}}} : ({query})" if columns else query
+
+
+def search_listings(queryset, text, places_only=False):
+    text = (text or '').strip()
+    if not text:
+        return queryset
+    table = queryset.model._meta.db_table
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        return _search_postgres(queryset, table, text, places_only)
+    if vendor == 'sqlite':
+        return _search_sqlite(queryset, table, text, places_only)
+    return _search_fallback(queryset, table, text, places_only)
+
+
+def _search_postgres(queryset, table, text, places_only):
+    places = PLACE_COLUMNS[table]
+    # `%` is pg_trgm's similarity operator; it and ILIKE both use the gin_trgm_ops indexes
+    fuzzy = ' OR '.join(f'{table}.{column} %% %s' for column in places)
+    similarity = ' + '.join(f'similarity({table}.{column}, %s)' for column in places)
+    if places_only:
+        contains = ' OR '.join(f'{table}.{column} ILIKE %s' for column in places)
+        pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        match = RawSQL(
+            f"({contains} OR {fuzzy})", [pattern] * len(places) + [text] * len(places), output_field=BooleanField(),
+        )
+        rank = RawSQL(f"({similarity})", [text] * len(places), output_field=FloatField())
+        return queryset.filter(match).annotate(search_rank=rank)
+
+    query = f"websearch_to_tsquery('{TEXT_CONFIG}', %s)"
+    params = [text] * (1 + len(places))
+    match = RawSQL(f"({table}.search_vector @@ {query} OR {fuzzy})", params, output_field=BooleanField())
+    rank = RawSQL(f"(ts_rank({table}.search_vector, {query}) + {similarity})", params, output_field=FloatField())
+    return queryset.filter(match).annotate(search_rank=rank)
+
+
+def _search_sqlite(queryset, table, text, places_only):
+    query = fts5_query(text, PLACE_COLUMNS[table] if places_only else None)
+    if not query:
+        # nothing FTS5 can match; annotated so ordering by search_rank still works
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+    fts = f'{table}_fts'
+    match = RawSQL(
+        f"{table}.id IN (SELECT rowid FROM {fts} WHERE {fts} MATCH %s)", [query], output_field=BooleanField(),
+    )
+    # bm25() is lower-is-better, so negate it to keep "higher rank is better"
+    rank = RawSQL(
+        f"(SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND {fts}.rowid = {table}.id)",
+        [query], output_field=FloatField(),
+    )
+    return queryset.filter(match).annotate(search_rank=rank)
+
+
+def _search_fallback(queryset, table, text, places_only):
+    condition = Q()
+    columns = PLACE_COLUMNS[table] if places_only else sum(SEARCH_COLUMNS[table], [])
+    for column in columns:
+        condition |= Q(**{f'{column}__icontains': text})
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def _sqlite_triggers(table):
+    fts = f'{table}_fts'
+    columns = sum(SEARCH_COLUMNS[table], [])
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+    ]
+
+
+def restore_sqlite_search(sender=None, using='default', **kwargs):
+    """post_migrate: recreate missing FTS5 triggers and reindex what was written without them."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    existing = set(connection.introspection.table_names())
+    with connection.cursor() as cursor:
+        for table in SEARCH_COLUMNS:
+            fts = f'{table}_fts'
+            if fts not in existing:  # migrated back to before 0008
+                continue
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s AND name LIKE %s",
+                [table, f'{fts}_%'],
+            )
+            if cursor.fetchone()[0] == 3:
+                continue
+            for statement in _sqlite_triggers(table):
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
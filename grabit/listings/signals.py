@@ -0,0 +1,85 @@
+"""
+Keep derived data in step with listing and booking writes: the ListingIndex
+rows, the owners' BookingStats counters, and the page cache versions (see
+page_cache.py).
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Booking, BookingStats, ListingIndex, Property, Vehicle
+from .page_cache import BOOKINGS_SCOPE, LISTINGS_SCOPE, bump, listing_scope
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_save, sender=Property)
+def index_listing(sender, instance, raw=False, **kwargs):
+    if raw:  # loaddata: fixtures bring their own index rows
+        return
+    ListingIndex.sync(instance)
+
+
+@receiver(post_delete, sender=Vehicle)
+@receiver(post_delete, sender=Property)
+def unindex_listing(sender, instance, **kwargs):
+    ListingIndex.remove(instance)
+
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Vehicle)
+@receiver(post_delete, sender=Property)
+def expire_listing_pages(sender, instance, **kwargs):
+    bump(LISTINGS_SCOPE, listing_scope(instance.get_listing_type(), instance.pk))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def expire_booked_listing_pages(sender, instance, **kwargs):
+    # a booking only changes its own listing's detail page, and date-filtered searches
+    bump(BOOKINGS_SCOPE)
+    if instance.vehicle_id:
+        bump(listing_scope('vehicle', instance.vehicle_id))
+    if instance.property_id:
+        bump(listing_scope('property', instance.property_id))
+
+
+def _stored_state(booking):
+    """Booking.counted_state() of the row in the database, None if there is none."""
+    return Booking.objects.filter(pk=booking.pk).values_list('status', 'total_price').first()
+
+
+@receiver(pre_save, sender=Booking)
+def remember_counted_booking(sender, instance, raw=False, **kwargs):
+    # not loaded with from_db (or with status/total_price deferred): what was counted is in the row
+    if not raw and instance.pk is not None and getattr(instance, '_counted', None) is None:
+        instance._counted = _stored_state(instance)
+
+
+@receiver(post_save, sender=Booking)
+def count_saved_booking(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    old = None if created else getattr(instance, '_counted', None)
+    new = instance.counted_state()
+    if new is None:  # saved with status/total_price still deferred
+        new = _stored_state(instance)
+    if old != new:
+        BookingStats.apply([(instance.listing_owner_id(), old, new)])
+    instance._counted = new
+
+
+@receiver(pre_delete, sender=Booking)
+def load_deleted_booking(sender, instance, **kwargs):
+    # the row is about to go: read what was counted, and for whom, while it's there
+    if getattr(instance, '_counted', None) is None or not (instance.vehicle_id or instance.property_id):
+        try:
+            instance.refresh_from_db(fields=['status', 'total_price', 'vehicle', 'property'])
+        except Booking.DoesNotExist:
+            return
+        instance._counted = instance.counted_state()
+
+
+@receiver(post_delete, sender=Booking)
+def count_deleted_booking(sender, instance, **kwargs):
+    old = getattr(instance, '_counted', instance.counted_state())
+    BookingStats.apply([(instance.listing_owner_id(), old, None)])
@@ -0,0 +1,14 @@
+from django import template
+
+from ..image_variants import variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_variant(image, variant, fmt='original'):
+    """
+    URL of a resized copy of a listing image, e.g.
+    ``{% image_variant vehicle.image 'card' %}`` or ``{% image_variant vehicle.image 'card' 'webp' %}``.
+    """
+    return variant_url(image, variant, fmt)
@@ -1,3 +1,1117 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from asgiref.testing import ApplicationCommunicator
+from channels.layers import BaseChannelLayer, InMemoryChannelLayer, get_channel_layer
+from django.contrib.auth.models import AnonymousUser, User
+from django.conf import settings
+from django.core import mail
+from django.core.management import call_command
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    bulk_import, consumers, geo, image_index, image_pipeline, image_variants, ml_utils, outbox, prediction_broker, views,
+)
+from .bookings import BookingConflict, bulk_set_status, cancel_booking, confirm_booking, create_booking
+from .facets import VEHICLE_FACETS, facet_counts
+from .groups import listing_group, user_group
+from .models import Booking, BookingStats, ListingIndex, OutboxMessage, Property, Vehicle
+from .page_cache import LISTINGS_SCOPE, bump, versions
+from .pagination import encode_cursor, keyset_page
+from .rent_model import CompiledRentModel, compile_pipeline
+from .search import restore_sqlite_search, search_listings
+
+
+def setUpModule():
+    # Empty caches for the run: versions kept from an earlier run would serve
+    # pages cached from that run's data
+    global _cache_dir, _cache_settings
+    _cache_dir = tempfile.TemporaryDirectory()
+    _cache_settings = override_settings(CACHES={
+        alias: {**config, 'LOCATION': os.path.join(_cache_dir.name, alias)}
+        for alias, config in settings.CACHES.items()
+    })
+    _cache_settings.enable()
+
+
+def tearDownModule():
+    _cache_settings.disable()
+    _cache_dir.cleanup()
+
+
+class CompiledRentModelTests(SimpleTestCase):
+    """The NumPy export must predict exactly what the sklearn pipeline does."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            import joblib
+            cls.pipeline = joblib.load(ml_utils.MODEL_PATH)
+        except Exception as e:
+            raise unittest.SkipTest(f"Trained model not loadable here: {e}")
+        cls.compiled = CompiledRentModel(compile_pipeline(cls.pipeline, 'test'))
+
+    def sklearn_predict(self, rows):
+        import pandas as pd
+        locations, bedrooms, sizes = zip(*rows)
+        return self.pipeline.predict(pd.DataFrame({'location': locations, 'bedrooms': bedrooms, 'size': sizes}))
+
+    def test_parity_with_pipeline(self):
+        locations = list(self.compiled.category_index) + ['Unknown town', '']
+        rows = [
+            (location, bedrooms, size)
+            for location in locations
+            for bedrooms in (1, 2, 3, 4, 7)
+            for size in (0, 250, 900, 1234, 2500, 10000)
+        ]
+        expected = self.sklearn_predict(rows)
+        actual = self.compiled.predict(*zip(*rows))
+        for row, want, got in zip(rows, expected, actual):
+            self.assertAlmostEqual(want, got, places=6, msg=row)
+
+    def test_predict_rent_falls_back_to_backup(self):
+        class Broken:
+            def predict(self, *args):
+                raise RuntimeError("boom")
+
+        original = ml_utils._model, ml_utils._model_version
+        ml_utils._model, ml_utils._model_version = Broken(), 'broken'
+        try:
+            with self.assertLogs('listings.ml_utils', 'ERROR') as logs:
+                self.assertEqual(ml_utils.predict_rent('Kochi', 2, 1000), ml_utils.backup_predict('Kochi', 2, 1000))
+                self.assertEqual(
+                    ml_utils.predict_rent_batch([('Kochi', 2, 1000)]),
+                    [ml_utils.backup_predict('Kochi', 2, 1000)],
+                )
+            self.assertEqual(len(logs.records), 2)
+        finally:
+            ml_utils._model, ml_utils._model_version = original
+
+
+
+class FailingCache:
+    def get_many(self, keys):
+        raise ConnectionError("cache down")
+
+    def set_many(self, values, timeout=None):
+        raise ConnectionError("cache down")
+
+
+class PredictionCacheTests(SimpleTestCase):
+    def test_keys_are_valid_for_any_cache_backend(self):
+        key = ml_utils.PredictionCache.key('0123abcd', 'Fort Kochi, Ernākulam', 2, 1000)
+        self.assertRegex(key, r'^[!-~]{1,250}$')  # printable ASCII, no spaces, memcached's limit
+        self.assertNotEqual(key, ml_utils.PredictionCache.key('0123abcd', 'Fort Kochi, Ernākulam', 3, 1000))
+
+    def test_shared_cache_errors_fall_back_to_predicting(self):
+        cache = ml_utils.PredictionCache(shared_alias='shared')
+        with mock.patch.object(cache, '_shared', return_value=FailingCache()), \
+                mock.patch.object(ml_utils, 'prediction_cache', cache), \
+                self.assertLogs('listings.ml_utils', 'WARNING') as logs:
+            self.assertEqual(len(ml_utils.predict_rent_batch([('Fort Kochi', 2, 1000)])), 1)
+            self.assertEqual(cache.stats()['size'], 1)
+        self.assertIn("Shared prediction cache unavailable", logs.output[0])
+
+
+
+class PredictionBrokerTests(SimpleTestCase):
+    def test_concurrent_calls_share_model_batches(self):
+        broker = prediction_broker.PredictionBroker(max_batch_size=8, max_delay=0.05)
+        rows = [('Kochi', bedrooms, 500 + 50 * i) for i, bedrooms in enumerate([1, 2, 3, 4] * 5)]
+        batches = []
+
+        def predict(batch):
+            batches.append(len(batch))
+            return ml_utils.predict_rent_batch(batch)
+
+        async def predict_all():
+            return await asyncio.gather(*(broker.predict(*row) for row in rows))
+
+        with mock.patch.object(prediction_broker, 'predict_rent_batch', side_effect=predict):
+            results = asyncio.run(predict_all())
+
+        self.assertEqual(results, ml_utils.predict_rent_batch(rows))
+        self.assertEqual(sorted(batches), [4, 8, 8])  # two full batches, the rest after max_delay
+        stats = broker.stats()
+        self.assertEqual((stats['requests'], stats['batches'], stats['largest_batch']), (20, 3, 8))
+
+    def test_errors_reach_every_caller_of_the_batch(self):
+        broker = prediction_broker.PredictionBroker(max_delay=0.01)
+
+        async def predict_two():
+            return await asyncio.gather(
+                broker.predict('Kochi', 2, 900), broker.predict('Kochi', 3, 1200), return_exceptions=True,
+            )
+
+        with mock.patch.object(prediction_broker, 'predict_rent_batch', side_effect=ValueError("boom")):
+            results = asyncio.run(predict_two())
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(broker.stats()['errors'], 1)
+
+
+class FakePool:
+    """Stands in for the ingestion pool: every job ends with ``outcome``."""
+
+    def __init__(self, outcome):
+        self.outcome = outcome
+
+    def submit(self, func, *args):
+        future = Future()
+        if isinstance(self.outcome, BaseException):
+            future.set_exception(self.outcome)
+        elif self.outcome is not None:
+            future.set_result(self.outcome)
+        return future
+
+
+class IngestionPoolTests(SimpleTestCase):
+    def run_with(self, outcome):
+        with mock.patch.object(image_pipeline, 'INGEST_WORKERS', 1), \
+                mock.patch.object(image_pipeline, 'get_pool', return_value=FakePool(outcome)), \
+                mock.patch.object(image_pipeline, 'INGEST_TIMEOUT', 0.01):
+            return image_pipeline.run_in_pool(image_pipeline.process_image, b'')
+
+    def test_pool_failures_reject_the_image(self):
+        for outcome in (BrokenProcessPool(), MemoryError(), OSError('truncated'), None):  # None: never finishes
+            with self.subTest(outcome=outcome), self.assertRaises(image_pipeline.ImageRejected):
+                self.run_with(outcome)
+
+    def test_results_and_rejections_pass_through(self):
+        self.assertEqual(self.run_with({'hash': 'abc'}), {'hash': 'abc'})
+        with self.assertRaisesMessage(image_pipeline.ImageRejected, 'too large'):
+            self.run_with(image_pipeline.ImageRejected('Image is too large (1x1).'))
+
+
+
+class ImageVariantTests(SimpleTestCase):
+    def setUp(self):
+        self.image = mock.Mock(url='/media/vehicles/car.jpg')
+        self.image.name = f'vehicles/car-{uuid.uuid4().hex}.jpg'
+        self.image.read.return_value = b'image bytes'
+        self.addCleanup(image_variants.cache.delete, image_variants._queued_key(self.image.name))
+
+    def test_missing_variant_serves_the_original_and_is_queued_once(self):
+        with mock.patch.object(image_variants, 'INGEST_WORKERS', 1), \
+                mock.patch.object(image_variants, 'submit_to_pool') as submit:
+            self.assertEqual(image_variants.variant_url(self.image, 'card'), self.image.url)
+            self.assertEqual(image_variants.variant_url(self.image, 'card', 'webp'), self.image.url)
+        self.assertEqual(submit.call_count, 1)
+
+    def test_queueing_failures_are_not_raised(self):
+        with mock.patch.object(image_variants, 'INGEST_WORKERS', 1), \
+                mock.patch.object(image_variants, 'submit_to_pool', side_effect=BrokenProcessPool()), \
+                self.assertLogs('listings.image_variants', 'ERROR'):
+            image_variants.schedule_variants(self.image)
+
+    def test_concurrently_stored_variant_keeps_one_file(self):
+        storage = mock.Mock()
+        storage.exists.return_value = False
+        storage.save.side_effect = lambda name, content: name.replace('.card.', '_x1Yz.card.')
+        storage.url.side_effect = lambda name: f'/media/{name}'
+        with mock.patch.object(image_variants, 'default_storage', storage):
+            image_variants._store_variants(self.image.name, {('card', 'original'): b'jpeg'})
+        path = image_variants.variant_name(self.image.name, 'card')
+        storage.delete.assert_called_once_with(path.replace('.card.', '_x1Yz.card.'))
+        key = image_variants._cache_key(self.image.name, 'card', 'original')
+        self.assertEqual(image_variants.cache.get(key), f'/media/{path}')
+        image_variants.cache.delete(key)
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """Many parallel book-and-confirm requests on one listing never double-book it."""
+
+    THREADS = 8
+    ATTEMPTS_PER_THREAD = 25
+    FIRST_DAY = date(2030, 1, 1)
+    WINDOW_DAYS = 120
+
+    @classmethod
+    def setUpClass(cls):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            raise unittest.SkipTest("Needs a database that separate threads can share, e.g. PostgreSQL or SQLite on disk")
+        super().setUpClass()
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.renters = [User.objects.create_user(f'renter{i}') for i in range(self.THREADS)]
+        self.vehicle = Vehicle.objects.create(
+            owner=self.owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+
+    def book_and_confirm(self, renter, seed, outcomes):
+        rng = random.Random(seed)
+        try:
+            for _ in range(self.ATTEMPTS_PER_THREAD):
+                start = self.FIRST_DAY + timedelta(days=rng.randrange(self.WINDOW_DAYS))
+                end = start + timedelta(days=rng.randrange(4))
+                try:
+                    booking = create_booking(renter, 'vehicle', self.vehicle, start, end, 1500)
+                    confirm_booking(booking)
+                    outcomes.append('confirmed')
+                except BookingConflict:
+                    outcomes.append('conflict')
+                except Exception as e:  # e.g. a lock timeout: must not happen either
+                    outcomes.append(e)
+        finally:
+            connection.close()
+
+    def test_no_double_booking_under_parallel_requests(self):
+        outcomes = []
+        threads = [
+            threading.Thread(target=self.book_and_confirm, args=(renter, seed, outcomes))
+            for seed, renter in enumerate(self.renters)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        errors = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+        self.assertEqual(errors, [])
+        self.assertEqual(len(outcomes), self.THREADS * self.ATTEMPTS_PER_THREAD)
+
+        confirmed = list(
+            Booking.objects.filter(vehicle=self.vehicle, status='confirmed')
+            .order_by('start_date')
+            .values_list('start_date', 'end_date')
+        )
+        self.assertEqual(len(confirmed), outcomes.count('confirmed'))
+        self.assertGreater(len(confirmed), 0)
+        for (_, previous_end), (start, _) in zip(confirmed, confirmed[1:]):
+            self.assertGreater(start, previous_end)
+
+        # every request finished, in well under the lock timeout on average
+        self.assertLess(elapsed / len(outcomes), 0.5)
+
+
+
+class BulkBookingStatusTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.other_owner = User.objects.create_user('other')
+        self.renter = User.objects.create_user('renter')
+        self.vehicle = self.listing(self.owner)
+        self.other_vehicle = self.listing(self.other_owner)
+
+    def listing(self, owner):
+        return Vehicle.objects.create(
+            owner=owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+
+    def book(self, vehicle, first_day, last_day):
+        return create_booking(
+            self.renter, 'vehicle', vehicle, date(2030, 1, first_day), date(2030, 1, last_day), 1500,
+        )
+
+    def statuses(self, *bookings):
+        found = dict(Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).values_list('pk', 'status'))
+        return [found[booking.pk] for booking in bookings]
+
+    def test_only_the_owners_bookings_change(self):
+        mine, theirs = self.book(self.vehicle, 1, 2), self.book(self.other_vehicle, 1, 2)
+        result = bulk_set_status(self.owner, [mine.pk, theirs.pk, 999999], 'confirm')
+        self.assertEqual([booking.pk for booking in result['changed']], [mine.pk])
+        self.assertEqual(self.statuses(mine, theirs), ['confirmed', 'pending'])
+
+        self.assertEqual(bulk_set_status(self.other_owner, [mine.pk], 'cancel')['changed'], [])
+        self.assertEqual(self.statuses(mine), ['confirmed'])
+
+    def test_overlapping_bookings_in_one_batch(self):
+        early, overlapping, later = self.book(self.vehicle, 1, 5), self.book(self.vehicle, 4, 8), self.book(self.vehicle, 10, 12)
+        reopened = cancel_booking(self.book(self.vehicle, 2, 3))
+        result = bulk_set_status(self.owner, [later.pk, overlapping.pk, reopened.pk, early.pk], 'confirm')
+        # the earliest-starting booking wins; a pending request overlapping it
+        # is declined, a canceled one is reported and stays canceled
+        self.assertEqual({booking.pk for booking in result['changed']}, {early.pk, later.pk})
+        self.assertEqual([booking.pk for booking in result['declined']], [overlapping.pk])
+        self.assertEqual([booking.pk for booking in result['conflicts']], [reopened.pk])
+        self.assertEqual(self.statuses(early, overlapping, reopened, later), ['confirmed', 'canceled', 'canceled', 'confirmed'])
+
+    def test_conflicts_with_confirmed_bookings_are_left_alone(self):
+        taken = self.book(self.vehicle, 1, 5)
+        confirm_booking(taken)
+        canceled = self.book(self.vehicle, 10, 12)
+        cancel_booking(canceled)
+        Booking.objects.filter(pk=canceled.pk).update(start_date=date(2030, 1, 3))  # now overlapping
+        result = bulk_set_status(self.owner, [canceled.pk], 'confirm')
+        self.assertEqual(result['changed'], [])
+        self.assertEqual([booking.pk for booking in result['conflicts']], [canceled.pk])
+        self.assertEqual(self.statuses(canceled), ['canceled'])
+
+    def test_confirming_declines_overlapping_pending_requests(self):
+        chosen = self.book(self.vehicle, 1, 5)
+        overlapping = [self.book(self.vehicle, 3, 4), self.book(self.vehicle, 5, 9)]
+        elsewhere = [self.book(self.vehicle, 6, 9), self.book(self.other_vehicle, 1, 5)]
+        result = bulk_set_status(self.owner, [chosen.pk], 'confirm')
+        self.assertEqual({booking.pk for booking in result['declined']}, {booking.pk for booking in overlapping})
+        self.assertEqual(self.statuses(*overlapping, *elsewhere), ['canceled', 'canceled', 'pending', 'pending'])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})  # a fresh layer per test
+@mock.patch.object(consumers, 'COALESCE_SECONDS', 0.05)
+class BookingStatusConsumerTests(SimpleTestCase):
+    async def connect(self, user):
+        communicator = ApplicationCommunicator(
+            consumers.BookingStatusConsumer.as_asgi(),
+            {'type': 'websocket', 'path': '/ws/booking_status/', 'headers': [], 'subprotocols': [], 'user': user},
+        )
+        await communicator.send_input({'type': 'websocket.connect'})
+        return communicator, await communicator.receive_output(1)
+
+    async def receive_json(self, communicator):
+        message = await communicator.receive_output(1)
+        return json.loads(message['text'])
+
+    async def send_json(self, communicator, data):
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps(data)})
+
+    async def test_anonymous_users_are_rejected(self):
+        communicator, message = await self.connect(AnonymousUser())
+        self.assertEqual(message['type'], 'websocket.close')
+
+    async def test_burst_of_user_updates_is_one_message(self):
+        communicator, message = await self.connect(User(pk=7))
+        self.assertEqual(message['type'], 'websocket.accept')
+        layer = get_channel_layer()
+        for user_id, booking_id, status in ((7, 1, 'pending'), (7, 1, 'confirmed'), (7, 2, 'pending'), (8, 3, 'pending')):
+            update = {'booking_id': booking_id, 'status': status}
+            await layer.group_send(user_group(user_id), {'type': 'booking.updates', 'updates': [update]})
+
+        self.assertEqual(await self.receive_json(communicator), {
+            'updates': [{'booking_id': 1, 'status': 'confirmed'}, {'booking_id': 2, 'status': 'pending'}],
+            'listings': [],
+        })
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+    async def test_listing_subscriptions(self):
+        communicator, _ = await self.connect(User(pk=7))
+        layer = get_channel_layer()
+        for junk in ('not json', '[1]', '{"subscribe": 5}', '{"subscribe": [5, null, {}]}', '{"unsubscribe": "vehicle:1"}'):
+            await communicator.send_input({'type': 'websocket.receive', 'text': junk})
+        await self.send_json(communicator, {'subscribe': ['vehicle:1', 'property:2', 'boat:3']})
+        await self.send_json(communicator, {'unsubscribe': ['property:2']})
+        self.assertTrue(await communicator.receive_nothing(0.1))  # handled, and the socket is still open
+
+        for listing_type, listing_id in (('vehicle', 1), ('property', 2)):
+            key = f'{listing_type}:{listing_id}'
+            await layer.group_send(listing_group(listing_type, listing_id), {'type': 'listing.updates', 'listings': [key]})
+        self.assertEqual(await self.receive_json(communicator), {'updates': [], 'listings': ['vehicle:1']})
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+
+
+class AsgiEntryPointTests(SimpleTestCase):
+    def test_asgi_application_imports_in_a_fresh_process(self):
+        # a fresh interpreter, as daphne/uvicorn start it: the app registry isn't set up yet
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'grabit.settings')}
+        result = subprocess.run(
+            [sys.executable, '-c', 'import grabit.asgi; print(grabit.asgi.application)'],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class HomeFeedTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        self.created = []
+        # the signals' bump gives the fragments a version no earlier run cached under
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                vehicle = Vehicle.objects.create(
+                    owner=owner, title=f'Car {i}', description='', brand='Maruti', model='Swift', year=2022,
+                    price_per_day=1500, location='Kochi',
+                )
+                prop = Property.objects.create(
+                    owner=owner, title=f'Flat {i}', description='', address='MG Road, Kochi', location='Kochi',
+                    price=15000, bedrooms=2, bathrooms=1, size=900,
+                )
+                self.created += [vehicle.title, prop.title]
+
+    def titles(self, response):
+        return [listing.title for listing in response.context['latest_listings']]
+
+    def test_mixed_feed_is_newest_first(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(self.titles(response), self.created[::-1])
+
+    def test_more_listings_continues_the_feed(self):
+        with mock.patch.object(views, 'HOME_PAGE_SIZE', 4):
+            first = self.client.get(reverse('home'))
+            self.assertContains(first, f"?cursor={first.context['next_cursor']}")
+            second = self.client.get(reverse('home'), {'cursor': first.context['next_cursor']})
+        self.assertEqual(self.titles(first) + self.titles(second), self.created[::-1])
+        self.assertEqual(second.context['next_cursor'], '')
+
+
+class SearchTests(TestCase):
+    def test_new_listing_is_searchable(self):
+        # the SQLite FTS index is kept up to date by triggers, which table rebuilds used to drop
+        owner = User.objects.create_user('owner')
+        vehicle = Vehicle.objects.create(
+            owner=owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Swift')), [vehicle])
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Kochi', places_only=True)), [vehicle])
+
+        vehicle.location = 'Munnar'
+        vehicle.save()
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Kochi', places_only=True)), [])
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Munnar', places_only=True)), [vehicle])
+
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "SQLite FTS5 triggers")
+    def test_triggers_dropped_by_a_table_rebuild_come_back_after_migrate(self):
+        owner = User.objects.create_user('owner')
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f"DROP TRIGGER listings_vehicle_fts_{suffix}")
+        vehicle = Vehicle.objects.create(
+            owner=owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Swift')), [])
+
+        restore_sqlite_search(using=connection.alias)  # what post_migrate runs
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Swift')), [vehicle])
+        vehicle.title = 'Baleno'
+        vehicle.save()
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Baleno')), [vehicle])
+        vehicle.delete()
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), 'Baleno')), [])
+
+    def test_queries_without_words_find_nothing(self):
+        self.assertEqual(list(search_listings(Vehicle.objects.all(), '!!!').order_by('-search_rank', '-id')), [])
+        self.assertEqual(self.client.get(reverse('listings'), {'q': '!!!'}).status_code, 200)
+        response = self.client.get(reverse('api_listings'), {'category': 'vehicle', 'q': '-'})
+        self.assertEqual(response.status_code, 200)
+
+
+class RentPredictionOnSaveTests(TestCase):
+    def test_saves_that_keep_the_inputs_dont_load_the_model(self):
+        prop = Property.objects.create(
+            owner=User.objects.create_user('owner'), title='Flat', description='', address='MG Road, Kochi',
+            location='Kochi', price=15000, bedrooms=2, bathrooms=1, size=900,
+        )
+        self.assertIsNotNone(prop.rent_model_version)
+
+        original = ml_utils._model, ml_utils._model_version
+        ml_utils._model = ml_utils._model_version = None  # a fresh process
+        try:
+            with mock.patch.object(ml_utils, 'load_model', side_effect=AssertionError("model loaded")):
+                prop = Property.objects.get(pk=prop.pk)
+                prop.is_available = False
+                prop.save()
+        finally:
+            ml_utils._model, ml_utils._model_version = original
+
+
+class NearDuplicateTests(TestCase):
+    HASH = 'c3a5f00f5a3c0ff0'
+
+    @staticmethod
+    def flipped(*bits):
+        value = int(NearDuplicateTests.HASH, 16)
+        for bit in bits:
+            value ^= 1 << bit
+        return f'{value:016x}'
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(
+            owner=User.objects.create_user('owner'), title='Swift', description='', brand='Maruti',
+            model='Swift', year=2022, price_per_day=1500, location='Kochi',
+        )
+        image_index.set_image_hash(self.vehicle, self.HASH, 1)
+        Vehicle.objects.bulk_update([self.vehicle], image_index.HASH_FIELDS)
+        self.index = image_index.HashIndex()
+        self.index.add(self.HASH, self.vehicle.pk)
+
+    def test_distance_boundary(self):
+        # one flipped bit per chunk: no chunk matches exactly, the worst case for the probes
+        hit = self.flipped(0, 16, 32, 48)
+        miss = self.flipped(0, 1, 16, 32, 48)
+        self.assertEqual(image_index.hamming_distance(hit, self.HASH), image_index.DUPLICATE_DISTANCE - 1)
+        self.assertEqual(image_index.hamming_distance(miss, self.HASH), image_index.DUPLICATE_DISTANCE)
+
+        self.assertEqual(image_index.find_similar(Vehicle.objects.all(), hit), self.vehicle)
+        self.assertIsNone(image_index.find_similar(Vehicle.objects.all(), miss))
+        self.assertEqual(self.index.find(hit), self.vehicle.pk)
+        self.assertIsNone(self.index.find(miss))
+        # the batch filter only narrows down candidates; both are probed
+        candidates = Vehicle.objects.filter(image_index.similar_hashes_filter([hit, miss]))
+        self.assertEqual(list(candidates), [self.vehicle])
+
+
+class FacetCountTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        with self.captureOnCommitCallbacks(execute=True):  # fresh page versions
+            for brand, year, price in [
+                ('Maruti', 2022, 900), ('Maruti', 2022, 1500), ('Maruti', 2020, 3000), ('Maruti', 2021, 6000),
+                ('Honda', 2022, 1200), ('Honda', 2019, 2600), ('Kia', 2020, 800),
+            ]:
+                Vehicle.objects.create(
+                    owner=owner, title=brand, description='', brand=brand, model='X', year=year,
+                    price_per_day=price, location='Kochi',
+                )
+
+    @staticmethod
+    def group_by(queryset, facet):
+        return {
+            str(row['value']): row['count']
+            for row in queryset.order_by().values(value=facet.expression()).annotate(count=Count('id'))
+            if row['value'] is not None
+        }
+
+    def test_counts_match_group_by(self):
+        selection = {'brand': ['Maruti', 'Kia'], 'year': ['2020', '2022']}
+        facets = {facet['name']: facet for facet in facet_counts(Vehicle.objects.all(), VEHICLE_FACETS, selection)}
+        for facet in VEHICLE_FACETS:
+            with self.subTest(facet=facet.name):
+                # every selected facet filters the counts except the facet's own
+                others = Vehicle.objects.all()
+                for other in VEHICLE_FACETS:
+                    if other is not facet and other.name in selection:
+                        others = others.filter(other.q(selection[other.name]))
+                counts = {option['value']: option['count'] for option in facets[facet.name]['options'] if option['count']}
+                self.assertEqual(counts, self.group_by(others, facet))
+
+
+    def test_invalid_numbers_are_ignored(self):
+        for query in (
+            {'category': 'property', 'bedrooms': '²'},
+            {'category': 'vehicle', 'year': '²'},
+            {'category': 'vehicle', 'year': '99999999999999999999999'},
+            {'category': 'vehicle', 'year': 'x'},
+        ):
+            for url in (reverse('listings'), reverse('api_listings')):
+                with self.subTest(url=url, query=query):
+                    self.assertEqual(self.client.get(url, query).status_code, 200)
+
+    def test_numbers_are_normalized(self):
+        response = self.client.get(reverse('listings'), {'year': ['٢٠٢٠', ' 2022 ']})
+        self.assertEqual({vehicle.year for vehicle in response.context['vehicles']}, {2020, 2022})
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        self.vehicles = [
+            Vehicle.objects.create(
+                owner=owner, title=f'Car {i}', description='', brand='Maruti', model='Swift', year=2022,
+                price_per_day=1500, location='Kochi',
+            )
+            for i in range(3)
+        ]
+
+    def page(self, cursor):
+        rows, _ = keyset_page(Vehicle.objects.all(), ('-id',), cursor, page_size=2)
+        return [row.pk for row in rows]
+
+    def test_next_cursor_continues_after_the_page(self):
+        _, cursor = keyset_page(Vehicle.objects.all(), ('-id',), page_size=2)
+        self.assertEqual(self.page(cursor), [self.vehicles[0].pk])
+
+    def test_invalid_cursor_shows_the_first_page(self):
+        first_page = [self.vehicles[2].pk, self.vehicles[1].pk]
+        for cursor in ('garbage', encode_cursor(['abc']), encode_cursor([None]), encode_cursor([1, 2]),
+                       encode_cursor({'id': 1}), encode_cursor([[1]])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.page(cursor), first_page)
+
+
+class RadiusSearchTests(TestCase):
+    TOWNS = ['Kochi', 'Fort Kochi', 'Aluva', 'Alappuzha', 'Kottayam', 'Munnar', 'Thrissur', 'Kozhikode', 'Trivandrum']
+
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        for town in self.TOWNS:
+            Vehicle.objects.create(
+                owner=owner, title=town, description='', brand='Maruti', model='Swift', year=2022,
+                price_per_day=1500, location=town,
+            )
+
+    def test_database_filter_matches_exact_distances(self):
+        rows = list(Vehicle.objects.values_list('title', 'latitude', 'longitude'))
+        kochi = geo.resolve('Kochi')
+        distances = geo.haversine_km(kochi.latitude, kochi.longitude, [r[1] for r in rows], [r[2] for r in rows])
+        for radius in (1, 5, 25, 60, 150, 500):
+            with self.subTest(radius=radius):
+                expected = {row[0] for row, distance in zip(rows, distances) if distance <= radius}
+                found = set(
+                    geo.within_radius(Vehicle.objects.all(), kochi.latitude, kochi.longitude, radius)
+                    .values_list('title', flat=True)
+                )
+                self.assertEqual(found, expected)
+
+    def test_listings_page_shows_distances(self):
+        response = self.client.get(reverse('listings'), {'near': 'Kochi', 'radius': 25})
+        shown = {vehicle.title: vehicle.distance_km for vehicle in response.context['vehicles']}
+        self.assertEqual(set(shown), {'Kochi', 'Fort Kochi', 'Aluva'})
+        self.assertEqual(shown['Kochi'], 0.0)
+
+
+class BackfillImageHashesTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.checkpoint = os.path.join(media.name, 'checkpoint.json')
+
+        owner = User.objects.create_user('owner')
+        self.vehicles = {}
+        for seed, (name, image_hash, version) in enumerate([
+            ('resumed past', None, None),
+            ('unhashed', None, None),
+            ('current', 'ffffffffffffffff', image_pipeline.HASH_VERSION),
+            ('outdated', 'ffffffffffffffff', image_pipeline.HASH_VERSION - 1),
+        ]):
+            rng = random.Random(seed)
+            image = Image.new('L', (32, 32))
+            image.putdata([rng.randrange(256) for _ in range(32 * 32)])
+            image.save(os.path.join(media.name, f'{seed}.png'))
+            vehicle = Vehicle.objects.create(
+                owner=owner, title=name, description='', brand='Maruti', model='Swift', year=2022,
+                price_per_day=1500, location='Kochi',
+            )
+            # attached with update(): save() would hash the image itself
+            Vehicle.objects.filter(pk=vehicle.pk).update(
+                image=f'{seed}.png', image_hash=image_hash, image_hash_version=version,
+            )
+            self.vehicles[name] = vehicle.pk
+
+    def hashes(self):
+        return dict(Vehicle.objects.values_list('title', 'image_hash'))
+
+    def expected(self, name):
+        path = os.path.join(settings.MEDIA_ROOT, Vehicle.objects.get(title=name).image.name)
+        return image_pipeline.hash_image_path(path)[0]
+
+    def backfill(self, *args):
+        call_command('backfill_image_hashes', *args, workers=1, checkpoint=self.checkpoint, stdout=StringIO())
+
+    def test_resumes_and_skips_current_hashes(self):
+        self.assertEqual(len({self.expected(name) for name in self.vehicles} - {None}), 4)
+        with open(self.checkpoint, 'w') as f:
+            json.dump({
+                'hash_version': image_pipeline.HASH_VERSION, 'all': False,
+                'last_ids': {'Vehicle': self.vehicles['resumed past']},
+            }, f)
+        self.backfill()
+        self.assertEqual(self.hashes(), {
+            'resumed past': None,
+            'unhashed': self.expected('unhashed'),
+            'current': 'ffffffffffffffff',
+            'outdated': self.expected('outdated'),
+        })
+        self.assertEqual(
+            set(Vehicle.objects.exclude(image_hash=None).values_list('image_hash_version', flat=True)),
+            {image_pipeline.HASH_VERSION},
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        # the finished run removed its checkpoint, so the next one starts over
+        self.backfill()
+        self.assertEqual(self.hashes()['resumed past'], self.expected('resumed past'))
+        self.backfill('--all')
+        self.assertEqual(self.hashes(), {name: self.expected(name) for name in self.vehicles})
+
+
+class BulkImportTests(TestCase):
+    HEADER = 'title,description,brand,model,year,price_per_day,location,image\n'
+
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        patcher = mock.patch.object(bulk_import, 'INGEST_WORKERS', 0)  # decode inline
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def png(self, seed, size=64):
+        rng = random.Random(seed)
+        image = Image.new('RGB', (size, size))
+        image.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(size * size)])
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def zip_upload(self, rows, images):
+        upload = BytesIO()
+        with zipfile.ZipFile(upload, 'w') as archive:
+            archive.writestr('listings.csv', self.HEADER + ''.join(rows))
+            for name, data in images.items():
+                archive.writestr(name, data)
+        upload.seek(0)
+        return upload
+
+    def stored_files(self):
+        return [name for _, _, names in os.walk(self.media_root) for name in names]
+
+    def test_oversized_images_are_rejected(self):
+        big, small = self.png(1, size=128), self.png(2)
+        upload = self.zip_upload(
+            [f'Car {i},Hatchback,Maruti,Swift,2022,1500,Kochi,{name}\n' for i, name in enumerate(['big.png', 'small.png'])],
+            {'big.png': big, 'small.png': small},
+        )
+        with mock.patch.object(bulk_import, 'MAX_IMAGE_BYTES', len(small)):
+            report = bulk_import.import_listings(upload, 'vehicle', self.owner)
+        self.assertEqual(report.created, 1)
+        self.assertEqual([(row, field) for row, field, _ in report.errors], [(2, 'image')])
+
+    def test_failed_insert_deletes_the_stored_images(self):
+        upload = self.zip_upload(['Car,Hatchback,Maruti,Swift,2022,1500,Kochi,car.png\n'], {'car.png': self.png(3)})
+        with mock.patch.object(ListingIndex.objects, 'bulk_create', side_effect=RuntimeError('db down')), \
+                self.assertRaises(RuntimeError):
+            bulk_import.import_listings(upload, 'vehicle', self.owner)
+        self.assertFalse(Vehicle.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_files_over_the_row_limit_import_nothing(self):
+        upload = BytesIO((self.HEADER + 'Car,,Maruti,Swift,2022,1500,Kochi,\n' * 3).encode())
+        with self.assertRaises(bulk_import.BulkImportError):
+            bulk_import.import_listings(upload, 'vehicle', self.owner, max_rows=2)
+        self.assertFalse(Vehicle.objects.exists())
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicles = [
+                Vehicle.objects.create(
+                    owner=owner, title=f'Car {i}', description='', brand='Maruti', model='Swift', year=2022,
+                    price_per_day=1500, location='Kochi',
+                )
+                for i in range(3)
+            ]
+
+    def test_detail_conditional_requests(self):
+        url = reverse('api_listing_detail', args=['vehicle', self.vehicles[0].pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['title'], 'Car 0')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.vehicles[0].title = 'Renamed'
+        self.vehicles[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_search_etag_changes_with_the_listings(self):
+        url = reverse('api_listings')
+        response = self.client.get(url, {'category': 'vehicle'})
+        etag = response['ETag']
+        self.assertEqual([row['title'] for row in response.json()['results']], ['Car 2', 'Car 1', 'Car 0'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, {'category': 'vehicle'}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'category': 'vehicle', 'limit': 1}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehicles[1].delete()
+        self.assertEqual(self.client.get(url, {'category': 'vehicle'}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_export_streams_ndjson(self):
+        response = self.client.get(reverse('api_export'), {'category': 'vehicle'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(response.streaming)
+        self.assertIn('ETag', response)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [vehicle.pk for vehicle in self.vehicles])
+        self.assertEqual({(row['type'], row['price']) for row in rows}, {('vehicle', '1500.00')})
+
+
+class AvailabilityViewTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner')
+        self.vehicle = Vehicle.objects.create(
+            owner=owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+
+    def test_month_window_past_year_9999_is_a_bad_request(self):
+        url = reverse('listing_availability', args=['vehicle', self.vehicle.pk])
+        self.assertEqual(self.client.get(url, {'month': '9999-12', 'months': 2}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'month': '9999-12'}).status_code, 200)
+
+    def test_check_availability_of_a_missing_listing_is_not_found(self):
+        params = {'listing_type': 'vehicle', 'start_date': '2030-01-01', 'end_date': '2030-01-02'}
+        response = self.client.get(reverse('check_availability'), {**params, 'listing_id': self.vehicle.pk})
+        self.assertEqual(response.json(), {'available': True})
+        response = self.client.get(reverse('check_availability'), {**params, 'listing_id': self.vehicle.pk + 1})
+        self.assertEqual(response.status_code, 404)
+
+
+class FreeDatesFilterTests(TestCase):
+    def setUp(self):
+        owner, renter = User.objects.create_user('owner'), User.objects.create_user('renter')
+        bookings = {
+            'booked': [('2030-01-12', '2030-01-20', 'confirmed')],
+            'booked on the first day': [('2030-01-05', '2030-01-10', 'confirmed')],
+            'requested': [('2030-01-10', '2030-01-15', 'pending')],
+            'canceled': [('2030-01-10', '2030-01-15', 'canceled')],
+            'back to back': [('2030-01-01', '2030-01-09', 'confirmed'), ('2030-01-16', '2030-01-20', 'confirmed')],
+            'never booked': [],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            for title, ranges in bookings.items():
+                vehicle = Vehicle.objects.create(
+                    owner=owner, title=title, description='', brand='Maruti', model='Swift', year=2022,
+                    price_per_day=1500, location='Kochi',
+                )
+                for start, end, status in ranges:
+                    Booking.objects.create(
+                        user=renter, vehicle=vehicle, start_date=start, end_date=end, total_price=1500, status=status,
+                    )
+
+    def test_only_confirmed_overlapping_bookings_exclude_a_listing(self):
+        response = self.client.get(
+            reverse('listings'), {'category': 'vehicle', 'start_date': '2030-01-10', 'end_date': '2030-01-15'},
+        )
+        self.assertEqual(
+            {vehicle.title for vehicle in response.context['vehicles']},
+            {'requested', 'canceled', 'back to back', 'never booked'},
+        )
+
+    def test_invalid_dates_are_ignored(self):
+        response = self.client.get(reverse('listings'), {'start_date': '2030-01-15', 'end_date': '2030-01-10'})
+        self.assertEqual(len(response.context['vehicles']), 6)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner')
+        self.renter = User.objects.create_user('renter')
+        self.vehicle = Vehicle.objects.create(
+            owner=self.owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+
+    def book(self, day, user=None, total_price=1500):
+        start = date(2030, 1, 1) + timedelta(days=2 * day)
+        return create_booking(user or self.renter, 'vehicle', self.vehicle, start, start, total_price)
+
+    def assertStatsMatchBookings(self):
+        expected = BookingStats.totals().get(self.owner.pk, [0, 0, 0])
+        stats = BookingStats.objects.filter(user=self.owner).first() or BookingStats(user=self.owner)
+        self.assertEqual((stats.pending, stats.confirmed, stats.revenue), tuple(expected))
+
+    def test_dashboard_queries_dont_grow_with_bookings(self):
+        self.client.force_login(self.owner)
+        for day in range(3):
+            self.book(day)
+            self.book(100 + day, user=self.owner)
+        # session, user, own bookings page, received bookings page, counters
+        with self.assertNumQueries(5):
+            self.client.get(reverse('dashboard'))
+
+        for day in range(3, 40):
+            self.book(day)
+            self.book(100 + day, user=self.owner)
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.context['stats'].pending, 80)
+
+    def test_counters_follow_every_change(self):
+        first, second, third, fourth = (self.book(day, total_price=1000 * (day + 1)) for day in range(4))
+        self.assertStatsMatchBookings()
+        confirm_booking(first, actor=self.owner)
+        self.assertStatsMatchBookings()
+        cancel_booking(first, actor=self.owner)
+        self.assertStatsMatchBookings()
+        bulk_set_status(self.owner, [first.pk, second.pk, third.pk], 'confirm')
+        self.assertStatsMatchBookings()
+        bulk_set_status(self.owner, [second.pk], 'cancel')
+        self.assertStatsMatchBookings()
+        Booking.objects.get(pk=third.pk).delete()
+        self.assertStatsMatchBookings()
+        fourth.delete()
+        self.assertStatsMatchBookings()
+        self.assertEqual(BookingStats.objects.get(user=self.owner).confirmed, 1)
+
+    def test_counters_follow_saves_of_bookings_not_loaded_whole(self):
+        first, second = self.book(0), self.book(1, total_price=2000)
+        Booking(
+            pk=first.pk, user=self.renter, vehicle=self.vehicle, start_date=first.start_date,
+            end_date=first.end_date, total_price=1500, status='confirmed',
+        ).save()
+        self.assertStatsMatchBookings()
+        deferred = Booking.objects.only('id', 'end_date').get(pk=second.pk)
+        deferred.end_date += timedelta(days=1)
+        deferred.save()
+        self.assertStatsMatchBookings()
+        Booking(pk=second.pk).delete()
+        self.assertStatsMatchBookings()
+        self.assertEqual(BookingStats.objects.get(user=self.owner).revenue, 1500)
+
+
+class PageCacheTests(TestCase):
+    def test_bump_waits_for_the_commit(self):
+        before = versions(LISTINGS_SCOPE)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump(LISTINGS_SCOPE)
+            # a page rendered now, from the uncommitted data's old state, is cached under the old version
+            self.assertEqual(versions(LISTINGS_SCOPE), before)
+        self.assertNotEqual(versions(LISTINGS_SCOPE), before)
+
+
+class RecordingChannelLayer(BaseChannelLayer):
+    """A channel layer "shared between processes" that records what is sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def group_send(self, group, message):
+        self.sent.append((group, message))
+
+
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', email='owner@example.com')
+        self.renter = User.objects.create_user('renter', email='renter@example.com')
+        self.vehicle = Vehicle.objects.create(
+            owner=self.owner, title='Swift', description='', brand='Maruti', model='Swift', year=2022,
+            price_per_day=1500, location='Kochi',
+        )
+        self.layer = RecordingChannelLayer()
+        patcher = mock.patch.object(outbox, 'get_channel_layer', return_value=self.layer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def book(self, day=1):
+        start = date(2030, 1, day)
+        return create_booking(self.renter, 'vehicle', self.vehicle, start, start + timedelta(days=1), 1500)
+
+    def test_rolled_back_change_queues_nothing(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.book()
+            raise RuntimeError
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertEqual(outbox.drain('worker'), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_booking_request_emails_the_owner_once(self):
+        booking = self.book()
+        self.assertEqual(outbox.drain('worker'), (2, 0))
+
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.to, ['owner@example.com'])
+        row = OutboxMessage.objects.get(kind='email')
+        self.assertEqual(email.extra_headers['Message-ID'], f'<{row.idempotency_key}@{outbox.MAIL_DOMAIN}>')
+        self.assertIsNotNone(row.sent_at)
+        self.assertEqual(
+            self.layer.sent[0][1], {'type': 'booking.updates', 'updates': [{'booking_id': booking.id, 'status': 'pending'}]},
+        )
+        self.assertEqual(outbox.drain('worker'), (0, 0))
+
+    def test_pushes_carry_the_status_at_delivery(self):
+        booking = self.book()
+        confirm_booking(booking, actor=self.owner)
+        cancel_booking(booking, actor=self.renter)
+        outbox.drain('worker')
+
+        statuses = {
+            update['status'] for _, message in self.layer.sent if message['type'] == 'booking.updates'
+            for update in message['updates']
+        }
+        self.assertEqual(statuses, {'canceled'})
+
+    def test_in_memory_layer_pushes_after_commit(self):
+        layer = InMemoryChannelLayer()
+        with mock.patch.object(outbox, 'get_channel_layer', return_value=layer):
+            with self.captureOnCommitCallbacks() as callbacks:
+                booking = self.book()
+            self.assertFalse(OutboxMessage.objects.filter(kind='websocket').exists())
+            with mock.patch.object(layer, 'group_send') as group_send:
+                for callback in callbacks:
+                    callback()
+        groups = {call.args[0] for call in group_send.call_args_list}
+        self.assertIn(f'booking_user_{self.renter.pk}', groups)
+        self.assertIn(f'booking_listing_vehicle_{booking.vehicle_id}', groups)
+
+    def test_leased_rows_survive_a_worker_restart(self):
+        self.book()
+        claimed = outbox.claim('crashed')
+        self.assertEqual(len(claimed), 2)
+        # leased: other workers skip the rows until the lease runs out
+        self.assertEqual(outbox.claim('other'), [])
+
+        OutboxMessage.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.drain('other'), (2, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        # recorded under the worker that delivered them
+        self.assertEqual(OutboxMessage.objects.filter(claimed_by='other', sent_at__isnull=False).count(), 2)
+
+    def test_failed_delivery_backs_off_and_retries(self):
+        self.book()
+        with mock.patch.object(EmailBackend, 'send_messages', side_effect=OSError('SMTP down')):
+            self.assertEqual(outbox.drain('worker'), (1, 1))
+
+        row = OutboxMessage.objects.get(kind='email')
+        self.assertEqual(row.attempts, 1)
+        self.assertIn('SMTP down', row.last_error)
+        self.assertIsNone(row.sent_at)
+        self.assertGreater(row.available_at, timezone.now() + outbox.retry_delay(1) - timedelta(seconds=5))
+        # not due before the backoff runs out
+        self.assertEqual(outbox.drain('worker'), (0, 0))
+
+        OutboxMessage.objects.filter(pk=row.pk).update(available_at=timezone.now())
+        self.assertEqual(outbox.drain('worker'), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].extra_headers['Message-ID'], f'<{row.idempotency_key}@{outbox.MAIL_DOMAIN}>')
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual(outbox.retry_delay(1), timedelta(seconds=outbox.RETRY_BASE_SECONDS))
+        self.assertEqual(outbox.retry_delay(2), timedelta(seconds=2 * outbox.RETRY_BASE_SECONDS))
+        self.assertEqual(outbox.retry_delay(30), timedelta(seconds=outbox.RETRY_MAX_SECONDS))
+
+    def test_gives_up_after_max_attempts(self):
+        self.book()
+        OutboxMessage.objects.update(attempts=outbox.MAX_ATTEMPTS)
+        self.assertEqual(outbox.drain('worker'), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+    def test_idempotency_keys_are_unique(self):
+        for day in (1, 5, 9):
+            self.book(day)
+        keys = list(OutboxMessage.objects.values_list('idempotency_key', flat=True))
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(len(set(keys)), len(keys))
@@ -1,17 +1,25 @@
 from django.urls import path
-from .views import home, add_vehicle, add_property, listings, book_listing, dashboard, confirm_booking, cancel_booking, user_cancel_booking, delete_listing, listing_detail, check_availability
+from .views import home, add_vehicle, add_property, listings, listings_feed, book_listing, dashboard, confirm_booking, cancel_booking, user_cancel_booking, delete_listing, listing_detail, check_availability, listing_availability
 from . import views
+from .api import api_listings, api_listing_detail, api_export
 urlpatterns = [
     path('', home, name='home'),
     path('add-vehicle/', add_vehicle, name='add_vehicle'),
     path('add-property/', add_property, name='add_property'),
+    path('bulk-import/', views.bulk_import, name='bulk_import'),
     path('listings/', listings, name='listings'),
+    path('listings/feed/', listings_feed, name='listings_feed'),
     path('book/<str:listing_type>/<int:listing_id>/', book_listing, name='book_listing'),
     path('dashboard/', dashboard, name='dashboard'),
     path('booking/confirm/<int:booking_id>/', confirm_booking, name='confirm_booking'),
     path('booking/cancel/<int:booking_id>/', cancel_booking, name='cancel_booking'),
+    path('booking/bulk/', views.bulk_booking_action, name='bulk_booking_action'),
     path('booking/user_cancel/<int:booking_id>/', user_cancel_booking, name='user_cancel_booking'),
     path('delete/<str:listing_type>/<int:listing_id>/', delete_listing, name='delete_listing'), 
+    path('api/listings/', api_listings, name='api_listings'),
+    path('api/listings/export/', api_export, name='api_export'),
+    path('api/<str:listing_type>/<int:listing_id>/', api_listing_detail, name='api_listing_detail'),
     path('<str:listing_type>/<int:listing_id>/', listing_detail, name='listing_detail'),
     path('check_availability/', check_availability, name="check_availability"),
+    path('availability/<str:listing_type>/<int:listing_id>/', listing_availability, name="listing_availability"),
 ]
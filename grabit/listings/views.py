@@ -1,36 +1,55 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from .forms import VehicleForm, PropertyForm
+from django.template.loader import render_to_string
+from .forms import VehicleForm, PropertyForm, BulkImportForm
 from django.contrib.auth.decorators import login_required
-from .models import Vehicle, Property, Booking
+from .models import Vehicle, Property, Booking, BookingStats, ListingIndex
 from django.contrib import messages
 from datetime import datetime
+from functools import partial
+from django.utils.functional import SimpleLazyObject
 from django.db.models import Q 
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from PIL import Image
-import imagehash
-from .ml_utils import predict_rent
-
-
+from django.views.decorators.http import require_POST
+from .image_index import find_similar
+from .image_pipeline import ingest_upload, ImageRejected
+from .image_variants import schedule_variants
+from .pagination import keyset_page, page_size_from
+from .geo import set_distances
+from .page_cache import LISTINGS_SCOPE, cache_page_versioned, fragment_context, listing_scope
+from .availability import LISTING_FIELDS, MAX_MONTHS, booked_ranges, is_range_free, month_window
+from . import bookings
+from .bookings import LISTING_MODELS, BookingConflict
+from .bulk_import import WEB_MAX_ROWS, BulkImportError, import_listings
+from .filters import filtered_listings, listing_scopes, parse_date
+
+
+HOME_PAGE_SIZE = 12
+# matches listing_index_recent_idx
+RECENT_ORDERING = ('-created_at', '-id')
+DASHBOARD_PAGE_SIZE = 10
+BOOKING_ORDERING = ('-id',)
+
+
+@cache_page_versioned(lambda request: [LISTINGS_SCOPE])
 def home(request):
-    latest_vehicles = Vehicle.objects.filter(is_available=True).order_by('-id')[:6]
-    latest_properties = Property.objects.filter(is_available=True).order_by('-id')[:6]
-
-    latest_listings = list(latest_vehicles) + list(latest_properties)
+    # One indexed query over both listing types, newest first; "More
+    # listings" continues the same feed with ?cursor=. Lazy: the query only
+    # runs when the cached "latest listings" fragment is missing.
+    cursor = request.GET.get('cursor', '')
+    page = SimpleLazyObject(partial(
+        keyset_page, ListingIndex.objects.filter(is_available=True), RECENT_ORDERING, cursor, HOME_PAGE_SIZE,
+    ))
 
-    
-    for listing in latest_listings:
-        listing.listing_type = listing.get_listing_type()
-
-    context = {"latest_listings": latest_listings}
+    context = {
+        "latest_listings": SimpleLazyObject(lambda: page[0]),
+        "cursor": cursor,
+        "next_cursor": SimpleLazyObject(lambda: page[1] or ''),
+        **fragment_context(LISTINGS_SCOPE),
+    }
     return render(request, "listings/index.html", context)
 
 
-
-
-
 @login_required
 def add_vehicle(request):
     if request.method == 'POST':
@@ -41,24 +60,20 @@ def add_vehicle(request):
 
             # ✅ Check for similar images
             if vehicle.image:
-                img = Image.open(vehicle.image)
-                uploaded_hash = imagehash.phash(img)
-
-                existing_vehicles = Vehicle.objects.all()
-                for v in existing_vehicles:
-                    if v.image:
-                        try:
-                            existing_img = Image.open(v.image)
-                            existing_hash = imagehash.phash(existing_img)
-                            diff = uploaded_hash - existing_hash
-
-                            if diff < 5:  # Threshold for similarity
-                                messages.error(request, "Duplicate image detected! Upload a different photo.")
-                                return redirect('add_vehicle')
-                        except:
-                            continue
+                # Decode, normalize and hash the upload once, in the ingestion pool
+                try:
+                    ingest_upload(vehicle)
+                except ImageRejected as e:
+                    messages.error(request, str(e))
+                    return redirect('add_vehicle')
+
+                # Indexed lookup on the stored hash chunks, no image decoding
+                if find_similar(Vehicle.objects.all(), vehicle.image_hash):
+                    messages.error(request, "Duplicate image detected! Upload a different photo.")
+                    return redirect('add_vehicle')
 
             vehicle.save()
+            schedule_variants(vehicle.image)
             return redirect('/')  
     else:
         form = VehicleForm()
@@ -77,24 +92,20 @@ def add_property(request):
 
             # ✅ Check for similar images
             if property.image:
-                img = Image.open(property.image)
-                uploaded_hash = imagehash.phash(img)
-
-                existing_properties = Property.objects.all()
-                for p in existing_properties:
-                    if p.image:
-                        try:
-                            existing_img = Image.open(p.image)
-                            existing_hash = imagehash.phash(existing_img)
-                            diff = uploaded_hash - existing_hash
-
-                            if diff < 5:  # Threshold for similarity
-                                messages.error(request, "Duplicate image detected! Upload a different photo.")
-                                return redirect('add_property')
-                        except:
-                            continue
+                # Decode, normalize and hash the upload once, in the ingestion pool
+                try:
+                    ingest_upload(property)
+                except ImageRejected as e:
+                    messages.error(request, str(e))
+                    return redirect('add_property')
+
+                # Indexed lookup on the stored hash chunks, no image decoding
+                if find_similar(Property.objects.all(), property.image_hash):
+                    messages.error(request, "Duplicate image detected! Upload a different photo.")
+                    return redirect('add_property')
 
             property.save()
+            schedule_variants(property.image)
             return redirect('/')
     else:
         form = PropertyForm()
@@ -102,42 +113,78 @@ def add_property(request):
 
 
 
-def listings(request):
-    category = request.GET.get('category', '')
-    location = request.GET.get('location', '')
+# ✅ Bulk import (CSV/ZIP) for fleet and property-management owners
+@login_required
+def bulk_import(request):
+    report = None
+    if request.method == 'POST':
+        form = BulkImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            # imported within the request, so only files of a bounded size
+            try:
+                report = import_listings(
+                    request.FILES['file'], form.cleaned_data['listing_type'], request.user, max_rows=WEB_MAX_ROWS
+                )
+            except BulkImportError as e:
+                messages.error(request, str(e))
+                return redirect('bulk_import')
+            if request.POST.get('download_report') and report.errors:
+                response = HttpResponse(report.as_csv(), content_type='text/csv')
+                response['Content-Disposition'] = 'attachment; filename="import-errors.csv"'
+                return response
+    else:
+        form = BulkImportForm()
+    return render(request, 'listings/bulk_import.html', {'form': form, 'report': report, 'max_rows': WEB_MAX_ROWS})
 
-    vehicles = Vehicle.objects.filter(is_available=True)
-    properties = Property.objects.filter(is_available=True)
 
-    if location:
-        vehicles = vehicles.filter(location__icontains=location)
-        properties = properties.filter(address__icontains=location)
+def _with_distances(rows, origin):
+    """Distances from the ?near= point on one page of rows."""
+    if origin is not None:
+        set_distances(rows, *origin)
+    return rows
 
-    if category == "vehicle":
-        properties = Property.objects.none()
-    elif category == "property":
-        vehicles = Vehicle.objects.none()
-
-    for prop in properties:
-        prop.is_best_deal = False
-        predicted = predict_rent(
-            location=prop.address.split(',')[-1].strip(),  # Extract city
-            bedrooms=prop.bedrooms,
-            size=prop.size
-        )
-        if predicted and prop.price <= predicted:
-            prop.is_best_deal = True
-            prop.predicted_price = predicted  # For template display
+
+@cache_page_versioned(listing_scopes)
+def listings(request):
+    vehicles, properties, vehicle_ordering, property_ordering, filters = filtered_listings(request, with_facets=True)
+
+    # Keyset pages: each tab continues from its own cursor
+    page_size = page_size_from(request)
+    vehicles, next_vehicle_cursor = keyset_page(vehicles, vehicle_ordering, request.GET.get('vcursor'), page_size)
+    properties, next_property_cursor = keyset_page(properties, property_ordering, request.GET.get('pcursor'), page_size)
 
     context = {
-        "vehicles": vehicles,
-        "properties": properties,
-        "category": category,
-        "location": location
+        "vehicles": _with_distances(vehicles, filters["origin"]),
+        "properties": _with_distances(properties, filters["origin"]),
+        "next_vehicle_cursor": next_vehicle_cursor,
+        "next_property_cursor": next_property_cursor,
+        **filters,
+        **fragment_context(*listing_scopes(request)),
     }
     return render(request, "listings/listings.html", context)
 
 
+def listings_feed(request):
+    """JSON page of one category for infinite scroll: ?category=vehicle|property&cursor=..."""
+    vehicles, properties, vehicle_ordering, property_ordering, filters = filtered_listings(request)
+    category = filters["category"]
+    if category == "vehicle":
+        queryset, ordering, template, name = vehicles, vehicle_ordering, "listings/_vehicle_card.html", "vehicle"
+    elif category == "property":
+        queryset, ordering, template, name = properties, property_ordering, "listings/_property_card.html", "property"
+    else:
+        return JsonResponse({'error': 'Invalid listing type'}, status=400)
+
+    rows, next_cursor = keyset_page(queryset, ordering, request.GET.get('cursor'), page_size_from(request))
+    _with_distances(rows, filters["origin"])
+    html = "".join(render_to_string(template, {name: row}, request=request) for row in rows)
+    return JsonResponse({
+        "ids": [row.id for row in rows],
+        "html": html,
+        "next_cursor": next_cursor,
+    })
+
+
 # ✅ Booking Function (Prevent Self-Booking)
 @login_required
 def book_listing(request, listing_type, listing_id):
@@ -174,16 +221,12 @@ def book_listing(request, listing_type, listing_id):
         num_days = (end_date_obj - start_date_obj).days
         total_price = num_days * (listing.price_per_day if listing_type == 'vehicle' else listing.price)
 
-        # Create Booking
-        Booking.objects.create(
-            user=request.user,
-            vehicle=listing if listing_type == 'vehicle' else None,
-            property=listing if listing_type == 'property' else None,
-            start_date=start_date_obj,
-            end_date=end_date_obj,
-            total_price=total_price,
-            status='pending'
-        )
+        # Create Booking, unless the dates overlap a confirmed one (checked atomically)
+        try:
+            bookings.create_booking(request.user, listing_type, listing, start_date_obj, end_date_obj, total_price)
+        except BookingConflict as e:
+            messages.error(request, str(e))
+            return redirect('book_listing', listing_type=listing_type, listing_id=listing.id)
 
         messages.success(request, "Booking request sent successfully!")
         return redirect('listings')
@@ -195,15 +238,28 @@ def book_listing(request, listing_type, listing_id):
 @login_required
 def dashboard(request):
     user = request.user
-
-    user_bookings = Booking.objects.filter(user=user)  # Bookings made by user
-    owner_bookings = Booking.objects.filter(
-        Q(vehicle__owner=user) | Q(property__owner=user)
-    )  # Bookings received by user
+    page_size = page_size_from(request, DASHBOARD_PAGE_SIZE)
+
+    # Keyset pages with their listings (and renters) joined in: a fixed number of queries
+    user_bookings, next_user_cursor = keyset_page(
+        Booking.objects.filter(user=user).select_related('vehicle', 'property'),  # Bookings made by user
+        BOOKING_ORDERING, request.GET.get('ucursor'), page_size,
+    )
+    owner_bookings, next_owner_cursor = keyset_page(
+        Booking.objects.filter(
+            Q(vehicle__owner=user) | Q(property__owner=user)
+        ).select_related('vehicle', 'property', 'user'),  # Bookings received by user
+        BOOKING_ORDERING, request.GET.get('ocursor'), page_size,
+    )
+    # Counters kept up to date on every status change, instead of counting here
+    stats = BookingStats.objects.filter(user=user).first() or BookingStats(user=user)
 
     return render(request, 'listings/dashboard.html', {
         'user_bookings': user_bookings,
         'owner_bookings': owner_bookings,
+        'next_user_cursor': next_user_cursor,
+        'next_owner_cursor': next_owner_cursor,
+        'stats': stats,
     })
 
 
@@ -212,19 +268,12 @@ def dashboard(request):
 def confirm_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     if (booking.vehicle and booking.vehicle.owner == request.user) or (booking.property and booking.property.owner == request.user):
-        booking.status = 'confirmed'
-        booking.save()
-
-        # Send real-time update
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "booking_updates",  # Group name
-            {
-                "type": "send_booking_update",
-                "booking_id": booking.id,
-                "status": "confirmed",
-            }
-        )
+        # Pushes and emails go out through the outbox, not from this request
+        try:
+            bookings.confirm_booking(booking, actor=request.user)
+        except BookingConflict as e:
+            messages.error(request, str(e))
+            return redirect('dashboard')
 
         messages.success(request, "Booking confirmed successfully.")
     return redirect('dashboard')
@@ -236,32 +285,46 @@ def confirm_booking(request, booking_id):
 def cancel_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
     if (booking.vehicle and booking.vehicle.owner == request.user) or (booking.property and booking.property.owner == request.user):
-        booking.status = 'canceled'
-        booking.save()
-
-        # Send real-time update
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            "booking_updates",
-            {
-                "type": "send_booking_update",
-                "booking_id": booking.id,
-                "status": "canceled",
-            }
-        )
+        bookings.cancel_booking(booking, actor=request.user)
 
         messages.success(request, "Booking canceled successfully.")
     return redirect('dashboard')
 
 
+# ✅ Confirm/Cancel Many Bookings at Once (Owner Only)
+@login_required
+@require_POST
+def bulk_booking_action(request):
+    action = request.POST.get('action')
+    try:
+        booking_ids = [int(booking_id) for booking_id in request.POST.getlist('booking_ids')]
+    except ValueError:
+        booking_ids = None
+    if action not in bookings.BULK_ACTIONS or not booking_ids:
+        messages.error(request, "Select some bookings and an action.")
+        return redirect('dashboard')
+
+    try:
+        result = bookings.bulk_set_status(request.user, booking_ids, action)
+    except BookingConflict as e:
+        messages.error(request, f"{e} Nothing was changed, please try again.")
+        return redirect('dashboard')
+
+    messages.success(request, f"{len(result['changed'])} booking(s) {bookings.BULK_ACTIONS[action]}.")
+    if result['declined']:
+        messages.info(request, f"{len(result['declined'])} overlapping pending request(s) declined.")
+    if result['conflicts']:
+        messages.error(request, f"{len(result['conflicts'])} booking(s) not confirmed: their dates are already booked.")
+    return redirect('dashboard')
+
+
 # ✅ User Cancels Their Own Booking
 @login_required
 def user_cancel_booking(request, booking_id):
     booking = get_object_or_404(Booking, id=booking_id)
 
     if booking.user == request.user:
-        booking.status = 'canceled'
-        booking.save()
+        bookings.cancel_booking(booking, actor=request.user)
         messages.success(request, "Your booking has been canceled.")
     else:
         messages.error(request, "You are not authorized to cancel this booking.")
@@ -287,6 +350,7 @@ def delete_listing(request, listing_type, listing_id):
 
     return redirect('listings')
 
+@cache_page_versioned(lambda request, listing_type, listing_id: [listing_scope(listing_type, listing_id)])
 def listing_detail(request, listing_type, listing_id):
     if listing_type == "vehicle":
         listing = get_object_or_404(Vehicle, id=listing_id)
@@ -298,49 +362,45 @@ def listing_detail(request, listing_type, listing_id):
         "listing_type": listing_type
     })
 
-@csrf_exempt
-def check_availability(request):
-    """API to check if a listing is available for the selected dates."""
+def listing_availability(request, listing_type, listing_id):
+    """
+    Merged confirmed booking ranges for a month window, in one cached query:
+    ?month=YYYY-MM (default: this month)&months=1..12
+    """
+    if listing_type not in LISTING_FIELDS:
+        return JsonResponse({'error': 'Invalid listing type'}, status=400)
     try:
-        listing_type = request.GET.get('listing_type')
-        listing_id = request.GET.get('listing_id')
-        start_date = request.GET.get('start_date')
-        end_date = request.GET.get('end_date')
-
-        print(f"Received request: listing_type={listing_type}, listing_id={listing_id}, start_date={start_date}, end_date={end_date}")
-
-        if not all([listing_type, listing_id, start_date, end_date]):
-            return JsonResponse({'error': 'Missing parameters'}, status=400)
-
-        start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-        end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-
-        if listing_type == 'vehicle':
-            listing = get_object_or_404(Vehicle, id=listing_id)
-        elif listing_type == 'property':
-            listing = get_object_or_404(Property, id=listing_id)
-        else:
-            return JsonResponse({'error': 'Invalid listing type'}, status=400)
-
-        overlapping_bookings = Booking.objects.filter(
-            start_date__lte=end_date,
-            end_date__gte=start_date,
-            status='confirmed'
-        )
-
-        if listing_type == 'vehicle':
-            overlapping_bookings = overlapping_bookings.filter(vehicle=listing)
-        else:
-            overlapping_bookings = overlapping_bookings.filter(property=listing)
-
-        print(f"Overlapping bookings count: {overlapping_bookings.count()}")
-
-        if overlapping_bookings.exists():
-            return JsonResponse({'available': False})
-        return JsonResponse({'available': True})
-
-    except Exception as e:
-        print(f"Error in check_availability: {e}")
-        return JsonResponse({'error': 'Server error'}, status=500)
+        month = datetime.strptime(request.GET['month'], "%Y-%m").date() if 'month' in request.GET else datetime.today().date()
+        months = max(1, min(int(request.GET.get('months', 1)), MAX_MONTHS))
+        start, end = month_window(month.year, month.month, months)
+    except ValueError:  # also a window running past year 9999
+        return JsonResponse({'error': 'Invalid month'}, status=400)
+
+    ranges = booked_ranges(listing_type, listing_id, start, end)
+    return JsonResponse({
+        'listing_type': listing_type,
+        'listing_id': listing_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'booked': [[s.isoformat(), e.isoformat()] for s, e in ranges],
+    })
 
 
+@csrf_exempt
+def check_availability(request):
+    """API to check if a listing is available for the selected dates (one range; see listing_availability)."""
+    listing_type = request.GET.get('listing_type')
+    listing_id = request.GET.get('listing_id')
+    if not all([listing_type, listing_id, request.GET.get('start_date'), request.GET.get('end_date')]):
+        return JsonResponse({'error': 'Missing parameters'}, status=400)
+    if listing_type not in LISTING_FIELDS:
+        return JsonResponse({'error': 'Invalid listing type'}, status=400)
+    try:
+        start_date = parse_date(request.GET['start_date'])
+        end_date = parse_date(request.GET['end_date'])
+        listing_id = int(listing_id)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid parameters'}, status=400)
+
+    get_object_or_404(LISTING_MODELS[listing_type], id=listing_id)
+    return JsonResponse({'available': is_range_free(listing_type, listing_id, start_date, end_date)})